@@ -0,0 +1,106 @@
+"""
+Load generator for the display-facing API.
+
+Compares the sync DRF endpoint served by gunicorn (core.wsgi) with the async
+endpoint served by daphne (core.asgi). Uses only the standard library, so it can
+run from any container on the compose network:
+
+    python benchmarks/display_api.py --token <display token> \
+        --url http://gunicorn:8000/api/displaylog/ \
+        --url http://daphne:8001/api/display/logs/ \
+        --concurrency 200 --duration 30
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from urllib.parse import urlsplit
+
+
+async def worker(url, headers, body, deadline, latencies, errors):
+    parts = urlsplit(url)
+    port = parts.port or (443 if parts.scheme == 'https' else 80)
+    request = (
+        f"POST {parts.path} HTTP/1.1\r\n"
+        f"Host: {parts.hostname}\r\n"
+        f"Content-Type: application/json\r\n"
+        f"Content-Length: {len(body)}\r\n"
+        + ''.join(f"{key}: {value}\r\n" for key, value in headers.items())
+        + "\r\n"
+    ).encode() + body
+
+    reader = writer = None
+    while time.monotonic() < deadline:
+        try:
+            if writer is None:
+                reader, writer = await asyncio.open_connection(parts.hostname, port, ssl=parts.scheme == 'https')
+
+            started = time.monotonic()
+            writer.write(request)
+            await writer.drain()
+
+            status_line = await reader.readline()
+            length = 0
+            keep_alive = True
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b''):
+                    break
+                name, _, value = line.decode('latin-1').partition(':')
+                if name.lower() == 'content-length':
+                    length = int(value)
+                elif name.lower() == 'connection' and value.strip().lower() == 'close':
+                    keep_alive = False
+            await reader.readexactly(length)
+
+            latencies.append(time.monotonic() - started)
+            if not status_line.split(b' ')[1].startswith(b'2'):
+                errors.append(status_line)
+            if not keep_alive:
+                writer.close()
+                writer = None
+        except (OSError, asyncio.IncompleteReadError, IndexError) as e:
+            errors.append(e)
+            if writer is not None:
+                writer.close()
+            writer = None
+
+    if writer is not None:
+        writer.close()
+
+
+async def run(url, token, concurrency, duration):
+    headers = {'Authorization': f'Token {token}'}
+    body = json.dumps({'type': 'INFO', 'message': 'benchmark'}).encode()
+    latencies, errors = [], []
+    deadline = time.monotonic() + duration
+
+    await asyncio.gather(*(
+        worker(url, headers, body, deadline, latencies, errors) for _ in range(concurrency)
+    ))
+
+    latencies.sort()
+    p99 = latencies[int(len(latencies) * 0.99) - 1] if latencies else 0
+    print(
+        f"{url}\n"
+        f"  requests: {len(latencies)}  errors: {len(errors)}\n"
+        f"  req/s: {len(latencies) / duration:.1f}\n"
+        f"  latency p50: {statistics.median(latencies or [0]) * 1000:.1f} ms  p99: {p99 * 1000:.1f} ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', action='append', required=True, help="Endpoint to benchmark (repeatable).")
+    parser.add_argument('--token', required=True, help="A DisplayToken key.")
+    parser.add_argument('--concurrency', type=int, default=100)
+    parser.add_argument('--duration', type=float, default=20)
+    args = parser.parse_args()
+
+    for url in args.url:
+        asyncio.run(run(url, args.token, args.concurrency, args.duration))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+"""
+CPU cost of fanning one display update out to many websocket subscribers on a node.
+
+Compares the former path, where every consumer ran ``json.dumps`` on the event,
+with the encode-once path of ``main.broadcast.broadcast_revision``, where the full
+``display_update`` and the ``display_patch`` frames are encoded once per format and
+consumers forward one of them. Runs without Django:
+
+    python benchmarks/ws_fanout.py --subscribers 10000 --tickers 5 --items 20
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from websocket.encoding import FORMATS, encode  # noqa: E402
+
+
+def build_payload(tickers, items):
+    content = "<p><strong>Breaking:</strong> " + "Lorem ipsum dolor sit amet, consectetur adipiscing elit. " * 4 + "</p>"
+    return {
+        "is_active": True,
+        "updated_at": "2025-01-01T00:00:00Z",
+        "name": "Lobby screen",
+        "slug": "lobby-screen",
+        "current_video": "https://example.com/hls/vod/0123456789abcdef/index.m3u8",
+        "video_duration": 93.5,
+        "loop": True,
+        "paused": False,
+        "playback_mode": "HLS",
+        "tickers": [
+            {
+                "id": ticker,
+                "start_time": None,
+                "end_time": None,
+                "items": [
+                    {"id": ticker * 1000 + item, "content": content, "order": item, "ticker": ticker}
+                    for item in range(items)
+                ],
+            }
+            for ticker in range(tickers)
+        ],
+    }
+
+
+def measure(label, subscribers, send):
+    started = time.process_time()
+    sent = 0
+    for index in range(subscribers):
+        sent += len(send(index))
+    elapsed = time.process_time() - started
+    print(f"  {label:<28} cpu: {elapsed * 1000:9.1f} ms  egress: {sent / 1024 / 1024:9.1f} MiB")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--subscribers', type=int, default=10000)
+    parser.add_argument('--tickers', type=int, default=5)
+    parser.add_argument('--items', type=int, default=20)
+    args = parser.parse_args()
+
+    payload = build_payload(args.tickers, args.items)
+    event = {"type": "display.update", "data": payload}
+    patch = json.dumps({
+        "action": "display_patch", "revision": 2, "base": 1,
+        "patch": [{"op": "replace", "path": "/paused", "value": True}],
+    })
+    full = json.dumps({"action": "display_update", "revision": 2, "message": payload})
+
+    print(f"{args.subscribers} subscribers, payload {len(full) / 1024:.1f} KiB")
+
+    baseline = measure(
+        "json.dumps per consumer", args.subscribers,
+        lambda index: json.dumps({"action": "display_update", "message": event["data"]}),
+    )
+
+    for label, message in (("full", full), ("patch", patch)):
+        for format in FORMATS:
+            started = time.process_time()
+            frame = encode(message, format)
+            encoding = time.process_time() - started
+            elapsed = measure(f"{label} {format}", args.subscribers, lambda index: frame) + encoding
+            print(f"  {'':<28} speedup: {baseline / max(elapsed, 1e-9):9.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,186 @@
+"""
+Load test harness for the display websocket gateway.
+
+Opens many sockets at a given ramp rate (stdlib-only websocket client), asks each
+one for its display data and then pings periodically. Reports connect latency,
+refusals (close 1013 from admission control), pong round trips and received
+frames, e.g. against nginx with several daphne nodes behind it:
+
+    python benchmarks/ws_load.py --url ws://nginx/ws/display/ \
+        --key <stream key> --key <stream key> \
+        --connections 20000 --ramp 2000 --duration 120
+"""
+import argparse
+import asyncio
+import base64
+import json
+import os
+import random
+import statistics
+import struct
+import time
+from urllib.parse import urlsplit
+
+OPCODE_TEXT = 0x1
+OPCODE_CLOSE = 0x8
+OPCODE_PING = 0x9
+OPCODE_PONG = 0xA
+
+
+class Stats:
+    def __init__(self):
+        self.connect_latencies = []
+        self.pong_latencies = []
+        self.frames = 0
+        self.refused = 0
+        self.errors = 0
+        self.open = 0
+        self.peak_open = 0
+
+
+async def handshake(url):
+    parts = urlsplit(url)
+    port = parts.port or (443 if parts.scheme == 'wss' else 80)
+    reader, writer = await asyncio.open_connection(parts.hostname, port, ssl=parts.scheme == 'wss')
+    path = parts.path + (f"?{parts.query}" if parts.query else '')
+    writer.write((
+        f"GET {path} HTTP/1.1\r\n"
+        f"Host: {parts.hostname}\r\n"
+        "Upgrade: websocket\r\n"
+        "Connection: Upgrade\r\n"
+        f"Sec-WebSocket-Key: {base64.b64encode(os.urandom(16)).decode()}\r\n"
+        "Sec-WebSocket-Version: 13\r\n"
+        "\r\n"
+    ).encode())
+    await writer.drain()
+
+    status_line = await reader.readline()
+    while (await reader.readline()) not in (b'\r\n', b''):
+        pass
+    if b' 101 ' not in status_line:
+        writer.close()
+        raise ConnectionError(status_line.decode().strip())
+    return reader, writer
+
+
+def build_frame(opcode, payload):
+    mask = os.urandom(4)
+    header = bytes([0x80 | opcode])
+    length = len(payload)
+    if length < 126:
+        header += bytes([0x80 | length])
+    elif length < 65536:
+        header += bytes([0x80 | 126]) + struct.pack('!H', length)
+    else:
+        header += bytes([0x80 | 127]) + struct.pack('!Q', length)
+    return header + mask + bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+
+
+async def read_frame(reader):
+    first, second = await reader.readexactly(2)
+    length = second & 0x7F
+    if length == 126:
+        length = struct.unpack('!H', await reader.readexactly(2))[0]
+    elif length == 127:
+        length = struct.unpack('!Q', await reader.readexactly(8))[0]
+    return first & 0x0F, await reader.readexactly(length)
+
+
+async def client(url, ping_interval, deadline, stats):
+    started = time.monotonic()
+    try:
+        reader, writer = await handshake(url)
+    except (OSError, ConnectionError):
+        stats.errors += 1
+        return
+    stats.connect_latencies.append(time.monotonic() - started)
+    stats.open += 1
+    stats.peak_open = max(stats.peak_open, stats.open)
+
+    def send(message):
+        writer.write(build_frame(OPCODE_TEXT, json.dumps(message).encode()))
+
+    pings = []
+
+    async def pinger():
+        await asyncio.sleep(random.uniform(0, ping_interval))
+        while True:
+            pings.append(time.monotonic())
+            send({"action": "ping", "version": "ws_load"})
+            await asyncio.sleep(ping_interval)
+
+    async def receiver():
+        while True:
+            opcode, payload = await read_frame(reader)
+            if opcode == OPCODE_CLOSE:
+                code = struct.unpack('!H', payload[:2])[0] if len(payload) >= 2 else None
+                if code == 1013:
+                    stats.refused += 1
+                return
+            if opcode == OPCODE_PING:
+                writer.write(build_frame(OPCODE_PONG, payload))
+                continue
+
+            stats.frames += 1
+            if opcode == OPCODE_TEXT and pings and b'"pong"' in payload:
+                stats.pong_latencies.append(time.monotonic() - pings.pop(0))
+
+    send({"action": "get_display_data"})
+    tasks = [asyncio.create_task(pinger()), asyncio.create_task(receiver())]
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=max(deadline - time.monotonic(), 0), return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            if task.exception() is not None:
+                stats.errors += 1
+    finally:
+        for task in tasks:
+            task.cancel()
+        stats.open -= 1
+        writer.close()
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+async def run(args):
+    stats = Stats()
+    deadline = time.monotonic() + args.duration
+    tasks = []
+
+    for index in range(args.connections):
+        key = args.key[index % len(args.key)]
+        tasks.append(asyncio.create_task(client(f"{args.url}?key={key}", args.ping_interval, deadline, stats)))
+        await asyncio.sleep(1 / args.ramp)
+        if index % args.ramp == 0:
+            print(f"  t={args.duration - (deadline - time.monotonic()):6.1f}s  open: {stats.open}  refused: {stats.refused}")
+
+    await asyncio.gather(*tasks)
+
+    print(
+        f"connections: {args.connections}  peak open: {stats.peak_open}  "
+        f"refused (1013): {stats.refused}  errors: {stats.errors}\n"
+        f"connect p50: {statistics.median(stats.connect_latencies or [0]) * 1000:.1f} ms  "
+        f"p99: {percentile(stats.connect_latencies, 0.99) * 1000:.1f} ms\n"
+        f"pong p50: {statistics.median(stats.pong_latencies or [0]) * 1000:.1f} ms  "
+        f"p99: {percentile(stats.pong_latencies, 0.99) * 1000:.1f} ms\n"
+        f"frames received: {stats.frames}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', required=True, help="Websocket URL, e.g. ws://nginx/ws/display/")
+    parser.add_argument('--key', action='append', required=True, help="Display stream key (repeatable).")
+    parser.add_argument('--connections', type=int, default=1000)
+    parser.add_argument('--ramp', type=int, default=500, help="New connections per second.")
+    parser.add_argument('--ping-interval', type=float, default=30)
+    parser.add_argument('--duration', type=float, default=60)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    main()
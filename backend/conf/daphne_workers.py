@@ -0,0 +1,52 @@
+"""
+Runs ``DAPHNE_WORKERS`` daphne processes in one container.
+
+daphne serves from a single event loop, so a node with several cores runs
+several processes. They accept from one listening socket bound here and passed
+with ``--fd``; the kernel spreads connections between them. When any worker
+exits, the others are stopped too so the container restarts as a whole.
+
+Usage: ``python conf/daphne_workers.py`` (see ``docker-compose.yml``).
+"""
+import os
+import signal
+import socket
+import subprocess
+import sys
+
+APPLICATION = "core.asgi:application"
+
+
+def main():
+    workers = int(os.environ.get("DAPHNE_WORKERS", os.cpu_count() or 1))
+    port = int(os.environ.get("DAPHNE_PORT", 8001))
+
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listener.bind(("0.0.0.0", port))
+    listener.listen(socket.SOMAXCONN)
+    fd = listener.fileno()
+
+    processes = [
+        subprocess.Popen(["daphne", "--fd", str(fd), APPLICATION], pass_fds=[fd])
+        for _ in range(max(workers, 1))
+    ]
+    print(f"Started {len(processes)} daphne workers on port {port}.", flush=True)
+
+    def stop(*args):
+        for process in processes:
+            if process.poll() is None:
+                process.terminate()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    pid, status = os.wait()
+    stop()
+    for process in processes:
+        process.wait()
+    sys.exit(os.waitstatus_to_exitcode(status) if pid else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,4 @@
+import hashlib
 import os
 from django.db import models
 from django.utils.deconstruct import deconstructible
@@ -28,3 +29,28 @@ class UploadPath:
         _, extension = os.path.splitext(filename)
         extension = extension.lstrip('.')  # Remove the leading dot if present
         return f"{self.folder}/{self.sub_path}/{timestamp}.{extension}"
+
+
+@deconstructible
+class ContentAddressedUploadPath:
+    """
+    Names uploads after the SHA-256 of their content, so identical files share one path.
+
+    :param field_name: The file field on the instance whose pending upload is hashed.
+    """
+
+    def __init__(self, folder, sub_path, field_name):
+        self.folder = folder
+        self.sub_path = sub_path
+        self.field_name = field_name
+
+    def __call__(self, instance, filename):
+        content = getattr(instance, self.field_name).file
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        content.seek(0)
+
+        sha256 = digest.hexdigest()
+        _, extension = os.path.splitext(filename)
+        return f"{self.folder}/{self.sub_path}/{sha256[:2]}/{sha256}{extension.lower()}"
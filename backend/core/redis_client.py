@@ -0,0 +1,28 @@
+import redis
+import redis.asyncio
+from django.conf import settings
+
+_client = None
+_async_client = None
+
+
+def get_redis():
+    """
+    Returns a process-wide Redis client for ``settings.REDIS_HOST``.
+
+    The client keeps its own connection pool, so it is safe to share between threads.
+    """
+    global _client
+    if _client is None:
+        _client = redis.Redis.from_url(settings.REDIS_HOST)
+    return _client
+
+
+def get_async_redis():
+    """
+    Returns a process-wide asyncio Redis client, for use from the ASGI event loop only.
+    """
+    global _async_client
+    if _async_client is None:
+        _async_client = redis.asyncio.Redis.from_url(settings.REDIS_HOST)
+    return _async_client
@@ -118,6 +118,10 @@ else:
         }
     }
 
+# Migrations are generated per deployment and not committed, so the test database is
+# created straight from the models.
+DATABASES['default']['TEST'] = {'MIGRATE': False}
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -192,13 +196,48 @@ REST_FRAMEWORK = {
 
 }
 
+REDIS_HOST = env('REDIS_HOST', default='redis://localhost:6379/1')
+
+# Display token cache
+DISPLAY_TOKEN_CACHE_SIZE = env.int("DISPLAY_TOKEN_CACHE_SIZE", default=10000)
+DISPLAY_TOKEN_LOCAL_TTL = env.int("DISPLAY_TOKEN_LOCAL_TTL", default=30)
+DISPLAY_TOKEN_CACHE_TIMEOUT = env.int("DISPLAY_TOKEN_CACHE_TIMEOUT", default=3600)
+
+# Display payload cache
+DISPLAY_PAYLOAD_CACHE_TIMEOUT = env.int("DISPLAY_PAYLOAD_CACHE_TIMEOUT", default=3600)
+DISPLAY_BROADCAST_DEBOUNCE = env.float("DISPLAY_BROADCAST_DEBOUNCE", default=0.5)
+DISPLAY_SNAPSHOT_TIMEOUT = env.int("DISPLAY_SNAPSHOT_TIMEOUT", default=600)
+
+# Display websocket gateway
+DISPLAY_REF_CACHE_TIMEOUT = env.int("DISPLAY_REF_CACHE_TIMEOUT", default=3600)
+DISPLAY_REF_MISS_TIMEOUT = env.int("DISPLAY_REF_MISS_TIMEOUT", default=60)
+WS_ACCEPT_RATE = env.float("WS_ACCEPT_RATE", default=200)
+WS_ACCEPT_BURST = env.int("WS_ACCEPT_BURST", default=400)
+WS_RECONNECT_MIN = env.float("WS_RECONNECT_MIN", default=1)
+WS_RECONNECT_MAX = env.float("WS_RECONNECT_MAX", default=30)
+
+# Ticker scheduler
+TICKER_SCHEDULER_CHANNEL = env("TICKER_SCHEDULER_CHANNEL", default="ticker_scheduler")
+TICKER_SCHEDULER_HORIZON = env.int("TICKER_SCHEDULER_HORIZON", default=24 * 60 * 60)
+
+# Display presence
+PRESENCE_TIMEOUT = env.int("PRESENCE_TIMEOUT", default=90)
+PRESENCE_RETENTION = env.int("PRESENCE_RETENTION", default=7 * 24 * 60 * 60)
+
+# Channel layer: channels_redis shards channels and groups over the hosts by crc32(name) % 4096
+# split into equal ranges, so changing the list remaps most groups; every process must be restarted
+# with the new list at once.
+CHANNEL_LAYER_HOSTS = env.list('CHANNEL_LAYER_HOSTS', default=[REDIS_HOST])
+
 CHANNEL_LAYERS = {
     'default': {
         'BACKEND': 'channels_redis.core.RedisChannelLayer',
         'CONFIG': {
-            "hosts": [(env('REDIS_HOST', default='localhost'))],
-            "capacity": 1000,  # 🔹 Increase buffer size to allow more messages
-            "expiry": 10,  # 🔹 Reduce expiry to clear old messages faster
+            "hosts": CHANNEL_LAYER_HOSTS,
+            "capacity": env.int('CHANNEL_LAYER_CAPACITY', default=1000),  # 🔹 Increase buffer size to allow more messages
+            "expiry": env.int('CHANNEL_LAYER_EXPIRY', default=10),  # 🔹 Reduce expiry to clear old messages faster
+            # Screens stay connected for days; group membership must outlive the socket.
+            "group_expiry": env.int('CHANNEL_LAYER_GROUP_EXPIRY', default=7 * 24 * 60 * 60),
         },
     },
 }
@@ -214,23 +253,18 @@ FRONTEND_DOMAIN = env("FRONTEND_DOMAIN", default="http://127.0.0.1:8000")
 
 CORS_ALLOWED_ORIGINS = [SERVER_DOMAIN, FRONTEND_DOMAIN]
 
-if not DEBUG:
-    CACHES = {
-        'default': {
-            # 'BACKEND': 'django.core.cache.backends.memcached.PyMemcacheCache',
-            "BACKEND": "django.core.cache.backends.redis.RedisCache",
-            # 'LOCATION': env('MEMCACHE_HOST', default='127.0.0.1:11211'),
-            'LOCATION': env("REDIS_HOST"),  # Use the REDIS_HOST environment variable
-        }
-
+# Always Redis, also with DEBUG: debounce keys, payload versions and snapshot revisions
+# (main.broadcast, websocket.payloads) must be shared by every daphne/gunicorn/celery process.
+CACHES = {
+    'default': {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        'LOCATION': REDIS_HOST,
     }
+}
+
+if not DEBUG:
     EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
 else:
-    CACHES = {
-        'default': {
-            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-        }
-    }
     EMAIL_BACKEND = "django.core.mail.backends.console.EmailBackend"
 
 EMAIL_HOST = env("EMAIL_HOST", default="")
@@ -257,10 +291,91 @@ CELERY_TASK_RETRY = True
 CELERY_TASK_DEFAULT_RETRY_DELAY = 60
 CELERY_TASK_MAX_RETRIES = 3
 CELERY_TIMEZONE = 'UTC'
+# Buffered display log ingestion (main.log_buffer)
+DISPLAY_LOG_BUFFER_MAX = env.int("DISPLAY_LOG_BUFFER_MAX", default=200000)
+DISPLAY_LOG_BULK_MAX = env.int("DISPLAY_LOG_BULK_MAX", default=500)
+DISPLAY_LOG_FLUSH_BATCH_SIZE = env.int("DISPLAY_LOG_FLUSH_BATCH_SIZE", default=1000)
+DISPLAY_LOG_FLUSH_INTERVAL = env.float("DISPLAY_LOG_FLUSH_INTERVAL", default=2.0)
+DISPLAY_LOG_RETRY_AFTER = env.int("DISPLAY_LOG_RETRY_AFTER", default=30)
+DISPLAY_LOG_RETENTION_DAYS = env.int("DISPLAY_LOG_RETENTION_DAYS", default=30)
+DISPLAY_LOG_PARTITION_PREMAKE_DAYS = env.int("DISPLAY_LOG_PARTITION_PREMAKE_DAYS", default=7)
+DISPLAY_LOG_ROLLUP_INTERVAL = env.int("DISPLAY_LOG_ROLLUP_INTERVAL", default=300)
+DISPLAY_LOG_ROLLUP_HOURS = env.int("DISPLAY_LOG_ROLLUP_HOURS", default=2)
+
+# Playlist playout (main.playout): concat lists shared with the stream supervisor through the media volume
+PLAYOUT_ROOT = env("PLAYOUT_ROOT", default=str(MEDIA_ROOT / "playout"))
+PLAYOUT_REFRESH_INTERVAL = env.int("PLAYOUT_REFRESH_INTERVAL", default=60)
+
 CELERY_BEAT_SCHEDULE = {
     # Example: 'task_name': {'task': 'task_path', 'schedule': 'interval_or_cron'}
+    'flush-display-logs': {
+        'task': 'main.tasks.flush_display_logs',
+        'schedule': DISPLAY_LOG_FLUSH_INTERVAL,
+    },
+    'rollup-display-logs': {
+        'task': 'main.tasks.rollup_display_logs',
+        'schedule': DISPLAY_LOG_ROLLUP_INTERVAL,
+    },
+    'refresh-playouts': {
+        'task': 'main.tasks.refresh_playouts',
+        'schedule': PLAYOUT_REFRESH_INTERVAL,
+    },
+    'maintain-display-log-partitions': {
+        'task': 'main.tasks.maintain_display_log_partitions',
+        'schedule': 6 * 60 * 60,
+    },
+    'expire-video-uploads': {
+        'task': 'main.tasks.expire_video_uploads',
+        'schedule': 60 * 60,
+    },
 }
 
+# Streaming
+STREAM_SUPERVISOR_CHANNEL = env("STREAM_SUPERVISOR_CHANNEL", default="stream_supervisor")
+# Encode capacity (main.stream_scheduler): cores per supervisor node (default: all of them),
+# cores used by one encode (also passed to ffmpeg -threads) and by one remux
+STREAM_NODE_CAPACITY = env.float("STREAM_NODE_CAPACITY", default=None)
+STREAM_ENCODER_THREADS = env.int("STREAM_ENCODER_THREADS", default=2)
+STREAM_COPY_COST = env.float("STREAM_COPY_COST", default=0.25)
+STREAM_NODE_TTL = env.int("STREAM_NODE_TTL", default=15)
+STREAM_QUEUE_WHEN_FULL = env.bool("STREAM_QUEUE_WHEN_FULL", default=True)
+# ffmpeg progress telemetry (main.stream_telemetry): samples kept per stream, seconds between
+# Redis updates, and the bearer token Prometheus scrapes api/streams/metrics/ with (staff sessions always can)
+STREAM_TELEMETRY_SAMPLES = env.int("STREAM_TELEMETRY_SAMPLES", default=120)
+STREAM_TELEMETRY_INTERVAL = env.int("STREAM_TELEMETRY_INTERVAL", default=5)
+METRICS_TOKEN = env("METRICS_TOKEN", default="")
+# Encoder crash/stall recovery (main.supervisor): seconds without progress before an encoder is
+# killed, restart backoff bounds, restarts in a row before giving up, and uptime that resets the count
+STREAM_STALL_TIMEOUT = env.int("STREAM_STALL_TIMEOUT", default=30)
+STREAM_RESTART_BACKOFF_MIN = env.float("STREAM_RESTART_BACKOFF_MIN", default=2)
+STREAM_RESTART_BACKOFF_MAX = env.float("STREAM_RESTART_BACKOFF_MAX", default=120)
+STREAM_MAX_RESTARTS = env.int("STREAM_MAX_RESTARTS", default=5)
+STREAM_RESTART_RESET = env.int("STREAM_RESTART_RESET", default=300)
+# Keyframe interval (seconds) of the normalized playback rendition
+STREAM_GOP_SECONDS = env.int("STREAM_GOP_SECONDS", default=2)
+
+# Pre-segmented HLS playback, served by nginx from HLS_ROOT under HLS_URL
+HLS_ROOT = env("HLS_ROOT", default="/opt/data/hls")
+HLS_URL = env("HLS_URL", default=f"{SERVER_DOMAIN}/hls/")
+HLS_SEGMENT_SECONDS = env.int("HLS_SEGMENT_SECONDS", default=6)
+HLS_LIVE_WINDOW = env.int("HLS_LIVE_WINDOW", default=3)
+
+# Resumable chunked uploads (main.uploads); partial files stay outside MEDIA_ROOT so nginx never
+# serves them, incomplete uploads expire after VIDEO_UPLOAD_EXPIRY idle seconds, and a chunk
+# reserves its upload for at most VIDEO_UPLOAD_LOCK_TIMEOUT seconds
+VIDEO_UPLOAD_TEMP_DIR = env("VIDEO_UPLOAD_TEMP_DIR", default=str(BASE_DIR / "uploads" / "partial"))
+VIDEO_UPLOAD_EXPIRY = env.int("VIDEO_UPLOAD_EXPIRY", default=24 * 60 * 60)
+VIDEO_UPLOAD_LOCK_TIMEOUT = env.int("VIDEO_UPLOAD_LOCK_TIMEOUT", default=10 * 60)
+VIDEO_UPLOAD_MAX_SIZE = env.int("VIDEO_UPLOAD_MAX_SIZE", default=2048 * 1024 * 1024)
+VIDEO_UPLOAD_CHUNK_MAX_SIZE = env.int("VIDEO_UPLOAD_CHUNK_MAX_SIZE", default=64 * 1024 * 1024)
+
+# Rungs built for displays with adaptive bitrate enabled (Display.abr_enabled / Place.abr_enabled)
+VIDEO_RENDITION_LADDER = [
+    {"name": "1080p", "height": 1080, "video_bitrate": "5000k"},
+    {"name": "720p", "height": 720, "video_bitrate": "2800k"},
+    {"name": "480p", "height": 480, "video_bitrate": "1200k"},
+]
+
 CKEDITOR_5_CONFIGS = BASE_CKEDITOR_5_CONFIGS
 
 LOGGING = {
@@ -0,0 +1,29 @@
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+
+class AlreadyStored(FileExistsError):
+    pass
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    File system storage for content-addressed names (see ``core.models.ContentAddressedUploadPath``).
+
+    A name that already exists holds the same bytes, so it is reused instead of
+    being written again under a suffixed name.
+    """
+
+    def get_available_name(self, name, max_length=None):
+        # Also called by ``FileSystemStorage._save`` when a concurrent upload of the same
+        # bytes created the file first; returning ``name`` there would retry forever.
+        if self.exists(name):
+            raise AlreadyStored(name)
+        return name
+
+    def save(self, name, content, max_length=None):
+        try:
+            return super().save(name, content, max_length=max_length)
+        except AlreadyStored as e:
+            return str(e).replace("\\", "/")
@@ -1,8 +1,21 @@
-from django.contrib import admin
-from nested_admin import NestedModelAdmin, NestedStackedInline
-
-from .models import Place, Display, DisplayLog, DisplayToken, Ticker, TickerItem
+from celery import group
+from celery.result import GroupResult
+from django.contrib import admin, messages
+from django.db import transaction
+from django.db.models import Q
+from django.http import Http404, HttpResponseRedirect
+from django.template.response import TemplateResponse
+from django.urls import path, reverse
+from django.utils import timezone
+from django.utils.html import format_html
+from nested_admin import NestedModelAdmin, NestedStackedInline, NestedTabularInline
+
+from .models import Place, MediaAsset, Display, VideoUpload, PlaylistItem, DisplayLog, DisplayLogHourlyCount, DisplayToken, Ticker, TickerItem
+from .broadcast import queue_display_updates
 from .forms import TickerItemForm
+from .stream_scheduler import QUEUED
+from .stream_telemetry import get_telemetry
+from .tasks import start_display_stream, stop_display_stream, update_video_duration
 
 class TicketItemInline(NestedStackedInline):
     model = TickerItem
@@ -16,97 +29,215 @@ class TicketNestedInline(NestedStackedInline):
     inlines = [TicketItemInline]
 
 
+class PlaylistItemInline(NestedTabularInline):
+    model = PlaylistItem
+    extra = 0
+    raw_id_fields = ['media_asset']
+    fields = ['order', 'media_asset', 'days', 'start_time', 'end_time', 'is_active']
+
+
 @admin.register(Place)
 class PlaceAdmin(admin.ModelAdmin):
-    list_display = ['id', 'name', 'owner', 'is_active',
+    list_display = ['id', 'name', 'owner', 'abr_enabled', 'is_active',
                     'updated_at', 'created_at']
-    list_filter = ['is_active', 'updated_at', 'created_at']
+    list_filter = ['abr_enabled', 'is_active', 'updated_at', 'created_at']
     search_fields = ['owner__username', 'name']
 
 
+@admin.register(MediaAsset)
+class MediaAssetAdmin(admin.ModelAdmin):
+    list_display = ['id', 'sha256', 'duration', 'playback_file', 'is_active',
+                    'updated_at', 'created_at']
+    list_filter = ['is_active', 'updated_at', 'created_at']
+    readonly_fields = ['sha256', 'file', 'duration', 'metadata', 'playback_file',
+                       'hls_segments', 'abr_renditions', 'created_at', 'updated_at']
+    search_fields = ['sha256', 'file']
+
+
 @admin.register(Display)
 class DisplayAdmin(NestedModelAdmin, admin.ModelAdmin):
     list_display = ['id', 'name', 'place', 'current_video',
-                    'video_duration', 'loop', 'paused',
+                    'video_duration', 'loop', 'paused', 'playback_mode',
                     'is_active', 'updated_at', 'created_at']
-    list_filter = ['loop', 'paused', 'is_active',
+    list_filter = ['loop', 'paused', 'playback_mode', 'is_active',
                    'updated_at', 'created_at']
 
-    readonly_fields = ['task_id', 'stream_key', 'created_at', 'updated_at']
+    readonly_fields = ['task_id', 'stream_telemetry', 'stream_key', 'media_asset', 'stream_started_at',
+                       'created_at', 'updated_at']
 
     search_fields = ['name', 'place__name']
-    inlines = [TicketNestedInline]
+    inlines = [PlaylistItemInline, TicketNestedInline]
+
+    @admin.display(description="Stream telemetry")
+    def stream_telemetry(self, obj):
+        """
+        Latest ffmpeg progress published by the stream supervisor (see main.stream_telemetry).
+        """
+        telemetry = get_telemetry(obj.stream_key) if obj.pk else None
+        if not telemetry:
+            return "-"
+        return format_html(
+            "{} fps (avg {}), {} kbit/s, {}x speed (avg {}), {} dropped / {} duplicated frames, "
+            "{} restarts &middot; {} &middot; {}s ago",
+            telemetry.get('fps', '-'),
+            telemetry.get('avg_fps', '-'),
+            telemetry.get('bitrate', '-'),
+            telemetry.get('speed', '-'),
+            telemetry.get('avg_speed', '-'),
+            int(telemetry.get('drop_frames') or 0),
+            int(telemetry.get('dup_frames') or 0),
+            int(telemetry.get('restarts') or 0),
+            telemetry.get('node', ''),
+            int(timezone.now().timestamp() - telemetry.get('updated_at', 0)),
+        )
 
     actions = ['set_video_duration_action', 'start_streaming_action', 'stop_streaming_action']
 
+    def get_urls(self):
+        return [
+            path(
+                'bulk-progress/<str:group_id>/',
+                self.admin_site.admin_view(self.bulk_progress_view),
+                name='main_display_bulk_progress',
+            ),
+        ] + super().get_urls()
+
+    def dispatch_bulk_action(self, request, title, signatures):
+        """
+        Runs the per-display work as one Celery group and redirects to its progress page.
+        """
+        result = group(signatures).apply_async()
+        result.save()
+        request.session[f"bulk_action_{result.id}"] = title
+        return HttpResponseRedirect(reverse('admin:main_display_bulk_progress', args=[result.id]))
+
+    def bulk_progress_view(self, request, group_id):
+        result = GroupResult.restore(group_id)
+        if result is None:
+            raise Http404("Unknown or expired bulk action.")
+
+        tasks = [
+            {
+                'state': task.state,
+                'message': str(task.result) if task.ready() else '',
+            }
+            for task in result.results
+        ]
+        context = {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'title': request.session.get(f"bulk_action_{group_id}", "Bulk action"),
+            'tasks': tasks,
+            'total': len(tasks),
+            'completed': result.completed_count(),
+            'failed': sum(1 for task in tasks if task['state'] == 'FAILURE'),
+            'finished': result.ready(),
+        }
+        return TemplateResponse(request, 'admin/main/display/bulk_progress.html', context)
+
     def set_video_duration_action(self, request, queryset):
         """
         Action to Set Video Duration for selected displays.
         """
-        for display in queryset:
-            try:
-                display.set_video_duration()
-            except Exception as e:
-                self.message_user(
-                    request,
-                    f"Error on setting video duration for {display.name}: {str(e)}",
-                    level='error'
-                )
-            else:
-                self.message_user(
-                    request,
-                    f"Video duration did set for {display.name} successfully."
-                )
+        display_ids = list(queryset.values_list('id', flat=True))
+        return self.dispatch_bulk_action(
+            request,
+            "Set video duration",
+            [update_video_duration.s(display_id) for display_id in display_ids],
+        )
 
     def start_streaming_action(self, request, queryset):
         """
         Action to start streaming for selected displays.
         """
-        for display in queryset:
-            try:
-                display.start_streaming()
-            except Exception as e:
-                self.message_user(
-                    request,
-                    f"Error starting stream for {display.name}: {str(e)}",
-                    level='error'
-                )
-            else:
-                self.message_user(
-                    request,
-                    f"Started stream for {display.name} successfully."
-                )
+        hls = queryset.filter(playback_mode=Display.PlaybackModeChoices.HLS).select_related('media_asset')
+        rtmp = queryset.exclude(playback_mode=Display.PlaybackModeChoices.HLS)
+
+        # Same checks as Display.start_streaming: HLS needs its segments, RTMP a video or playlist.
+        hls_ids = [display.id for display in hls if display.has_hls_playlist]
+        rtmp_ids = list(
+            rtmp.filter(
+                (Q(current_video__isnull=False) & ~Q(current_video='')) | Q(playlist_items__is_active=True)
+            ).values_list('id', flat=True).distinct()
+        )
+        skipped = queryset.count() - len(hls_ids) - len(rtmp_ids)
+        if skipped:
+            self.message_user(
+                request,
+                f"{skipped} display(s) skipped: no video or playlist, or HLS segments not ready yet.",
+                messages.WARNING,
+            )
+
+        # RTMP displays are unpaused by their task, once a supervisor took them.
+        Display.objects.filter(id__in=hls_ids).update(paused=False, stream_started_at=timezone.now())
+        transaction.on_commit(lambda: queue_display_updates(hls_ids))
+
+        return self.dispatch_bulk_action(
+            request,
+            "Start streaming",
+            [start_display_stream.s(display_id) for display_id in rtmp_ids],
+        )
 
     def stop_streaming_action(self, request, queryset):
         """
         Action to stop streaming for selected displays.
         """
-        for display in queryset:
-            try:
-                display.pause_streaming()
-            except Exception as e:
-                self.message_user(
-                    request,
-                    f"Error stopping stream for {display.name}: {str(e)}",
-                    level='error'
-                )
-            else:
-                self.message_user(
-                    request,
-                    f"Stopped stream for {display.name} successfully."
-                )
+        display_ids = list(queryset.values_list('id', flat=True))
+        # Only RTMP displays held or queued by a supervisor have an ffmpeg process to stop.
+        stream_keys = list(
+            queryset.exclude(playback_mode=Display.PlaybackModeChoices.HLS)
+            .exclude(task_id__isnull=True).exclude(task_id='')
+            .values_list('stream_key', flat=True)
+        )
+        queryset.update(paused=True)
+        queryset.filter(task_id=QUEUED).update(task_id="")
+        transaction.on_commit(lambda: queue_display_updates(display_ids))
+
+        if not stream_keys:
+            self.message_user(request, f"{len(display_ids)} display(s) stopped.", messages.SUCCESS)
+            return None
+
+        return self.dispatch_bulk_action(
+            request,
+            "Stop streaming",
+            [stop_display_stream.s(str(stream_key)) for stream_key in stream_keys],
+        )
 
     set_video_duration_action.short_description = "Set Video Duration for selected displays."
     stop_streaming_action.short_description = "Stop streaming for selected displays"
     start_streaming_action.short_description = "Start streaming for selected displays"
 
 
+@admin.register(VideoUpload)
+class VideoUploadAdmin(admin.ModelAdmin):
+    list_display = ['id', 'display', 'filename', 'size', 'offset', 'completed_at',
+                    'created_by', 'created_at']
+    list_filter = ['completed_at', 'created_at']
+    readonly_fields = ['id', 'display', 'created_by', 'filename', 'size', 'offset',
+                       'sha256', 'completed_at', 'created_at', 'updated_at']
+    search_fields = ['filename', 'sha256', 'display__name']
+
+
 @admin.register(DisplayLog)
 class DisplayLogAdmin(admin.ModelAdmin):
     list_display = ["id", "display", "type", "created_at", "updated_at"]
     list_filter = ["type", "created_at", "updated_at"]
 
     search_fields = ["display__name", "display__stream_key", "display__id"]
+    list_select_related = ["display"]
+    show_full_result_count = False
+
+
+@admin.register(DisplayLogHourlyCount)
+class DisplayLogHourlyCountAdmin(admin.ModelAdmin):
+    list_display = ["display", "type", "hour", "count"]
+    list_filter = ["type", "hour"]
+    list_select_related = ["display"]
+    search_fields = ["display__name", "display__id"]
+    readonly_fields = ["display", "type", "hour", "count", "created_at", "updated_at"]
+
+    def has_add_permission(self, request):
+        return False
 
 
 @admin.register(DisplayToken)
@@ -0,0 +1,166 @@
+"""
+Display-facing endpoints served as native async views by ``core.asgi`` (daphne).
+
+Thousands of devices post logs and heartbeats; a slow query here only parks a
+coroutine instead of blocking a whole gunicorn worker.
+"""
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse, JsonResponse
+from django.utils import timezone
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+from rest_framework import status
+
+from .log_buffer import aenqueue_logs
+from .models import DisplayLog
+from .presence import amark_seen
+from .serializers import DisplayLogSerializer
+from .token_cache import aget_display_for_token
+
+HEARTBEAT_TIMEOUT = 300
+
+
+async def aauthenticate_display(request):
+    """
+    Async counterpart of ``DisplayTokenAuthentication``.
+
+    :return: ``(display, None)`` on success or ``(None, JsonResponse)`` with the error to return.
+    """
+    token = request.headers.get('Authorization')
+
+    if not token:
+        return None, JsonResponse(
+            {"detail": "Authentication credentials were not provided."},
+            status=status.HTTP_403_FORBIDDEN
+        )
+
+    if not token.startswith("Token "):
+        return None, JsonResponse(
+            {"detail": "Authorization header must start with 'Token'."},
+            status=status.HTTP_401_UNAUTHORIZED
+        )
+
+    display = await aget_display_for_token(token[6:])
+    if display is None:
+        return None, JsonResponse(
+            {"detail": "Invalid token or token expired."},
+            status=status.HTTP_401_UNAUTHORIZED
+        )
+
+    return display, None
+
+
+def validate_log_entry(data):
+    """
+    Validates one log entry with the ``type`` and ``message`` fields of ``DisplayLogSerializer``,
+    so both log endpoints trim, reject blank messages and NUL characters the same way.
+
+    :return: ``(entry, errors)``
+    """
+    serializer = DisplayLogSerializer(data={key: data[key] for key in ('type', 'message') if key in data})
+    if not serializer.is_valid():
+        return None, dict(serializer.errors)
+
+    return {
+        "type": serializer.validated_data.get('type', DisplayLog.TypeChoices.UNKNOWN),
+        "message": serializer.validated_data['message'],
+    }, {}
+
+
+def parse_json_body(request):
+    try:
+        return json.loads(request.body or b'{}'), None
+    except ValueError:
+        return None, JsonResponse({"detail": "Body must be valid JSON."}, status=status.HTTP_400_BAD_REQUEST)
+
+
+@csrf_exempt
+@require_POST
+async def display_log_view(request):
+    display, error = await aauthenticate_display(request)
+    if error:
+        return error
+
+    data, error = parse_json_body(request)
+    if error:
+        return error
+    if not isinstance(data, dict):
+        return JsonResponse({"detail": "Body must be a JSON object."}, status=status.HTTP_400_BAD_REQUEST)
+
+    entry, errors = validate_log_entry(data)
+    if errors:
+        return JsonResponse(errors, status=status.HTTP_400_BAD_REQUEST)
+
+    await DisplayLog.objects.acreate(display=display, **entry)
+    return JsonResponse({"display": display.id, **entry}, status=status.HTTP_201_CREATED)
+
+
+@csrf_exempt
+@require_POST
+async def display_log_bulk_view(request):
+    """
+    Accepts ``{"logs": [{"type": ..., "message": ...}, ...]}`` into the log buffer.
+
+    Entries are written by the ``flush_display_logs`` task; a full buffer answers
+    503 with ``Retry-After`` so devices back off instead of hammering the database.
+    """
+    display, error = await aauthenticate_display(request)
+    if error:
+        return error
+
+    data, error = parse_json_body(request)
+    if error:
+        return error
+
+    logs = data.get('logs') if isinstance(data, dict) else data
+    if not isinstance(logs, list) or not logs:
+        return JsonResponse({"logs": ["A non-empty list is required."]}, status=status.HTTP_400_BAD_REQUEST)
+    if len(logs) > settings.DISPLAY_LOG_BULK_MAX:
+        return JsonResponse(
+            {"logs": [f"At most {settings.DISPLAY_LOG_BULK_MAX} entries per request."]},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    entries = []
+    for index, item in enumerate(logs):
+        entry, errors = validate_log_entry(item if isinstance(item, dict) else {})
+        if errors:
+            return JsonResponse({"logs": {index: errors}}, status=status.HTTP_400_BAD_REQUEST)
+        entries.append(entry)
+
+    if not await aenqueue_logs(display.id, entries):
+        response = JsonResponse(
+            {"detail": "Log buffer is full, retry later."},
+            status=status.HTTP_503_SERVICE_UNAVAILABLE
+        )
+        response['Retry-After'] = settings.DISPLAY_LOG_RETRY_AFTER
+        return response
+
+    return JsonResponse({"accepted": len(entries)}, status=status.HTTP_202_ACCEPTED)
+
+
+@require_GET
+async def display_config_view(request):
+    from websocket.payloads import aget_display_payload
+
+    display, error = await aauthenticate_display(request)
+    if error:
+        return error
+
+    return HttpResponse(await aget_display_payload(display.id), content_type='application/json')
+
+
+@csrf_exempt
+@require_POST
+async def display_heartbeat_view(request):
+    display, error = await aauthenticate_display(request)
+    if error:
+        return error
+
+    now = timezone.now()
+    await cache.aset(f"display_heartbeat:{display.id}", now.isoformat(), timeout=HEARTBEAT_TIMEOUT)
+    await amark_seen(display.id, display.place_id, client_version=request.headers.get('X-Client-Version'))
+    return JsonResponse({"server_time": now.isoformat()})
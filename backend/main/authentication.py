@@ -1,6 +1,6 @@
 from rest_framework.authentication import BaseAuthentication
 from rest_framework.exceptions import AuthenticationFailed
-from .models import DisplayToken
+from .token_cache import get_display_for_token
 
 
 class DisplayTokenAuthentication(BaseAuthentication):
@@ -19,13 +19,10 @@ class DisplayTokenAuthentication(BaseAuthentication):
         else:
             raise AuthenticationFailed("Authorization header must start with 'Token'.")
 
-        try:
-            display_token = DisplayToken.objects.get(key=token)
-        except DisplayToken.DoesNotExist:
+        display = get_display_for_token(token)
+        if display is None:
             raise AuthenticationFailed("Invalid token or token expired.")
 
-        display = display_token.display
-
         # if display_token.expires_at and display_token.expires_at < timezone.now():
         #     raise AuthenticationFailed("Token has expired.")
 
@@ -0,0 +1,116 @@
+"""
+Coalesced websocket broadcasts of display changes.
+
+Signals only record which displays changed; once the transaction commits, each
+display gets at most one ``broadcast_display_update`` task per debounce window,
+so a nested admin save with dozens of ticker items produces a single message.
+"""
+from functools import partial
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+
+def get_group_name(stream_key, format):
+    """
+    Sockets of a display are grouped per wire format, so each one only receives its own frame.
+    """
+    return f"display_{stream_key}.{format.split('.', 1)[1]}"
+
+
+def broadcast_revision(stream_key, revision, base, payload, patch=None):
+    """
+    Encodes a revision once per wire format and sends the frames to the matching groups,
+    so consumers only forward them.
+
+    Every event carries the full ``display_update`` frame, plus the ``display_patch``
+    frame from ``base`` when there is a patch, for the consumers that asked for patches.
+    """
+    from websocket.encoding import FORMATS, encode
+    from websocket.payloads import build_message, build_patch_message
+
+    message = build_message("display_update", payload, revision)
+    patch_message = build_patch_message(revision, base, patch) if patch is not None else None
+
+    group_send = async_to_sync(get_channel_layer().group_send)
+    for format in FORMATS:
+        group_send(get_group_name(stream_key, format), {
+            "type": "display.update",
+            "revision": revision,
+            "base": base,
+            "frame": encode(message, format),
+            "patch": encode(patch_message, format) if patch_message is not None else None,
+        })
+
+
+def get_pending_key(display_id):
+    return f"display_broadcast_pending:{display_id}"
+
+
+def schedule_display_update(*display_ids):
+    """
+    Queues a broadcast for ``display_ids`` when the current transaction commits.
+    """
+    for display_id in set(display_ids):
+        transaction.on_commit(partial(queue_display_update, display_id))
+
+
+def queue_display_update(display_id):
+    from websocket.payloads import bump_payload_version
+    from .tasks import broadcast_display_update
+
+    bump_payload_version(display_id)
+    debounce = settings.DISPLAY_BROADCAST_DEBOUNCE
+    if cache.add(get_pending_key(display_id), 1, timeout=max(int(debounce * 10), 5)):
+        broadcast_display_update.apply_async((display_id,), countdown=debounce)
+
+
+def queue_display_updates(display_ids):
+    """
+    Broadcasts many displays from a single task, e.g. after a bulk ``UPDATE`` that fired no signals.
+
+    Also evicts what the skipped ``post_save`` receivers would have: the cached token
+    lookups and websocket references of those displays.
+    """
+    from websocket.gateway import invalidate_display_ref
+    from websocket.payloads import bump_payload_version
+    from .models import Display, DisplayToken
+    from .tasks import broadcast_display_updates
+    from .token_cache import invalidate_tokens
+
+    if not display_ids:
+        return
+
+    invalidate_tokens(*DisplayToken.objects.filter(display_id__in=display_ids).values_list('key', flat=True))
+    for stream_key in Display.objects.filter(id__in=display_ids).values_list('stream_key', flat=True):
+        invalidate_display_ref(stream_key)
+    bump_payload_version(*display_ids)
+    broadcast_display_updates.delay(list(display_ids))
+
+
+def send_display_update(display_id):
+    """
+    Renders the display payload and sends it, with the patch from the previous
+    revision, to every connected socket of the display.
+
+    :return: False when the display no longer exists or its payload did not change.
+    """
+    from websocket.payloads import get_display_payload, publish_revision
+    from .models import Display
+
+    cache.delete(get_pending_key(display_id))
+
+    stream_key = Display.objects.filter(id=display_id).values_list('stream_key', flat=True).first()
+    if stream_key is None:
+        return False
+
+    payload = get_display_payload(display_id)
+    revision, base, patch = publish_revision(display_id, payload)
+    if revision is None:
+        return False
+
+    broadcast_revision(stream_key, revision, base, payload, patch)
+    return True
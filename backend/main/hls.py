@@ -0,0 +1,118 @@
+import math
+import re
+
+ATTRIBUTE_PATTERN = re.compile(r'([A-Z0-9-]+)=("[^"]*"|[^,]*)')
+
+
+def parse_media_playlist(text):
+    """
+    Parses an HLS media playlist into a list of ``[duration, uri]`` pairs.
+    """
+    segments = []
+    duration = None
+
+    for line in text.splitlines():
+        line = line.strip()
+        if line.startswith('#EXTINF:'):
+            duration = float(line[len('#EXTINF:'):].split(',')[0])
+        elif line and not line.startswith('#') and duration is not None:
+            segments.append([duration, line])
+            duration = None
+
+    return segments
+
+
+def parse_master_playlist(text):
+    """
+    Parses an HLS master playlist into ``{'bandwidth', 'resolution', 'uri'}`` dicts.
+    """
+    variants = []
+    attributes = None
+
+    for line in text.splitlines():
+        line = line.strip()
+        if line.startswith('#EXT-X-STREAM-INF:'):
+            attributes = {
+                key: value.strip('"')
+                for key, value in ATTRIBUTE_PATTERN.findall(line[len('#EXT-X-STREAM-INF:'):])
+            }
+        elif line and not line.startswith('#') and attributes is not None:
+            variants.append({
+                'bandwidth': int(attributes.get('BANDWIDTH', 0)),
+                'resolution': attributes.get('RESOLUTION', ''),
+                'uri': line,
+            })
+            attributes = None
+
+    return variants
+
+
+def build_master_playlist(variants, url_for):
+    """
+    Builds a master playlist for ``variants``.
+
+    :param url_for: Callable mapping a variant dict to the URL of its media playlist.
+    """
+    lines = ['#EXTM3U', '#EXT-X-VERSION:3']
+    for variant in sorted(variants, key=lambda v: v['bandwidth'], reverse=True):
+        attributes = f"BANDWIDTH={variant['bandwidth']}"
+        if variant.get('resolution'):
+            attributes += f",RESOLUTION={variant['resolution']}"
+        lines.append(f'#EXT-X-STREAM-INF:{attributes}')
+        lines.append(url_for(variant))
+    return '\n'.join(lines) + '\n'
+
+
+def build_live_playlist(segments, base_url, elapsed, window=3, loops=-1):
+    """
+    Builds a live-window media playlist that replays pre-segmented VOD content.
+
+    The position is derived from the wall-clock time elapsed since the stream started,
+    so every player sees the same window without a running encoder.
+
+    :param segments: ``[duration, uri]`` pairs as returned by ``parse_media_playlist``.
+    :param base_url: Prefix prepended to each segment URI.
+    :param elapsed: Seconds since the stream started.
+    :param window: Number of segments listed in the playlist.
+    :param loops: Extra passes after the first one, ``-1`` for unlimited.
+    """
+    count = len(segments)
+    total = sum(duration for duration, _ in segments)
+    if not count or total <= 0:
+        raise ValueError("Cannot build a playlist without segments.")
+
+    elapsed = max(elapsed, 0)
+    passes, offset = divmod(elapsed, total)
+    current = int(passes) * count
+    for duration, _ in segments:
+        offset -= duration
+        if offset < 0:
+            break
+        current += 1
+
+    ended = loops >= 0 and current >= (loops + 1) * count
+    if ended:
+        current = (loops + 1) * count - 1
+
+    first = max(current - window + 1, 0)
+    target = math.ceil(max(duration for duration, _ in segments))
+
+    lines = [
+        '#EXTM3U',
+        '#EXT-X-VERSION:3',
+        f'#EXT-X-TARGETDURATION:{target}',
+        f'#EXT-X-MEDIA-SEQUENCE:{first}',
+        f'#EXT-X-DISCONTINUITY-SEQUENCE:{first // count}',
+    ]
+    for sequence in range(first, current + 1):
+        index = sequence % count
+        if index == 0 and sequence != first:
+            lines.append('#EXT-X-DISCONTINUITY')
+        duration, uri = segments[index]
+        lines.append(f'#EXTINF:{duration:.3f},')
+        lines.append(f'{base_url}{uri}')
+
+    if ended:
+        lines.append('#EXT-X-ENDLIST')
+
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,138 @@
+import datetime
+import json
+import logging
+import time
+
+from django.conf import settings
+from django.db import DataError, IntegrityError, transaction
+from django.utils import timezone
+from redis.exceptions import LockError
+
+from core.redis_client import get_redis, get_async_redis
+
+logger = logging.getLogger(__name__)
+
+BUFFER_KEY = "display_logs:buffer"
+DEAD_LETTER_KEY = "display_logs:dead"
+FLUSH_LOCK_KEY = "display_logs:flush_lock"
+FLUSH_LOCK_TIMEOUT = 60
+
+
+async def aenqueue_logs(display_id, entries):
+    """
+    Appends validated log entries to the Redis buffer.
+
+    :return: False when the buffer is full and the client should back off.
+    """
+    client = get_async_redis()
+    if await client.llen(BUFFER_KEY) + len(entries) > settings.DISPLAY_LOG_BUFFER_MAX:
+        return False
+
+    received_at = time.time()
+    await client.rpush(BUFFER_KEY, *(
+        json.dumps({
+            "display": display_id,
+            "type": entry["type"],
+            "message": entry["message"],
+            "time": received_at,
+        })
+        for entry in entries
+    ))
+    return True
+
+
+def build_log(entry):
+    from .models import DisplayLog
+
+    created_at = entry.get("time")
+    return DisplayLog(
+        display_id=entry["display"],
+        type=entry["type"],
+        message=entry["message"],
+        created_at=datetime.datetime.fromtimestamp(created_at, datetime.timezone.utc) if created_at else timezone.now(),
+    )
+
+
+def write_batch(client, logs, raw_entries):
+    """
+    Writes one batch; a rejected batch is split in halves until the rejected entries are
+    isolated. Those are dropped when their display was deleted since they were buffered,
+    otherwise parked in ``DEAD_LETTER_KEY``.
+
+    :param raw_entries: The buffered entries ``logs`` were built from, in the same order.
+    :return: The number of entries written.
+    """
+    from .models import Display, DisplayLog
+
+    try:
+        with transaction.atomic():
+            DisplayLog.objects.bulk_create(logs)
+        return len(logs)
+    except (IntegrityError, DataError) as error:
+        if len(logs) > 1:
+            middle = len(logs) // 2
+            return (
+                write_batch(client, logs[:middle], raw_entries[:middle])
+                + write_batch(client, logs[middle:], raw_entries[middle:])
+            )
+        rejected = error
+
+    if not Display.objects.filter(id=logs[0].display_id).exists():
+        return 0
+
+    logger.warning(f"Moving a rejected display log entry to '{DEAD_LETTER_KEY}' ({rejected}).")
+    with client.pipeline() as pipe:
+        pipe.rpush(DEAD_LETTER_KEY, *raw_entries)
+        pipe.ltrim(DEAD_LETTER_KEY, -settings.DISPLAY_LOG_BUFFER_MAX, -1)
+        pipe.execute()
+    return 0
+
+
+def flush_logs(batch_size=None, max_batches=50):
+    """
+    Writes buffered log entries to the database with ``bulk_create``.
+
+    Entries are only trimmed from the buffer after their batch is written (or parked,
+    see ``write_batch``), and a lock keeps concurrent flushers from writing the same
+    batch twice. The lock is renewed per batch and a run stops after half its timeout.
+
+    :return: The number of entries written.
+    """
+    client = get_redis()
+    batch_size = batch_size or settings.DISPLAY_LOG_FLUSH_BATCH_SIZE
+    lock = client.lock(FLUSH_LOCK_KEY, timeout=FLUSH_LOCK_TIMEOUT, blocking=False)
+    if not lock.acquire():
+        return 0
+
+    deadline = time.monotonic() + FLUSH_LOCK_TIMEOUT / 2
+    written = 0
+    try:
+        for _ in range(max_batches):
+            if time.monotonic() >= deadline:
+                break
+            raw_entries = client.lrange(BUFFER_KEY, 0, batch_size - 1)
+            if not raw_entries:
+                break
+
+            logs, built = [], []
+            for raw in raw_entries:
+                try:
+                    logs.append(build_log(json.loads(raw)))
+                except (ValueError, KeyError, TypeError):
+                    continue
+                built.append(raw)
+
+            if logs:
+                written += write_batch(client, logs, built)
+            # Still ours? Then nobody else read this batch, trim it and keep the lock alive.
+            lock.reacquire()
+            client.ltrim(BUFFER_KEY, len(raw_entries), -1)
+    except LockError:
+        logger.warning("Display log flush lock expired, stopping this run.")
+    finally:
+        try:
+            lock.release()
+        except LockError:
+            pass
+
+    return written
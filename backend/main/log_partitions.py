@@ -0,0 +1,229 @@
+"""
+Time-based storage management for ``DisplayLog``.
+
+On PostgreSQL the table is converted once into a native daily range partitioned
+table (``partition_display_logs`` command), so retention drops whole partitions.
+Other databases fall back to batched deletes. Hourly per-display/per-type counts
+are rolled up into ``DisplayLogHourlyCount`` so dashboards never scan raw logs.
+"""
+import datetime
+import logging
+import re
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count
+from django.db.models.functions import TruncHour
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+PARTITION_PATTERN = re.compile(r'_p(\d{8})$')
+DELETE_BATCH_SIZE = 10000
+
+
+def get_table():
+    from .models import DisplayLog
+    return DisplayLog._meta.db_table
+
+
+def is_postgresql():
+    return connection.vendor == 'postgresql'
+
+
+def is_partitioned():
+    if not is_postgresql():
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid WHERE c.relname = %s",
+            [get_table()],
+        )
+        return cursor.fetchone() is not None
+
+
+def partition_name(day):
+    return f"{get_table()}_p{day:%Y%m%d}"
+
+
+def default_partition_name():
+    return f"{get_table()}_default"
+
+
+def create_partition(cursor, day):
+    """
+    Creates the partition of ``day`` unless it exists.
+
+    Rows of that day already in the default partition (e.g. the beat was down for longer
+    than the premade days) would make ``CREATE ... PARTITION OF`` fail, so the default
+    partition is detached, its rows of that day moved, and attached again.
+    """
+    table, default, name = get_table(), default_partition_name(), partition_name(day)
+    start = f"{day:%Y-%m-%d} 00:00:00+00"
+    end = f"{day + datetime.timedelta(days=1):%Y-%m-%d} 00:00:00+00"
+
+    cursor.execute("SELECT to_regclass(%s), to_regclass(%s)", [f'"{name}"', f'"{default}"'])
+    exists, has_default = cursor.fetchone()
+    if exists:
+        return
+
+    with transaction.atomic():
+        stranded = False
+        if has_default:
+            cursor.execute(
+                f'SELECT 1 FROM "{default}" WHERE created_at >= %s AND created_at < %s LIMIT 1', [start, end]
+            )
+            stranded = cursor.fetchone() is not None
+
+        if stranded:
+            cursor.execute(f'ALTER TABLE "{table}" DETACH PARTITION "{default}"')
+        cursor.execute(f'CREATE TABLE "{name}" PARTITION OF "{table}" ' f"FOR VALUES FROM ('{start}') TO ('{end}')")
+        if stranded:
+            cursor.execute(
+                f'INSERT INTO "{table}" SELECT * FROM "{default}" WHERE created_at >= %s AND created_at < %s',
+                [start, end],
+            )
+            cursor.execute(f'DELETE FROM "{default}" WHERE created_at >= %s AND created_at < %s', [start, end])
+            cursor.execute(f'ALTER TABLE "{table}" ATTACH PARTITION "{default}" DEFAULT')
+            logger.info(f"Moved rows of {day} from {default} into {name}.")
+
+
+def convert_to_partitioned():
+    """
+    Rebuilds the log table as a daily range partitioned table, copying existing rows.
+
+    The primary key becomes ``(id, created_at)`` as PostgreSQL requires; the ORM
+    keeps using ``id`` and index names are preserved.
+    """
+    table = get_table()
+    legacy = f"{table}_legacy"
+    today = timezone.now().date()
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT indexdef FROM pg_indexes WHERE tablename = %s AND indexname <> %s",
+            [table, f"{table}_pkey"],
+        )
+        index_definitions = [row[0] for row in cursor.fetchall()]
+
+        cursor.execute(f'ALTER TABLE "{table}" RENAME TO "{legacy}"')
+        cursor.execute(
+            f'CREATE TABLE "{table}" (LIKE "{legacy}" INCLUDING DEFAULTS INCLUDING IDENTITY) '
+            f'PARTITION BY RANGE (created_at)'
+        )
+        cursor.execute(f'ALTER TABLE "{table}" ALTER COLUMN created_at SET NOT NULL')
+        cursor.execute(f'ALTER TABLE "{table}" ADD PRIMARY KEY (id, created_at)')
+        cursor.execute(
+            f'ALTER TABLE "{table}" ADD FOREIGN KEY (display_id) REFERENCES "main_display" (id) '
+            f'DEFERRABLE INITIALLY DEFERRED'
+        )
+        cursor.execute(f'CREATE TABLE "{default_partition_name()}" PARTITION OF "{table}" DEFAULT')
+
+        cursor.execute(f'SELECT MIN(created_at) FROM "{legacy}"')
+        oldest = cursor.fetchone()[0]
+        day = max(oldest.date(), today - datetime.timedelta(days=settings.DISPLAY_LOG_RETENTION_DAYS)) \
+            if oldest else today
+        while day <= today + datetime.timedelta(days=settings.DISPLAY_LOG_PARTITION_PREMAKE_DAYS):
+            create_partition(cursor, day)
+            day += datetime.timedelta(days=1)
+
+        cursor.execute(
+            f'INSERT INTO "{table}" (id, created_at, updated_at, display_id, type, message) '
+            f'SELECT id, COALESCE(created_at, NOW()), updated_at, display_id, type, message FROM "{legacy}"'
+        )
+        cursor.execute(
+            f"SELECT setval(pg_get_serial_sequence(%s, 'id'), COALESCE((SELECT MAX(id) FROM \"{table}\"), 0) + 1, false)",
+            [table],
+        )
+        cursor.execute(f'DROP TABLE "{legacy}"')
+
+        for definition in index_definitions:
+            cursor.execute(definition)
+
+    logger.info(f"{table} converted to a partitioned table.")
+
+
+def ensure_partitions():
+    """
+    Creates the daily partitions for today and the next ``DISPLAY_LOG_PARTITION_PREMAKE_DAYS`` days.
+    """
+    today = timezone.now().date()
+    with connection.cursor() as cursor:
+        for offset in range(settings.DISPLAY_LOG_PARTITION_PREMAKE_DAYS + 1):
+            create_partition(cursor, today + datetime.timedelta(days=offset))
+
+
+def apply_retention():
+    """
+    Removes logs older than ``DISPLAY_LOG_RETENTION_DAYS``.
+
+    On PostgreSQL expired daily partitions are dropped and expired rows of the default
+    partition (days that had no partition yet) deleted.
+
+    :return: The dropped partitions (PostgreSQL) or the number of deleted rows (fallback).
+    """
+    from .models import DisplayLog
+
+    cutoff = timezone.now() - datetime.timedelta(days=settings.DISPLAY_LOG_RETENTION_DAYS)
+
+    if is_partitioned():
+        table = get_table()
+        dropped = []
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT c.relname FROM pg_inherits i "
+                "JOIN pg_class c ON c.oid = i.inhrelid JOIN pg_class p ON p.oid = i.inhparent "
+                "WHERE p.relname = %s",
+                [table],
+            )
+            for (name,) in cursor.fetchall():
+                match = PARTITION_PATTERN.search(name)
+                if not match:
+                    continue
+                day = datetime.datetime.strptime(match.group(1), '%Y%m%d').date()
+                if day + datetime.timedelta(days=1) <= cutoff.date():
+                    cursor.execute(f'DROP TABLE "{name}"')
+                    dropped.append(name)
+
+            cursor.execute(f'DELETE FROM "{default_partition_name()}" WHERE created_at < %s', [cutoff])
+            if cursor.rowcount:
+                logger.info(f"Deleted {cursor.rowcount} expired rows from {default_partition_name()}.")
+        return dropped
+
+    deleted = 0
+    while True:
+        ids = list(DisplayLog.objects.filter(created_at__lt=cutoff).values_list('id', flat=True)[:DELETE_BATCH_SIZE])
+        if not ids:
+            return deleted
+        # Nothing references logs and no signals listen to their deletion, so this is one DELETE.
+        deleted += DisplayLog.objects.filter(id__in=ids).delete()[0]
+
+
+def rollup_logs(hours=None):
+    """
+    Recomputes the hourly counts of the last ``hours`` hours (including the current one).
+
+    Upserts are idempotent, so overlapping runs simply refresh the same rows.
+    """
+    from .models import DisplayLog, DisplayLogHourlyCount
+
+    hours = hours or settings.DISPLAY_LOG_ROLLUP_HOURS
+    start = timezone.now().replace(minute=0, second=0, microsecond=0) - datetime.timedelta(hours=hours - 1)
+
+    rows = (
+        DisplayLog.objects
+        .filter(created_at__gte=start, display__isnull=False)
+        .annotate(hour=TruncHour('created_at'))
+        .values('display_id', 'type', 'hour')
+        .annotate(count=Count('id'))
+        .order_by()
+    )
+    counts = [DisplayLogHourlyCount(**row) for row in rows]
+
+    DisplayLogHourlyCount.objects.bulk_create(
+        counts,
+        update_conflicts=True,
+        unique_fields=['display', 'type', 'hour'],
+        update_fields=['count', 'updated_at'],
+    )
+    return len(counts)
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from main.log_partitions import convert_to_partitioned, ensure_partitions, is_partitioned, is_postgresql
+
+
+class Command(BaseCommand):
+    help = "Converts the display log table to daily partitions (PostgreSQL) and pre-creates upcoming partitions."
+
+    def handle(self, *args, **options):
+        if not is_postgresql():
+            self.stdout.write("Not a PostgreSQL database, display logs stay unpartitioned.")
+            return
+
+        if not is_partitioned():
+            convert_to_partitioned()
+            self.stdout.write(self.style.SUCCESS("Display log table converted to daily partitions."))
+
+        ensure_partitions()
+        self.stdout.write(self.style.SUCCESS("Display log partitions are up to date."))
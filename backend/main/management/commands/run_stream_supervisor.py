@@ -0,0 +1,20 @@
+import signal
+
+from django.core.management.base import BaseCommand
+
+from main.supervisor import StreamSupervisor
+
+
+class Command(BaseCommand):
+    help = "Runs the stream supervisor that owns the ffmpeg processes of this host."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--node', help="Node name used in Display.task_id (defaults to the hostname).")
+
+    def handle(self, *args, **options):
+        supervisor = StreamSupervisor(node=options['node'])
+
+        signal.signal(signal.SIGTERM, supervisor.shutdown)
+        signal.signal(signal.SIGINT, supervisor.shutdown)
+
+        supervisor.run()
@@ -0,0 +1,17 @@
+import signal
+
+from django.core.management.base import BaseCommand
+
+from main.ticker_scheduler import TickerScheduler
+
+
+class Command(BaseCommand):
+    help = "Runs the scheduler that pushes display updates when ticker windows open or close."
+
+    def handle(self, *args, **options):
+        scheduler = TickerScheduler()
+
+        signal.signal(signal.SIGTERM, scheduler.shutdown)
+        signal.signal(signal.SIGINT, scheduler.shutdown)
+
+        scheduler.run()
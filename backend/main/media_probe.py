@@ -0,0 +1,135 @@
+import hashlib
+import json
+import subprocess
+
+from django.core.cache import cache
+
+PROBE_CACHE_PREFIX = "media_probe"
+KEYFRAME_SCAN_SECONDS = 30
+
+
+def file_sha256(path, chunk_size=1024 * 1024):
+    """
+    Returns the hex SHA-256 of a file, read in chunks so large videos never sit in memory.
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def run_ffprobe(path):
+    """
+    Runs a single ffprobe call returning format, streams and the first video keyframes as JSON.
+    """
+    command = [
+        'ffprobe', '-v', 'error',
+        '-print_format', 'json',
+        '-show_format', '-show_streams',
+        '-show_entries', 'packet=stream_index,pts_time,flags',
+        '-read_intervals', f'%+{KEYFRAME_SCAN_SECONDS}',
+        path,
+    ]
+    result = subprocess.run(command, capture_output=True, check=True, text=True)
+    return json.loads(result.stdout)
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _to_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _frame_rate(value):
+    try:
+        numerator, denominator = value.split('/')
+        return round(int(numerator) / int(denominator), 3) if int(denominator) else None
+    except (AttributeError, ValueError):
+        return None
+
+
+def _keyframe_interval(packets, stream_index):
+    keyframes = [
+        _to_float(packet.get('pts_time'))
+        for packet in packets
+        if packet.get('stream_index') == stream_index and 'K' in packet.get('flags', '')
+    ]
+    keyframes = sorted(t for t in keyframes if t is not None)
+    if len(keyframes) < 2:
+        return None
+    return round((keyframes[-1] - keyframes[0]) / (len(keyframes) - 1), 3)
+
+
+def parse_probe(probe):
+    """
+    Reduces raw ffprobe output to the metadata the streaming pipeline needs.
+    """
+    fmt = probe.get('format', {})
+    streams = probe.get('streams', [])
+    video = next((s for s in streams if s.get('codec_type') == 'video'), None)
+    audio = next((s for s in streams if s.get('codec_type') == 'audio'), None)
+
+    metadata = {
+        'duration': _to_float(fmt.get('duration')),
+        'format': fmt.get('format_name'),
+        'bitrate': _to_int(fmt.get('bit_rate')),
+        'size': _to_int(fmt.get('size')),
+        'video': None,
+        'audio': None,
+    }
+
+    if video is not None:
+        metadata['video'] = {
+            'codec': video.get('codec_name'),
+            'profile': video.get('profile'),
+            'pix_fmt': video.get('pix_fmt'),
+            'width': video.get('width'),
+            'height': video.get('height'),
+            'frame_rate': _frame_rate(video.get('avg_frame_rate')),
+            'bitrate': _to_int(video.get('bit_rate')),
+            'keyframe_interval': _keyframe_interval(probe.get('packets', []), video.get('index')),
+        }
+
+    if audio is not None:
+        metadata['audio'] = {
+            'codec': audio.get('codec_name'),
+            'sample_rate': _to_int(audio.get('sample_rate')),
+            'channels': audio.get('channels'),
+            'channel_layout': audio.get('channel_layout'),
+            'bitrate': _to_int(audio.get('bit_rate')),
+        }
+
+    if metadata['duration'] is None and video is not None:
+        metadata['duration'] = _to_float(video.get('duration'))
+
+    return metadata
+
+
+def probe_media(path, sha256=None):
+    """
+    Returns ``(sha256, metadata)`` for a media file.
+
+    Results are cached by content hash, so probing the same bytes again
+    (re-uploads, repeated admin actions) does not start ffprobe.
+
+    :param path: Absolute path of the media file.
+    :param sha256: The content hash, if the caller already computed it.
+    """
+    sha256 = sha256 or file_sha256(path)
+    cache_key = f"{PROBE_CACHE_PREFIX}:{sha256}"
+
+    metadata = cache.get(cache_key)
+    if metadata is None:
+        metadata = parse_probe(run_ffprobe(path))
+        cache.set(cache_key, metadata, timeout=None)
+
+    return sha256, metadata
@@ -1,15 +1,35 @@
+import os
+import re
 import uuid
 
+from django.conf import settings
 from django.db import models
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.functional import cached_property
 from django.utils.translation import gettext_lazy as _
 from django.contrib.auth import get_user_model
 from django.core.validators import FileExtensionValidator
 from django_ckeditor_5.fields import CKEditor5Field
 from rest_framework.authtoken.models import Token
 from autoslug.fields import AutoSlugField
+from celery import chain
 
-from core.models import BaseModel, UploadPath
-from main.tasks import start_streaming, update_video_duration
+from core.models import BaseModel, ContentAddressedUploadPath
+from core.storages import ContentAddressedStorage
+from main.media_probe import file_sha256
+from main.tasks import (
+    update_video_duration,
+    probe_media_asset,
+    transcode_media_asset,
+    build_asset_renditions,
+)
+from main.stream_scheduler import QUEUED, schedule_stream, unqueue_stream
+from main.streaming import publish_stream_command
+from main.hls import build_live_playlist
+from main.playout import remove_playout, write_playout
+
+SHA256_PATTERN = re.compile(r'[0-9a-f]{64}')
 
 
 class Place(BaseModel):
@@ -37,6 +57,11 @@ class Place(BaseModel):
         blank=True,
         null=True
     )
+    abr_enabled = models.BooleanField(
+        verbose_name=_('Adaptive Bitrate'),
+        default=False,
+        help_text=_('Build a multi-bitrate rendition ladder for the videos of this place.'),
+    )
 
     class Meta:
         verbose_name = _('Place')
@@ -46,8 +71,117 @@ class Place(BaseModel):
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        is_abr_enabled = (
+            self.pk is not None
+            and self.abr_enabled
+            and not Place.objects.filter(pk=self.pk, abr_enabled=True).exists()
+        )
+
+        super().save(*args, **kwargs)
+
+        if is_abr_enabled:
+            assets = MediaAsset.objects.filter(
+                displays__place=self,
+                displays__abr_enabled__isnull=True,
+                abr_renditions=[],
+            ).exclude(Q(playback_file='') | Q(playback_file__isnull=True)).distinct()
+            for asset in assets:
+                build_asset_renditions.apply_async(args=[asset.id])
+
+
+class MediaAsset(BaseModel):
+    """
+    One unique video, shared by every display that uploaded the same bytes.
+
+    Probing, transcoding and segmenting run once per asset, not once per display.
+    """
+    sha256 = models.CharField(
+        verbose_name=_('SHA-256'),
+        max_length=64,
+        unique=True,
+    )
+    file = models.FileField(
+        verbose_name=_('File'),
+        storage=ContentAddressedStorage(),
+    )
+    duration = models.FloatField(
+        verbose_name=_('Duration (seconds)'),
+        null=True,
+        blank=True,
+    )
+    metadata = models.JSONField(
+        verbose_name=_('Metadata'),
+        default=dict,
+        blank=True,
+        help_text=_('Codecs, resolution, bitrate and keyframe interval as reported by ffprobe.'),
+    )
+    playback_file = models.FileField(
+        verbose_name=_("Playback Video"),
+        blank=True,
+        null=True,
+        help_text=_('Normalized H.264/AAC rendition that is streamed without re-encoding.'),
+    )
+    hls_segments = models.JSONField(
+        verbose_name=_('HLS Segments'),
+        default=list,
+        blank=True,
+    )
+    abr_renditions = models.JSONField(
+        verbose_name=_('ABR Renditions'),
+        default=list,
+        blank=True,
+    )
+
+    class Meta:
+        verbose_name = _('Media Asset')
+        verbose_name_plural = _('Media Assets')
+        ordering = ('-created_at',)
+
+    def __str__(self):
+        return self.sha256
+
+    @classmethod
+    def get_or_create_for_file(cls, field_file, sha256=None):
+        """
+        Returns ``(asset, created)`` for a stored file.
+
+        Content-addressed names already carry the hash; other files are hashed from disk.
+        """
+        if sha256 is None:
+            name = os.path.splitext(os.path.basename(field_file.name))[0]
+            sha256 = name if SHA256_PATTERN.fullmatch(name) else file_sha256(field_file.path)
+        return cls.objects.get_or_create(sha256=sha256, defaults={'file': field_file.name})
+
+    def prepare(self):
+        """
+        Probes the asset, normalizes it once for stream-copy playback, then builds
+        the HLS segments / ABR ladder the displays using it need.
+        """
+        if self.metadata and self.playback_file:
+            build_asset_renditions.apply_async(args=[self.id])
+        else:
+            chain(
+                probe_media_asset.si(self.id),
+                transcode_media_asset.si(self.id),
+                build_asset_renditions.si(self.id),
+            ).apply_async()
+
+    def get_hls_url(self):
+        return f"{settings.HLS_URL}vod/{self.sha256}/"
+
+    def get_abr_url(self):
+        return f"{settings.HLS_URL}abr/{self.sha256}/"
+
+    def get_abr_variant(self, name):
+        return next((variant for variant in self.abr_renditions if variant['name'] == name), None)
+
 
 class Display(BaseModel):
+    class PlaybackModeChoices(models.TextChoices):
+        RTMP = 'RTMP', _('RTMP push (ffmpeg)')
+        HLS = 'HLS', _('Pre-segmented HLS')
+
     place = models.ForeignKey(
         Place,
         verbose_name='Place',
@@ -74,10 +208,12 @@ class Display(BaseModel):
     )
     current_video = models.FileField(
         verbose_name=_("Video"),
-        upload_to=UploadPath(
+        upload_to=ContentAddressedUploadPath(
             folder="streams",
-            sub_path="videos"
+            sub_path="videos",
+            field_name="current_video",
         ),
+        storage=ContentAddressedStorage(),
         validators=[
             FileExtensionValidator(
                 allowed_extensions=['mp4', ]
@@ -87,6 +223,15 @@ class Display(BaseModel):
         null=True,
         help_text=_('The current video played.'),
     )
+    media_asset = models.ForeignKey(
+        MediaAsset,
+        verbose_name=_('Media Asset'),
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        editable=False,
+        related_name='displays',
+    )
     video_duration = models.FloatField(
         verbose_name=_('Video Duration (seconds)'),
         default=0,
@@ -107,6 +252,25 @@ class Display(BaseModel):
         help_text=_('If true, pause the current video.'),
     )
     task_id = models.CharField(verbose_name=_("Task ID"), max_length=255, null=True, blank=True)
+    playback_mode = models.CharField(
+        verbose_name=_('Playback Mode'),
+        max_length=10,
+        choices=PlaybackModeChoices.choices,
+        default=PlaybackModeChoices.RTMP,
+        help_text=_('HLS serves pre-cut segments through nginx and needs no running ffmpeg process.'),
+    )
+    stream_started_at = models.DateTimeField(
+        verbose_name=_('Stream Started At'),
+        null=True,
+        blank=True,
+        editable=False,
+    )
+    abr_enabled = models.BooleanField(
+        verbose_name=_('Adaptive Bitrate'),
+        null=True,
+        blank=True,
+        help_text=_('Build a multi-bitrate rendition ladder. Empty means use the place setting.'),
+    )
 
     class Meta:
         verbose_name = _('Display')
@@ -117,15 +281,66 @@ class Display(BaseModel):
         return self.name
 
     def save(self, *args, **kwargs):
-        is_video_uploaded = self.pk is None and self.current_video
-        is_video_changed = self.pk and self.current_video != Display.objects.get(
-            pk=self.pk
-        ).current_video  # Video update
+        previous = Display.objects.get(pk=self.pk) if self.pk else None
+        is_video_uploaded = self.current_video and not self.current_video._committed
+        is_switched_to_hls = (
+            previous is not None
+            and self.is_hls
+            and previous.playback_mode != self.playback_mode
+        )
+        is_abr_enabled = (
+            previous is not None
+            and self.is_abr_enabled
+            and not previous.is_abr_enabled
+        )
+
+        asset_created = False
+        if is_video_uploaded:
+            # Store the upload under its content hash now, so the shared asset can be linked in the same save.
+            self.current_video.save(self.current_video.name, self.current_video.file, save=False)
+            self.media_asset, asset_created = MediaAsset.get_or_create_for_file(self.current_video)
+            self.video_duration = self.media_asset.duration or 0
+        elif not self.current_video:
+            self.media_asset = None
 
         super().save(*args, **kwargs)
 
-        if is_video_uploaded or is_video_changed:
-            self.set_video_duration()
+        needs_renditions = is_video_uploaded or is_switched_to_hls or is_abr_enabled
+        if asset_created:
+            self.media_asset.prepare()
+        elif needs_renditions and self.media_asset and self.media_asset.playback_file:
+            build_asset_renditions.apply_async(args=[self.media_asset.id])
+
+    @property
+    def is_hls(self):
+        return self.playback_mode == self.PlaybackModeChoices.HLS
+
+    @property
+    def is_abr_enabled(self):
+        return self.place.abr_enabled if self.abr_enabled is None else self.abr_enabled
+
+    @cached_property
+    def has_playlist(self):
+        return self.playlist_items.filter(is_active=True).exists()
+
+    @property
+    def has_hls_playlist(self):
+        asset = self.media_asset
+        return asset is not None and bool(asset.hls_segments or asset.abr_renditions)
+
+    def set_media_asset(self, asset, created=False):
+        """
+        Points the display at an already stored asset and schedules whatever processing it still needs.
+        """
+        self.current_video = asset.file.name
+        self.media_asset = asset
+        self.video_duration = asset.duration or 0
+        self.save()
+
+        if created:
+            asset.prepare()
+        elif asset.playback_file:
+            build_asset_renditions.apply_async(args=[asset.id])
 
     def set_video_duration(self, video_duration=None):
         if video_duration is None:
@@ -134,23 +349,200 @@ class Display(BaseModel):
             self.video_duration = video_duration
             self.save(update_fields=['video_duration'])
 
+    def get_playback_source(self):
+        """
+        Returns ``(path, copy)``: the playout concat list of a playlist display, else the
+        normalized rendition when available, else the upload to re-encode.
+        """
+        if self.has_playlist:
+            return write_playout(self), False
+        remove_playout(self)
+        if self.media_asset and self.media_asset.playback_file:
+            return self.media_asset.playback_file.path, True
+        return self.current_video.path, False
+
+    def build_live_playlist(self, variant=None, now=None):
+        """
+        Renders the looping live-window playlist for an HLS display, or for one of its ABR variants.
+        """
+        now = now or timezone.now()
+        elapsed = (now - self.stream_started_at).total_seconds() if self.stream_started_at else 0
+
+        if variant is not None:
+            segments = variant['segments']
+            base_url = f"{self.media_asset.get_abr_url()}{variant['name']}/"
+        else:
+            segments = self.media_asset.hls_segments
+            base_url = self.media_asset.get_hls_url()
+
+        return build_live_playlist(
+            segments,
+            base_url,
+            elapsed,
+            window=settings.HLS_LIVE_WINDOW,
+            loops=self.loop,
+        )
+
     def start_streaming(self):
-        if self.paused:
+        if not self.current_video and not self.has_playlist:
+            raise ValueError("No video file assigned to the display.")
+
+        if self.is_hls:
+            if not self.current_video:
+                raise ValueError("HLS playback needs a video file; playlists are played out over RTMP.")
+            if not self.has_hls_playlist:
+                raise ValueError("HLS segments are not ready yet.")
             self.paused = False
-            self.save(update_fields=['paused'])
+            self.stream_started_at = timezone.now()
+            self.save(update_fields=['paused', 'stream_started_at'])
+            return
 
-        if self.current_video:
-            video_path = self.current_video.path
-            start_streaming.apply_async(args=[video_path, self.stream_key, self.loop])
-        else:
-            raise ValueError("No video file assigned to the display.")
+        video_path, copy = self.get_playback_source()
+        # Raises when no supervisor can take the stream, leaving the display paused.
+        node = schedule_stream(self.stream_key, video_path, loop=self.loop, copy=copy)
+
+        self.paused = False
+        update_fields = ['paused']
+        if node == QUEUED:
+            self.task_id = QUEUED
+            update_fields.append('task_id')
+        self.save(update_fields=update_fields)
 
     def pause_streaming(self):
         self.paused = True
-        self.save(update_fields=['paused'])
+        update_fields = ['paused']
+        if self.task_id == QUEUED:
+            self.task_id = ""
+            update_fields.append('task_id')
+        self.save(update_fields=update_fields)
+        unqueue_stream(self.stream_key)
+        publish_stream_command("stop", self.stream_key)
+        return True
+
+
+class PlaylistItem(BaseModel):
+    """
+    One media asset in the ordered playlist of a display, optionally restricted to a daypart.
+
+    The playlist is played out by one persistent ffmpeg process (see ``main.playout``).
+    """
+    display = models.ForeignKey(
+        Display,
+        verbose_name=_('Display'),
+        on_delete=models.CASCADE,
+        related_name='playlist_items',
+    )
+    media_asset = models.ForeignKey(
+        MediaAsset,
+        verbose_name=_('Media Asset'),
+        on_delete=models.CASCADE,
+        related_name='playlist_items',
+    )
+    order = models.PositiveIntegerField(
+        verbose_name=_('Order'),
+        default=0,
+        help_text=_('Position of this item in the playlist.'),
+    )
+    days = models.JSONField(
+        verbose_name=_('Days'),
+        default=list,
+        blank=True,
+        help_text=_('Weekdays the item plays on (0 is Monday). Empty means every day.'),
+    )
+    start_time = models.TimeField(
+        verbose_name=_('Start Time'),
+        null=True,
+        blank=True,
+        help_text=_('Daily time the item starts playing (optional).'),
+    )
+    end_time = models.TimeField(
+        verbose_name=_('End Time'),
+        null=True,
+        blank=True,
+        help_text=_('Daily time the item stops playing (optional). Earlier than the start time spans midnight.'),
+    )
+
+    class Meta:
+        verbose_name = _('Playlist Item')
+        verbose_name_plural = _('Playlist Items')
+        ordering = ('order', 'id')
+
+    def __str__(self):
+        return f"{self.display} #{self.order}: {self.media_asset}"
+
+    def is_scheduled(self, moment=None):
+        """
+        Whether the item's daypart contains ``moment`` (local time).
+        """
+        moment = timezone.localtime(moment)
+        if self.days and moment.weekday() not in self.days:
+            return False
+
+        current = moment.time()
+        if self.start_time and self.end_time and self.end_time < self.start_time:
+            return current >= self.start_time or current < self.end_time
+        if self.start_time and current < self.start_time:
+            return False
+        if self.end_time and current >= self.end_time:
+            return False
         return True
 
 
+class VideoUpload(BaseModel):
+    """
+    A resumable, chunked video upload for a display (see ``main.uploads``).
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    display = models.ForeignKey(
+        Display,
+        verbose_name=_('Display'),
+        on_delete=models.CASCADE,
+        related_name='uploads',
+    )
+    created_by = models.ForeignKey(
+        get_user_model(),
+        verbose_name=_('Created by'),
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='video_uploads',
+    )
+    filename = models.CharField(
+        verbose_name=_('File name'),
+        max_length=255,
+    )
+    size = models.PositiveBigIntegerField(
+        verbose_name=_('Size (bytes)'),
+    )
+    offset = models.PositiveBigIntegerField(
+        verbose_name=_('Received (bytes)'),
+        default=0,
+    )
+    sha256 = models.CharField(
+        verbose_name=_('SHA-256'),
+        max_length=64,
+        blank=True,
+        default='',
+    )
+    completed_at = models.DateTimeField(
+        verbose_name=_('Completed at'),
+        null=True,
+        blank=True,
+    )
+
+    class Meta:
+        verbose_name = _('Video Upload')
+        verbose_name_plural = _('Video Uploads')
+        ordering = ('-created_at',)
+
+    def __str__(self):
+        return f"{self.filename} ({self.offset}/{self.size})"
+
+    @property
+    def is_complete(self):
+        return self.completed_at is not None
+
+
 class DisplayLog(BaseModel):
     class TypeChoices(models.TextChoices):
         ERROR = 'ERROR', _('Error')
@@ -178,17 +570,61 @@ class DisplayLog(BaseModel):
         verbose_name=_('Message'),
         help_text=_('The log message')
     )
+    # Not auto_now_add: buffered entries keep the time they were received (see main.log_buffer).
+    created_at = models.DateTimeField(verbose_name=_('Created at'), default=timezone.now, blank=True, null=True)
     is_active = None
 
     class Meta:
         verbose_name = _('Display Log')
         verbose_name_plural = _('Display Logs')
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['display', '-created_at'], name='main_displaylog_display_idx'),
+            models.Index(fields=['created_at'], name='main_displaylog_created_idx'),
+        ]
 
     def __str__(self):
         return f'{self.display.name} - {self.type} - {self.created_at}'
 
 
+class DisplayLogHourlyCount(BaseModel):
+    """
+    Precomputed number of logs per display, type and hour (see ``main.log_partitions.rollup_logs``).
+    """
+    display = models.ForeignKey(
+        Display,
+        verbose_name=_('Display'),
+        on_delete=models.CASCADE,
+        related_name='hourly_log_counts',
+        blank=True,
+        null=True,
+    )
+    type = models.CharField(
+        verbose_name=_('Log Type'),
+        max_length=10,
+        choices=DisplayLog.TypeChoices.choices,
+    )
+    hour = models.DateTimeField(
+        verbose_name=_('Hour'),
+    )
+    count = models.PositiveIntegerField(
+        verbose_name=_('Count'),
+        default=0,
+    )
+    is_active = None
+
+    class Meta:
+        verbose_name = _('Display Log Hourly Count')
+        verbose_name_plural = _('Display Log Hourly Counts')
+        ordering = ['-hour']
+        constraints = [
+            models.UniqueConstraint(fields=['display', 'type', 'hour'], name='unique_display_log_hourly_count'),
+        ]
+
+    def __str__(self):
+        return f'{self.display_id} - {self.type} - {self.hour}: {self.count}'
+
+
 class DisplayToken(Token):
     display = models.ForeignKey(Display, on_delete=models.CASCADE, related_name='tokens')
     user = None
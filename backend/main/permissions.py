@@ -1,3 +1,6 @@
+import hmac
+
+from django.conf import settings
 from rest_framework.permissions import BasePermission
 from rest_framework.exceptions import PermissionDenied
 
@@ -7,4 +10,13 @@ class IsDisplayAuthenticated(BasePermission):
     def has_permission(self, request, view):
         if not hasattr(request, 'user') or not isinstance(request.user, Display):
             raise PermissionDenied("Authentication credentials were not provided.")
-        return True
\ No newline at end of file
+        return True
+
+class HasMetricsToken(BasePermission):
+    """
+    Lets scrapers in with ``Authorization: Bearer <settings.METRICS_TOKEN>``.
+    """
+    def has_permission(self, request, view):
+        token = settings.METRICS_TOKEN
+        header = request.headers.get('Authorization', '')
+        return bool(token) and hmac.compare_digest(header, f"Bearer {token}")
@@ -0,0 +1,100 @@
+"""
+Gapless playout of display playlists.
+
+Each streaming playlist display has an ffconcat list that ends with a reference to
+itself. The ffmpeg concat demuxer re-opens the list after its last item, so the
+single encoder process loops forever and picks up a rewritten list (new items,
+another daypart) at the next pass, without restarting or reconnecting to RTMP.
+"""
+import logging
+import os
+
+from django.conf import settings
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+
+def get_playout_path(display):
+    return os.path.join(settings.PLAYOUT_ROOT, f"{display.stream_key}.ffconcat")
+
+
+def quote(path):
+    return "'" + path.replace("'", "'\\''") + "'"
+
+
+def get_scheduled_assets(display, moment=None):
+    """
+    Returns the media assets of the playlist scheduled at ``moment``, in order.
+
+    Falls back to the display's own video so the screen never goes black between dayparts.
+    """
+    moment = moment or timezone.now()
+    items = display.playlist_items.filter(is_active=True).select_related('media_asset')
+    assets = [item.media_asset for item in items if item.is_scheduled(moment)]
+    if not assets and display.media_asset:
+        assets = [display.media_asset]
+    return assets
+
+
+def build_ffconcat(paths, loop=True, self_name=None):
+    """
+    Renders an ffconcat list for ``paths``.
+
+    :param loop: Reference the list itself (``self_name``) after the last item.
+    """
+    lines = ['ffconcat version 1.0']
+    lines.extend(f"file {quote(path)}" for path in paths)
+    if loop:
+        lines.append(f"file {quote(self_name)}")
+        # The self-reference is opened by a nested concat demuxer, which does not
+        # inherit ``-safe 0`` from the command line and would reject absolute paths.
+        lines.append("option safe 0")
+    return '\n'.join(lines) + '\n'
+
+
+def remove_playout(display):
+    """
+    Deletes the list of a display that streams a single video, so its existence
+    tells ``refresh_playout`` which kind of source is playing.
+    """
+    try:
+        os.remove(get_playout_path(display))
+    except FileNotFoundError:
+        pass
+
+
+def write_playout(display, moment=None):
+    """
+    Writes the concat list of a display atomically, only when its content changed.
+
+    :return: The list path, given to ffmpeg once when the stream starts.
+    :raises ValueError: When nothing is scheduled and no list was written before.
+    """
+    path = get_playout_path(display)
+    assets = get_scheduled_assets(display, moment)
+    paths = [
+        (asset.playback_file or asset.file).path
+        for asset in assets
+    ]
+    if not paths:
+        if os.path.exists(path):
+            logger.warning(f"Nothing scheduled for display {display.id}, keeping its current playout.")
+            return path
+        raise ValueError("Nothing in the playlist is scheduled now.")
+
+    content = build_ffconcat(paths, loop=display.loop != 0, self_name=os.path.basename(path))
+
+    try:
+        with open(path) as f:
+            if f.read() == content:
+                return path
+    except FileNotFoundError:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    temp_path = f"{path}.part"
+    with open(temp_path, 'w') as f:
+        f.write(content)
+    os.replace(temp_path, path)
+    logger.info(f"Playout of display {display.id} updated ({len(paths)} items).")
+    return path
@@ -0,0 +1,89 @@
+"""
+Display presence kept in Redis.
+
+Each place has a sorted set of its display ids scored by the last time they were
+seen: a websocket connect, any frame received on the socket (see
+``websocket.consumers``) or a post to ``api/display/heartbeat/``. Each display also
+has a small hash with the node serving it, the client version and its open socket
+count. Closing a socket only lowers that count, so a display is reported offline
+``PRESENCE_TIMEOUT`` seconds after it was last heard from. Online/offline counts are
+two ``ZCOUNT`` calls and never touch the SQL database.
+"""
+import socket
+import time
+
+from django.conf import settings
+
+from core.redis_client import get_async_redis, get_redis
+
+NODE = socket.gethostname()
+
+
+def get_place_key(place_id):
+    return f"presence:place:{place_id}"
+
+
+def get_display_key(display_id):
+    return f"presence:display:{display_id}"
+
+
+async def amark_seen(display_id, place_id, node=NODE, client_version=None, connections=0):
+    """
+    Records that a display was seen just now.
+
+    :param connections: Change of the display's open socket count (1 on connect).
+    """
+    now = time.time()
+    fields = {"node": node, "last_seen": now}
+    if client_version:
+        fields["client_version"] = client_version
+
+    async with get_async_redis().pipeline(transaction=False) as pipe:
+        pipe.zadd(get_place_key(place_id), {display_id: now})
+        pipe.hset(get_display_key(display_id), mapping=fields)
+        if connections:
+            pipe.hincrby(get_display_key(display_id), "connections", connections)
+        pipe.expire(get_display_key(display_id), settings.PRESENCE_RETENTION)
+        await pipe.execute()
+
+
+async def amark_disconnected(display_id):
+    """
+    Lowers the open socket count of a display without refreshing when it was last seen.
+    """
+    async with get_async_redis().pipeline(transaction=False) as pipe:
+        pipe.hincrby(get_display_key(display_id), "connections", -1)
+        pipe.expire(get_display_key(display_id), settings.PRESENCE_RETENTION)
+        await pipe.execute()
+
+
+def get_place_presence(place_id):
+    """
+    :return: ``{"online", "offline", "timeout"}`` counts for the displays of a place seen
+        within ``PRESENCE_RETENTION`` seconds.
+    """
+    now = time.time()
+    key = get_place_key(place_id)
+
+    with get_redis().pipeline(transaction=False) as pipe:
+        pipe.zremrangebyscore(key, '-inf', now - settings.PRESENCE_RETENTION)
+        pipe.zcount(key, now - settings.PRESENCE_TIMEOUT, '+inf')
+        pipe.zcard(key)
+        _, online, total = pipe.execute()
+
+    return {"online": online, "offline": total - online, "timeout": settings.PRESENCE_TIMEOUT}
+
+
+def get_display_presence(display_id):
+    """
+    :return: The presence hash of a display with ``online`` added, or None when it was never seen.
+    """
+    record = get_redis().hgetall(get_display_key(display_id))
+    if not record:
+        return None
+
+    presence = {key.decode(): value.decode() for key, value in record.items()}
+    presence["last_seen"] = float(presence["last_seen"])
+    presence["connections"] = int(presence.get("connections", 0))
+    presence["online"] = presence["last_seen"] >= time.time() - settings.PRESENCE_TIMEOUT
+    return presence
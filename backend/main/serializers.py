@@ -1,9 +1,31 @@
+import os
+
+from django.conf import settings
 from rest_framework import serializers
 
-from .models import DisplayLog
+from .models import DisplayLog, VideoUpload
 
 
 class DisplayLogSerializer(serializers.ModelSerializer):
     class Meta:
         model = DisplayLog
         fields = ['display', 'type', 'message']
+
+
+
+class VideoUploadSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = VideoUpload
+        fields = ['id', 'display', 'filename', 'size', 'offset', 'sha256', 'completed_at']
+        read_only_fields = ['id', 'offset', 'sha256', 'completed_at']
+
+    def validate_filename(self, value):
+        _, extension = os.path.splitext(value)
+        if extension.lower() != '.mp4':
+            raise serializers.ValidationError("Only mp4 files are allowed.")
+        return os.path.basename(value)
+
+    def validate_size(self, value):
+        if value > settings.VIDEO_UPLOAD_MAX_SIZE:
+            raise serializers.ValidationError(f"Uploads are limited to {settings.VIDEO_UPLOAD_MAX_SIZE} bytes.")
+        return value
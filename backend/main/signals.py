@@ -1,50 +1,64 @@
-from django.db.models.signals import post_save
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
-from asgiref.sync import async_to_sync
-from channels.layers import get_channel_layer
 
-from .models import Display, Ticker, TickerItem
-from websocket.serializers import DisplaySerializer
+from .broadcast import schedule_display_update
+from .models import MediaAsset, Display, DisplayToken, PlaylistItem, Ticker, TickerItem
+from .tasks import refresh_playout
+from .ticker_scheduler import publish_ticker_change
+from .token_cache import invalidate_display, invalidate_tokens
+from websocket.gateway import invalidate_display_ref
 
 
 @receiver(post_save, sender=Display)
 def display_updated(sender, instance, **kwargs):
-    channel_layer = get_channel_layer()
-    serializer = DisplaySerializer(instance)
-    async_to_sync(channel_layer.group_send)(
-        f"display_{instance.stream_key}",
-        {
-            "type": "display.update",
-            "data": serializer.data,
-        }
-    )
+    schedule_display_update(instance.id)
 
 
 @receiver(post_save, sender=Ticker)
+@receiver(post_delete, sender=Ticker)
 def ticker_updated(sender, instance, **kwargs):
-    display = instance.display
-    display_serializer = DisplaySerializer(display)
-    channel_layer = get_channel_layer()
-    async_to_sync(channel_layer.group_send)(
-        f"display_{display.stream_key}",
-        {
-            "type": "display.update",
-            "data": display_serializer.data
-        }
-    )
+    schedule_display_update(instance.display_id)
+    transaction.on_commit(partial(publish_ticker_change, instance.id))
 
 
 @receiver(post_save, sender=TickerItem)
+@receiver(post_delete, sender=TickerItem)
 def ticker_item_updated(sender, instance, **kwargs):
-    display = instance.ticker.display
-
-    display_serializer = DisplaySerializer(display)
-
-    channel_layer = get_channel_layer()
-    async_to_sync(channel_layer.group_send)(
-        f"display_{display.stream_key}",
-        {
-            "type": "display.update",
-            "data": display_serializer.data
-        }
-    )
+    if TickerItem.ticker.is_cached(instance):
+        display_id = instance.ticker.display_id
+    else:
+        display_id = Ticker.objects.filter(id=instance.ticker_id).values_list('display_id', flat=True).first()
+    if display_id is not None:
+        schedule_display_update(display_id)
+
+
+@receiver(post_save, sender=PlaylistItem)
+@receiver(post_delete, sender=PlaylistItem)
+def playlist_item_updated(sender, instance, **kwargs):
+    is_streaming = Display.objects.filter(id=instance.display_id, paused=False) \
+        .exclude(task_id__isnull=True).exclude(task_id='').exists()
+    if is_streaming:
+        transaction.on_commit(partial(refresh_playout.delay, instance.display_id))
+
+
+@receiver(post_save, sender=MediaAsset)
+def media_asset_updated(sender, instance, **kwargs):
+    schedule_display_update(*instance.displays.values_list('id', flat=True))
+
+
+@receiver(post_save, sender=DisplayToken)
+@receiver(post_delete, sender=DisplayToken)
+def display_token_changed(sender, instance, **kwargs):
+    invalidate_tokens(instance.key)
+
+
+@receiver(post_save, sender=Display)
+@receiver(post_delete, sender=Display)
+def display_changed(sender, instance, **kwargs):
+    invalidate_display(instance)
+    if kwargs.get('created', True):
+        # Creation clears a cached miss, deletion the cached reference.
+        invalidate_display_ref(instance.stream_key)
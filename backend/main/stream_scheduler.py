@@ -0,0 +1,215 @@
+"""
+Encode capacity registry and placement of streams on stream supervisor nodes.
+
+Every supervisor publishes its capacity (CPU cores by default) and current usage
+to ``stream_node:<node>`` in Redis, with a TTL refreshed by its loop, so dead
+nodes drop out on their own. A new stream reserves its cost on the least-loaded
+node that still fits and is sent to that node's channel; when no node fits, it is
+queued (``STREAM_QUEUE_WHEN_FULL``) until a supervisor frees capacity, or refused.
+"""
+import json
+import time
+
+from django.conf import settings
+
+from core.redis_client import get_redis
+from .streaming import publish_stream_command
+
+NODES_KEY = "stream_nodes"
+QUEUE_KEY = "stream_queue"
+QUEUE_COMMANDS_KEY = "stream_queue:commands"
+QUEUED = "queued"
+
+
+class NoCapacityError(ValueError):
+    pass
+
+
+def get_node_key(node):
+    return f"stream_node:{node}"
+
+
+def get_node_channel(node):
+    return f"{settings.STREAM_SUPERVISOR_CHANNEL}:{node}"
+
+
+def get_stream_cost(copy):
+    """
+    CPU cores a stream is expected to use: an encode uses ``STREAM_ENCODER_THREADS``, a remux very little.
+    """
+    return settings.STREAM_COPY_COST if copy else settings.STREAM_ENCODER_THREADS
+
+
+def register_node(node, capacity, used, streams):
+    """
+    Publishes the state of a supervisor node (called from its loop).
+    """
+    client = get_redis()
+    with client.pipeline(transaction=False) as pipe:
+        pipe.sadd(NODES_KEY, node)
+        pipe.hset(get_node_key(node), mapping={
+            "capacity": capacity,
+            "used": used,
+            "streams": streams,
+            "updated_at": time.time(),
+        })
+        pipe.expire(get_node_key(node), settings.STREAM_NODE_TTL)
+        pipe.execute()
+
+
+def unregister_node(node):
+    client = get_redis()
+    with client.pipeline(transaction=False) as pipe:
+        pipe.srem(NODES_KEY, node)
+        pipe.delete(get_node_key(node))
+        pipe.execute()
+
+
+def release_reservation(node, cost):
+    get_redis().hincrbyfloat(get_node_key(node), "reserved", -cost)
+
+
+def get_reserved(node):
+    """
+    :return: Cores reserved on ``node`` for streams sent to it but not started yet.
+    """
+    reserved = get_redis().hget(get_node_key(node), "reserved")
+    return max(float(reserved), 0) if reserved else 0
+
+
+def get_nodes():
+    """
+    :return: Live nodes as dicts with ``node``, ``capacity``, ``used``, ``reserved``, ``streams`` and ``free``.
+    """
+    client = get_redis()
+    names = sorted(name.decode() for name in client.smembers(NODES_KEY))
+
+    with client.pipeline(transaction=False) as pipe:
+        for name in names:
+            pipe.hgetall(get_node_key(name))
+        records = pipe.execute()
+
+    nodes = []
+    for name, record in zip(names, records):
+        if not record:
+            # Expired: the supervisor stopped refreshing it.
+            client.srem(NODES_KEY, name)
+            continue
+        record = {key.decode(): float(value) for key, value in record.items()}
+        capacity = record.get("capacity", 0)
+        used = record.get("used", 0)
+        reserved = max(record.get("reserved", 0), 0)
+        nodes.append({
+            "node": name,
+            "capacity": capacity,
+            "used": used,
+            "reserved": reserved,
+            "streams": int(record.get("streams", 0)),
+            "free": capacity - used - reserved,
+        })
+    return nodes
+
+
+def reserve_node(cost, nodes=None):
+    """
+    Reserves ``cost`` on the least-loaded node with room for it.
+
+    :param nodes: ``get_nodes()``, when the caller already has it.
+    :return: The node name, or None when every node is full.
+    """
+    client = get_redis()
+    candidates = sorted(
+        (node for node in (get_nodes() if nodes is None else nodes) if node["free"] >= cost and node["capacity"] > 0),
+        key=lambda node: (node["used"] + node["reserved"]) / node["capacity"],
+    )
+    for node in candidates:
+        reserved = client.hincrbyfloat(get_node_key(node["node"]), "reserved", cost)
+        if node["used"] + reserved <= node["capacity"]:
+            return node["node"]
+        # Lost a race with another placement, undo and try the next node.
+        client.hincrbyfloat(get_node_key(node["node"]), "reserved", -cost)
+    return None
+
+
+def schedule_stream(stream_key, video_path, loop=None, copy=False):
+    """
+    Places a stream on a supervisor node, or queues it when every node is full.
+
+    :return: The node the stream was sent to, or ``QUEUED``.
+    :raises NoCapacityError: When no supervisor is running, or none can take the stream and
+        queueing is disabled.
+    """
+    stream_key = str(stream_key)
+    cost = get_stream_cost(copy)
+    command = {"video_path": video_path, "loop": loop, "copy": copy}
+
+    nodes = get_nodes()
+    if not nodes:
+        # Nothing would ever drain the queue.
+        raise NoCapacityError("No stream supervisor is running.")
+
+    node = reserve_node(cost, nodes)
+    if node is not None:
+        unqueue_stream(stream_key)
+        # A restart may land on another node than the one running the stream now.
+        publish_stream_command("stop", stream_key, keep_node=node)
+        if publish_stream_command("start", stream_key, node=node, reserved=cost, **command):
+            return node
+        release_reservation(node, cost)
+
+    if not settings.STREAM_QUEUE_WHEN_FULL:
+        raise NoCapacityError("No stream supervisor has free encode capacity.")
+
+    client = get_redis()
+    with client.pipeline() as pipe:
+        pipe.lrem(QUEUE_KEY, 0, stream_key)
+        pipe.rpush(QUEUE_KEY, stream_key)
+        pipe.hset(QUEUE_COMMANDS_KEY, stream_key, json.dumps(command))
+        pipe.execute()
+    return QUEUED
+
+
+def unqueue_stream(stream_key):
+    client = get_redis()
+    with client.pipeline() as pipe:
+        pipe.lrem(QUEUE_KEY, 0, str(stream_key))
+        pipe.hdel(QUEUE_COMMANDS_KEY, str(stream_key))
+        pipe.execute()
+
+
+def pop_queued_stream(free):
+    """
+    Takes the oldest queued stream if it fits in ``free`` cores.
+
+    :return: ``(stream_key, command)`` or None.
+    """
+    client = get_redis()
+    stream_key = client.lindex(QUEUE_KEY, 0)
+    if stream_key is None:
+        return None
+
+    raw = client.hget(QUEUE_COMMANDS_KEY, stream_key)
+    if raw is None:
+        client.lrem(QUEUE_KEY, 1, stream_key)
+        return None
+
+    command = json.loads(raw)
+    if get_stream_cost(command.get("copy", False)) > free:
+        return None
+    # LREM tells us whether another supervisor took it first.
+    if not client.lrem(QUEUE_KEY, 1, stream_key):
+        return None
+    client.hdel(QUEUE_COMMANDS_KEY, stream_key)
+    return stream_key.decode(), command
+
+
+def get_capacity_report():
+    nodes = get_nodes()
+    return {
+        "nodes": nodes,
+        "capacity": sum(node["capacity"] for node in nodes),
+        "used": sum(node["used"] for node in nodes),
+        "reserved": sum(node["reserved"] for node in nodes),
+        "streams": sum(node["streams"] for node in nodes),
+        "queued": get_redis().llen(QUEUE_KEY),
+    }
@@ -0,0 +1,203 @@
+"""
+Per-stream ffmpeg telemetry.
+
+Streams are started with ``-progress pipe:1``, so ffmpeg writes a block of
+``key=value`` lines to stdout at every stats period, ending with
+``progress=continue`` (or ``progress=end``). The stream supervisor reads those
+pipes without blocking, keeps the recent samples of each stream in a ring
+buffer and periodically publishes a summary to ``stream_telemetry:<stream key>``
+in Redis, which the display admin and the metrics endpoint read.
+"""
+import time
+from collections import deque
+
+from django.conf import settings
+
+from core.redis_client import get_redis
+
+TELEMETRY_SET_KEY = "stream_telemetry"
+
+# Fields published per stream, with their Prometheus metric and help text.
+METRICS = [
+    ("fps", "stream_fps", "gauge", "Frames per second encoded, as reported by ffmpeg."),
+    ("bitrate", "stream_bitrate_kbps", "gauge", "Output bitrate in kbit/s."),
+    ("speed", "stream_speed", "gauge", "Encoding speed relative to real time."),
+    ("avg_fps", "stream_fps_avg", "gauge", "Average fps over the telemetry ring buffer."),
+    ("avg_speed", "stream_speed_avg", "gauge", "Average speed over the telemetry ring buffer."),
+    ("drop_frames", "stream_dropped_frames", "counter", "Frames dropped since the encoder started."),
+    ("dup_frames", "stream_duplicated_frames", "counter", "Frames duplicated since the encoder started."),
+    ("restarts", "stream_restarts", "counter", "Encoder restarts since the stream was started."),
+]
+
+
+def get_telemetry_key(stream_key):
+    return f"stream_telemetry:{stream_key}"
+
+
+def parse_number(value):
+    """
+    Parses ffmpeg progress values such as ``29.97``, ``1543.2kbits/s``, ``1.01x`` or ``N/A``.
+    """
+    value = value.strip().removesuffix("kbits/s").removesuffix("x")
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+class ProgressParser:
+    """
+    Incremental parser of ``-progress`` output; partial lines are kept until the next read.
+    """
+
+    def __init__(self):
+        self.buffer = b""
+        self.current = {}
+
+    def feed(self, data):
+        """
+        :return: The samples completed by ``data``, as dicts of floats.
+        """
+        self.buffer += data
+        *lines, self.buffer = self.buffer.split(b"\n")
+
+        samples = []
+        for line in lines:
+            key, _, value = line.decode(errors="replace").partition("=")
+            key = key.strip()
+            if key == "progress":
+                samples.append({
+                    "fps": self.current.get("fps"),
+                    "bitrate": self.current.get("bitrate"),
+                    "speed": self.current.get("speed"),
+                    "frame": self.current.get("frame"),
+                    "drop_frames": self.current.get("drop_frames"),
+                    "dup_frames": self.current.get("dup_frames"),
+                    "out_time": (self.current.get("out_time_us") or 0) / 1_000_000,
+                })
+            elif key in ("fps", "bitrate", "speed", "frame", "drop_frames", "dup_frames", "out_time_us"):
+                # ``N/A`` (e.g. before the first frame) keeps the last known value.
+                number = parse_number(value)
+                if number is not None:
+                    self.current[key] = number
+        return samples
+
+
+class StreamTelemetry:
+    """
+    Ring buffer of the recent progress samples of one stream.
+    """
+
+    def __init__(self, size=None):
+        self.samples = deque(maxlen=size or settings.STREAM_TELEMETRY_SAMPLES)
+        self.parser = ProgressParser()
+        self.restarts = 0
+        self.published_at = 0
+        self.progressed_at = time.monotonic()
+
+    def feed(self, data):
+        last = self.samples[-1]["out_time"] if self.samples else 0
+        samples = self.parser.feed(data)
+        self.samples.extend(samples)
+        # Output time moving forward is what tells a working encoder from a stalled one.
+        if samples and samples[-1]["out_time"] != last:
+            self.progressed_at = time.monotonic()
+
+    def reset(self, restarted=True):
+        """
+        Starts over with a new encoder; the restart count is kept.
+
+        :param restarted: Whether the encoder is replaced after a failure and counts as a restart.
+        """
+        self.parser = ProgressParser()
+        if restarted:
+            self.restarts += 1
+        self.progressed_at = time.monotonic()
+
+    def summary(self):
+        latest = self.samples[-1] if self.samples else {}
+        summary = {key: value for key, value in latest.items() if value is not None}
+        for field in ("fps", "speed"):
+            values = [sample[field] for sample in self.samples if sample.get(field) is not None]
+            if values:
+                summary[f"avg_{field}"] = round(sum(values) / len(values), 3)
+        summary["restarts"] = self.restarts
+        return summary
+
+
+def publish_telemetry(stream_key, node, telemetry, force=False):
+    """
+    Writes the summary of a stream to Redis, at most every ``STREAM_TELEMETRY_INTERVAL`` seconds.
+    """
+    now = time.monotonic()
+    if not force and now - telemetry.published_at < settings.STREAM_TELEMETRY_INTERVAL:
+        return
+    telemetry.published_at = now
+
+    key = get_telemetry_key(stream_key)
+    client = get_redis()
+    with client.pipeline(transaction=False) as pipe:
+        pipe.delete(key)
+        pipe.hset(key, mapping={**telemetry.summary(), "node": node, "updated_at": time.time()})
+        pipe.expire(key, settings.STREAM_TELEMETRY_INTERVAL * 3)
+        pipe.sadd(TELEMETRY_SET_KEY, str(stream_key))
+        pipe.execute()
+
+
+def clear_telemetry(stream_key):
+    client = get_redis()
+    with client.pipeline(transaction=False) as pipe:
+        pipe.delete(get_telemetry_key(stream_key))
+        pipe.srem(TELEMETRY_SET_KEY, str(stream_key))
+        pipe.execute()
+
+
+def decode_telemetry(record):
+    telemetry = {}
+    for key, value in record.items():
+        key, value = key.decode(), value.decode()
+        telemetry[key] = value if key == "node" else parse_number(value)
+    return telemetry
+
+
+def get_telemetry(stream_key):
+    """
+    :return: The latest telemetry of a stream, or None when it is not running.
+    """
+    record = get_redis().hgetall(get_telemetry_key(stream_key))
+    return decode_telemetry(record) if record else None
+
+
+def get_all_telemetry():
+    """
+    :return: ``{stream_key: telemetry}`` of every running stream.
+    """
+    client = get_redis()
+    stream_keys = sorted(key.decode() for key in client.smembers(TELEMETRY_SET_KEY))
+
+    with client.pipeline(transaction=False) as pipe:
+        for stream_key in stream_keys:
+            pipe.hgetall(get_telemetry_key(stream_key))
+        records = pipe.execute()
+
+    telemetry = {}
+    for stream_key, record in zip(stream_keys, records):
+        if record:
+            telemetry[stream_key] = decode_telemetry(record)
+        else:
+            client.srem(TELEMETRY_SET_KEY, stream_key)
+    return telemetry
+
+
+def render_metrics(telemetry):
+    """
+    Renders ``get_all_telemetry()`` in the Prometheus text exposition format.
+    """
+    lines = []
+    for field, name, kind, help_text in METRICS:
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for stream_key, values in telemetry.items():
+            if values.get(field) is not None:
+                lines.append(f'{name}{{stream_key="{stream_key}",node="{values.get("node", "")}"}} {values[field]}')
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,179 @@
+import json
+import os
+
+from django.conf import settings
+
+from core.redis_client import get_redis
+
+
+def build_ffmpeg_command(video_path, stream_key, loop_flag=None, copy=False):
+    """
+    Builds the ffmpeg command that pushes a video file to the RTMP server.
+
+    With ``copy`` the input must already be a normalized playback rendition
+    (see ``build_transcode_command``) and is forwarded without re-encoding.
+    A ``.ffconcat`` playout list is re-encoded, as its items may differ in size.
+    Progress is written to stdout, so the caller must read it (or discard it).
+    """
+    loop_flag = ["-stream_loop", "-1"] if loop_flag else []
+    # Machine-readable progress on stdout, read by the supervisor (see main.stream_telemetry)
+    progress_flag = ["-progress", "pipe:1", "-nostats"]
+    input_flag = ['-i', video_path]
+
+    if video_path.endswith('.ffconcat'):
+        # Playout list (see main.playout): it loops by referencing itself.
+        loop_flag = []
+        input_flag = ['-f', 'concat', '-safe', '0', '-i', video_path]
+
+    if copy:
+        return [
+            'ffmpeg', *progress_flag, *loop_flag, '-re',
+            *input_flag,
+            '-c', 'copy',
+            '-f', 'flv',
+            f'rtmp://nginx_rtmp:1935/stream/{stream_key}'
+        ]
+
+    # Flags for threading and preset
+    threads_flag = ["-threads", str(settings.STREAM_ENCODER_THREADS)]
+    preset_flag = ["-preset", "veryfast"]
+
+    # Optional CRF value and buffer size for optimization
+    crf_flag = ["-crf", "23"]
+    buffer_flag = ["-bufsize", "2000k"]
+
+    return [
+        'ffmpeg', *progress_flag, *loop_flag, '-re',
+        *input_flag,
+        '-c:v', 'libx264',
+        '-c:a', 'aac',
+        *threads_flag, *preset_flag, *crf_flag, *buffer_flag,
+        '-f', 'flv',
+        f'rtmp://nginx_rtmp:1935/stream/{stream_key}'
+    ]
+
+
+def build_transcode_command(video_path, output_path):
+    """
+    Builds the ffmpeg command that normalizes an upload into an RTMP/HLS-ready
+    H.264/AAC rendition with a fixed GOP of ``settings.STREAM_GOP_SECONDS``.
+    """
+    gop = settings.STREAM_GOP_SECONDS
+    return [
+        'ffmpeg', '-y', '-v', 'error',
+        '-i', video_path,
+        '-c:v', 'libx264', '-preset', 'medium', '-crf', '23',
+        '-profile:v', 'high', '-pix_fmt', 'yuv420p',
+        '-force_key_frames', f'expr:gte(t,n_forced*{gop})', '-sc_threshold', '0',
+        '-c:a', 'aac', '-b:a', '128k', '-ar', '44100', '-ac', '2',
+        '-movflags', '+faststart',
+        '-f', 'mp4',
+        output_path,
+    ]
+
+
+def build_segment_command(video_path, output_dir):
+    """
+    Builds the ffmpeg command that cuts a normalized rendition into a VOD HLS playlist.
+
+    Segments are stream-copied, so segment boundaries follow the fixed GOP of the rendition.
+    """
+    return [
+        'ffmpeg', '-y', '-v', 'error',
+        '-i', video_path,
+        '-c', 'copy',
+        '-f', 'hls',
+        '-hls_time', str(settings.HLS_SEGMENT_SECONDS),
+        '-hls_playlist_type', 'vod',
+        '-hls_segment_type', 'mpegts',
+        '-hls_segment_filename', os.path.join(output_dir, 'seg_%05d.ts'),
+        os.path.join(output_dir, 'index.m3u8'),
+    ]
+
+
+def select_rungs(ladder, source_height):
+    """
+    Returns the ladder rungs that do not upscale the source (at least the lowest rung).
+    """
+    rungs = sorted(ladder, key=lambda rung: rung['height'], reverse=True)
+    if not source_height:
+        return rungs
+    selected = [rung for rung in rungs if rung['height'] <= source_height]
+    return selected or rungs[-1:]
+
+
+def build_ladder_command(video_path, output_dir, rungs, has_audio=True):
+    """
+    Builds a single ffmpeg command that decodes the source once and writes one
+    HLS rendition per rung plus a ``master.m3u8`` referencing all of them.
+    """
+    gop = settings.STREAM_GOP_SECONDS
+    splits = ''.join(f'[v{i}]' for i in range(len(rungs)))
+    scales = ';'.join(f"[v{i}]scale=-2:{rung['height']}[v{i}o]" for i, rung in enumerate(rungs))
+
+    command = [
+        'ffmpeg', '-y', '-v', 'error',
+        '-i', video_path,
+        '-filter_complex', f'[0:v]split={len(rungs)}{splits};{scales}',
+    ]
+    stream_map = []
+    for i, rung in enumerate(rungs):
+        command += ['-map', f'[v{i}o]']
+        if has_audio:
+            command += ['-map', '0:a:0']
+        command += [
+            f'-b:v:{i}', rung['video_bitrate'],
+            f'-maxrate:v:{i}', rung['video_bitrate'],
+            f'-bufsize:v:{i}', rung['video_bitrate'],
+        ]
+        stream_map.append(f"v:{i},a:{i},name:{rung['name']}" if has_audio else f"v:{i},name:{rung['name']}")
+
+    command += [
+        '-c:v', 'libx264', '-preset', 'veryfast', '-profile:v', 'main', '-pix_fmt', 'yuv420p',
+        '-force_key_frames', f'expr:gte(t,n_forced*{gop})', '-sc_threshold', '0',
+    ]
+    if has_audio:
+        command += ['-c:a', 'aac', '-b:a', '128k', '-ac', '2']
+
+    command += [
+        '-f', 'hls',
+        '-hls_time', str(settings.HLS_SEGMENT_SECONDS),
+        '-hls_playlist_type', 'vod',
+        '-hls_segment_filename', os.path.join(output_dir, '%v', 'seg_%05d.ts'),
+        '-master_pl_name', 'master.m3u8',
+        '-var_stream_map', ' '.join(stream_map),
+        os.path.join(output_dir, '%v', 'index.m3u8'),
+    ]
+    return command
+
+
+def is_playback_ready(metadata):
+    """
+    Returns True if probed metadata already matches the normalized playback format,
+    so the upload can be stream-copied without transcoding it first.
+    """
+    video = metadata.get('video') or {}
+    audio = metadata.get('audio')
+    keyframe_interval = video.get('keyframe_interval')
+
+    return (
+        video.get('codec') == 'h264'
+        and video.get('pix_fmt') == 'yuv420p'
+        and (audio is None or audio.get('codec') == 'aac')
+        and keyframe_interval is not None
+        and abs(keyframe_interval - settings.STREAM_GOP_SECONDS) < 0.1
+    )
+
+
+def publish_stream_command(action, stream_key, node=None, **payload):
+    """
+    Sends a command to the stream supervisors over Redis pub/sub.
+
+    :param action: One of ``start`` or ``stop``.
+    :param stream_key: The display stream key the command applies to.
+    :param node: Only send to this supervisor (see ``main.stream_scheduler``), else to all.
+    :return: The number of supervisors that received the command.
+    """
+    channel = settings.STREAM_SUPERVISOR_CHANNEL if node is None else f"{settings.STREAM_SUPERVISOR_CHANNEL}:{node}"
+    message = {"action": action, "stream_key": str(stream_key), **payload}
+    return get_redis().publish(channel, json.dumps(message))
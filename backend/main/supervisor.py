@@ -0,0 +1,365 @@
+import json
+import logging
+import os
+import random
+import selectors
+import socket
+import subprocess
+import time
+
+from django.conf import settings
+
+from core.redis_client import get_redis
+from .stream_scheduler import (
+    get_node_channel,
+    get_reserved,
+    get_stream_cost,
+    pop_queued_stream,
+    register_node,
+    release_reservation,
+    unregister_node,
+)
+from .stream_telemetry import StreamTelemetry, clear_telemetry, publish_telemetry
+from .streaming import build_ffmpeg_command
+
+logger = logging.getLogger(__name__)
+
+
+def get_restart_delay(attempt):
+    """
+    Seconds to wait before restart ``attempt`` (1-based): exponential and capped, jittered
+    over its upper half so streams that failed together do not restart in lockstep.
+    """
+    delay = min(settings.STREAM_RESTART_BACKOFF_MIN * 2 ** (attempt - 1), settings.STREAM_RESTART_BACKOFF_MAX)
+    return random.uniform(delay / 2, delay)
+
+
+class StreamSupervisor:
+    """
+    Long-running process that owns every ffmpeg child on this host.
+
+    Commands arrive over Redis pub/sub (see ``main.streaming.publish_stream_command``),
+    so an idle supervisor blocks on the subscription instead of polling the database.
+    The database is only written on state transitions (stream started / stream ended).
+
+    Its encode capacity and usage are registered in Redis (see ``main.stream_scheduler``)
+    so new streams are placed on the least-loaded node; whenever capacity frees up,
+    the supervisor takes waiting streams off the shared queue.
+
+    Encoders that crash or stop making progress are restarted with exponential
+    backoff and jitter, and given up on after ``STREAM_MAX_RESTARTS`` attempts;
+    every failure is written to the display's log.
+
+    ffmpeg writes ``-progress`` output to its stdout pipe, which is read without
+    blocking on every pass of the loop (see ``main.stream_telemetry``), so a full
+    pipe never stalls an encoder.
+
+    Stopped encoders get SIGTERM and are collected by ``reap`` (SIGKILL after a
+    timeout), so one slow ffmpeg never holds up the loop; a stream restarted on
+    the same key waits for its old encoder to exit before publishing again.
+    """
+
+    def __init__(self, node=None, channel=None, poll_interval=1.0, capacity=None):
+        self.node = node or socket.gethostname()
+        self.channel = channel or settings.STREAM_SUPERVISOR_CHANNEL
+        self.poll_interval = poll_interval
+        self.capacity = capacity or settings.STREAM_NODE_CAPACITY or os.cpu_count() or 1
+        self.processes = {}
+        self.costs = {}
+        self.commands = {}
+        self.telemetry = {}
+        self.started_at = {}
+        self.failures = {}
+        self.restarts_due = {}
+        # (stream key, process, kill deadline) of encoders asked to exit
+        self.stopping = []
+        self.selector = selectors.DefaultSelector()
+        self.registered_at = 0
+        self._running = False
+
+    @property
+    def used(self):
+        return sum(self.costs.values())
+
+    def run(self):
+        pubsub = get_redis().pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(self.channel, get_node_channel(self.node))
+        self._running = True
+        logger.info(f"Stream supervisor {self.node} listening on '{self.channel}' ({self.capacity} cores).")
+
+        try:
+            self.resume_streams()
+            while self._running:
+                message = pubsub.get_message(timeout=self.poll_interval)
+                if message is not None:
+                    self.handle_message(message["data"])
+                self.read_progress()
+                self.reap()
+                self.check_stalls()
+                self.restart_due()
+                self.drain_queue()
+                self.register()
+        finally:
+            pubsub.close()
+            self.stop_all()
+            self.selector.close()
+            unregister_node(self.node)
+
+    def register(self, force=False):
+        """
+        Refreshes this node in the capacity registry, at most every third of its TTL.
+        """
+        now = time.monotonic()
+        if force or now - self.registered_at >= settings.STREAM_NODE_TTL / 3:
+            register_node(self.node, self.capacity, self.used, len(self.processes))
+            self.registered_at = now
+
+    def drain_queue(self):
+        """
+        Starts queued streams while this node has free capacity, net of the
+        cores reserved for streams already sent to it.
+        """
+        while self._running:
+            queued = pop_queued_stream(self.capacity - self.used - get_reserved(self.node))
+            if queued is None:
+                return
+            stream_key, command = queued
+            self.start(stream_key, command.get("video_path"), command.get("loop"), command.get("copy", False))
+
+    def shutdown(self, *args):
+        self._running = False
+
+    def handle_message(self, raw):
+        try:
+            command = json.loads(raw)
+            action = command["action"]
+            stream_key = command["stream_key"]
+        except (ValueError, KeyError, TypeError):
+            logger.warning(f"Ignoring malformed stream command: {raw!r}")
+            return
+
+        if action == "start":
+            try:
+                self.start(stream_key, command.get("video_path"), command.get("loop"), command.get("copy", False))
+            finally:
+                if command.get("reserved"):
+                    release_reservation(self.node, command["reserved"])
+        elif action == "stop":
+            if command.get("keep_node") != self.node:
+                self.stop(stream_key)
+        else:
+            logger.warning(f"Unknown stream command '{action}' for {stream_key}.")
+
+    def resume_streams(self):
+        """
+        Restarts the streams this node owned before it went down.
+        """
+        from .models import Display
+
+        displays = Display.objects.filter(task_id__startswith=f"{self.node}:", paused=False)
+        for display in displays:
+            if display.current_video or display.has_playlist:
+                video_path, copy = display.get_playback_source()
+                self.start(str(display.stream_key), video_path, display.loop, copy)
+
+    def start(self, stream_key, video_path, loop=None, copy=False):
+        if not video_path:
+            logger.warning(f"No video given for stream {stream_key}.")
+            return
+
+        # A new command starts over, whatever the restart history of the stream.
+        self.failures.pop(stream_key, None)
+        self.restarts_due.pop(stream_key, None)
+        if stream_key in self.processes or self.is_stopping(stream_key):
+            if stream_key in self.processes:
+                self.terminate(stream_key)
+            # Spawned by restart_due() once the old encoder is gone; its capacity stays counted.
+            self.commands[stream_key] = (video_path, loop, copy)
+            self.costs[stream_key] = get_stream_cost(copy)
+            self.restarts_due[stream_key] = time.monotonic()
+            return
+        self.spawn(stream_key, video_path, loop, copy)
+
+    def spawn(self, stream_key, video_path, loop=None, copy=False):
+        from .models import Display
+
+        self.commands[stream_key] = (video_path, loop, copy)
+        self.costs[stream_key] = get_stream_cost(copy)
+        self.telemetry.setdefault(stream_key, StreamTelemetry()).progressed_at = time.monotonic()
+        self.started_at[stream_key] = time.monotonic()
+        try:
+            process = subprocess.Popen(
+                build_ffmpeg_command(video_path, stream_key, loop, copy),
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL,
+            )
+        except OSError as e:
+            # Out of file descriptors or processes, missing binary... retried like a crash.
+            self.fail(stream_key, f"ffmpeg could not be started ({e})")
+            return
+
+        os.set_blocking(process.stdout.fileno(), False)
+        self.selector.register(process.stdout, selectors.EVENT_READ, stream_key)
+        self.processes[stream_key] = process
+        self.register(force=True)
+        Display.objects.filter(stream_key=stream_key).update(task_id=f"{self.node}:{process.pid}")
+        logger.info(f"Stream {stream_key} started (pid {process.pid}).")
+
+    def stop(self, stream_key):
+        if stream_key not in self.commands:
+            return
+
+        if stream_key in self.processes:
+            self.terminate(stream_key)
+        self.finish(stream_key)
+        logger.info(f"Stream {stream_key} paused and stopped.")
+
+    def finish(self, stream_key):
+        """
+        Forgets a stream that is not coming back and frees its capacity.
+        """
+        from .models import Display
+
+        for state in (self.commands, self.costs, self.telemetry, self.started_at, self.failures, self.restarts_due):
+            state.pop(stream_key, None)
+        clear_telemetry(stream_key)
+        Display.objects.filter(stream_key=stream_key).update(task_id="")
+
+    def terminate(self, stream_key, timeout=10):
+        """
+        Asks an encoder to exit without waiting for it; ``reap`` kills it after ``timeout`` seconds.
+        """
+        process = self.processes.pop(stream_key)
+        self.close_pipe(process)
+        process.terminate()
+        self.stopping.append((stream_key, process, time.monotonic() + timeout))
+
+    def is_stopping(self, stream_key):
+        return any(key == stream_key for key, _, _ in self.stopping)
+
+    def close_pipe(self, process):
+        try:
+            self.selector.unregister(process.stdout)
+        except KeyError:
+            pass
+        process.stdout.close()
+
+    def read_progress(self):
+        """
+        Reads whatever ``-progress`` output is pending, without waiting for more.
+        """
+        for key, _ in self.selector.select(timeout=0):
+            stream_key = key.data
+            try:
+                data = os.read(key.fd, 65536)
+            except BlockingIOError:
+                continue
+            if not data:
+                # EOF: the child is exiting, reap() collects it.
+                self.selector.unregister(key.fileobj)
+                continue
+
+            telemetry = self.telemetry[stream_key]
+            telemetry.feed(data)
+            publish_telemetry(stream_key, self.node, telemetry)
+
+    def reap(self):
+        """
+        Collects children that exited: a clean exit of a non-looping stream (a video or
+        a playout list without its self-reference, see ``main.playout``) finishes it,
+        any other exit is a failure that is restarted.
+        """
+        now = time.monotonic()
+        for entry in list(self.stopping):
+            _, process, kill_at = entry
+            if process.poll() is not None:
+                self.stopping.remove(entry)
+            elif kill_at <= now:
+                process.kill()
+
+        for stream_key, process in list(self.processes.items()):
+            if process.poll() is None:
+                continue
+
+            del self.processes[stream_key]
+            self.close_pipe(process)
+            video_path, loop, copy = self.commands[stream_key]
+            if process.returncode == 0 and not loop:
+                self.finish(stream_key)
+                logger.info(f"Stream {stream_key} finished.")
+            else:
+                self.fail(stream_key, f"ffmpeg exited with code {process.returncode}")
+
+    def check_stalls(self):
+        """
+        Kills encoders whose output time has not advanced for ``STREAM_STALL_TIMEOUT`` seconds.
+        """
+        deadline = time.monotonic() - settings.STREAM_STALL_TIMEOUT
+        for stream_key in list(self.processes):
+            if self.telemetry[stream_key].progressed_at < deadline:
+                self.terminate(stream_key, timeout=2)
+                self.fail(stream_key, f"ffmpeg made no progress for {settings.STREAM_STALL_TIMEOUT}s")
+
+    def fail(self, stream_key, reason):
+        """
+        Schedules a restart with backoff, or gives up after ``STREAM_MAX_RESTARTS`` failures in a row.
+
+        A stream that ran for ``STREAM_RESTART_RESET`` seconds before failing starts counting again.
+        Its capacity stays reserved on this node while it waits.
+        """
+        from .models import Display, DisplayLog
+
+        ran = time.monotonic() - self.started_at.pop(stream_key, time.monotonic())
+        failures = 1 if ran >= settings.STREAM_RESTART_RESET else self.failures.get(stream_key, 0) + 1
+
+        if failures > settings.STREAM_MAX_RESTARTS:
+            self.finish(stream_key)
+            self.log_event(
+                stream_key,
+                DisplayLog.TypeChoices.ERROR,
+                f"Stream stopped after {settings.STREAM_MAX_RESTARTS} failed restarts: {reason}.",
+            )
+            return
+
+        delay = get_restart_delay(failures)
+        self.failures[stream_key] = failures
+        self.restarts_due[stream_key] = time.monotonic() + delay
+        Display.objects.filter(stream_key=stream_key).update(task_id=f"{self.node}:restarting")
+        self.log_event(
+            stream_key,
+            DisplayLog.TypeChoices.WARNING,
+            f"{reason}, restarting in {delay:.1f}s (attempt {failures} of {settings.STREAM_MAX_RESTARTS}).",
+        )
+
+    def restart_due(self):
+        now = time.monotonic()
+        for stream_key, due in list(self.restarts_due.items()):
+            if due > now or self.is_stopping(stream_key):
+                continue
+            del self.restarts_due[stream_key]
+            if stream_key in self.telemetry:
+                # Failed encoders are retried through fail(); a new start command cleared the failures.
+                self.telemetry[stream_key].reset(restarted=stream_key in self.failures)
+            self.spawn(stream_key, *self.commands[stream_key])
+
+    def log_event(self, stream_key, type, message):
+        from .models import Display, DisplayLog
+
+        logger.warning(f"Stream {stream_key}: {message}")
+        display_id = Display.objects.filter(stream_key=stream_key).values_list('id', flat=True).first()
+        if display_id is not None:
+            DisplayLog.objects.create(display_id=display_id, type=type, message=message)
+
+    def stop_all(self, timeout=10):
+        """
+        Stops every encoder on shutdown, waiting for them to exit.
+        """
+        for stream_key in list(self.processes):
+            self.terminate(stream_key, timeout=timeout)
+        for _, process, kill_at in self.stopping:
+            try:
+                process.wait(timeout=max(kill_at - time.monotonic(), 0))
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.wait()
+        self.stopping = []
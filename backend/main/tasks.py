@@ -1,24 +1,49 @@
-import time
+import logging
+import os
+import shutil
 import subprocess
 
 from celery import shared_task
-from moviepy import VideoFileClip
+from django.conf import settings
+from django.db.models import Q
+
+from .broadcast import queue_display_updates, send_display_update
+from .hls import parse_media_playlist, parse_master_playlist
+from .log_buffer import flush_logs
+from .log_partitions import apply_retention, ensure_partitions, is_partitioned, rollup_logs
+from .media_probe import probe_media
+from .playout import get_playout_path, remove_playout, write_playout
+from .stream_scheduler import QUEUED, schedule_stream, unqueue_stream
+from .streaming import (
+    publish_stream_command,
+    build_transcode_command,
+    build_segment_command,
+    build_ladder_command,
+    select_rungs,
+    is_playback_ready,
+)
+from .uploads import expire_uploads
+
+logger = logging.getLogger(__name__)
 
 
 @shared_task
 def update_video_duration(display_id):
     try:
-        from .models import Display
-        display = Display.objects.get(id=display_id)
+        from .models import Display, MediaAsset
+        display = Display.objects.select_related('media_asset').get(id=display_id)
 
         if display.current_video:
-            video_path = display.current_video.path
-
-            video = VideoFileClip(video_path)
-            duration = video.duration
+            asset = display.media_asset
+            if asset is None:
+                asset, created = MediaAsset.get_or_create_for_file(display.current_video)
+                display.media_asset = asset
+                display.save(update_fields=['media_asset'])
+                if created:
+                    asset.prepare()
+                    return "Media asset created, probing scheduled."
 
-            display.video_duration = duration
-            display.save(update_fields=['video_duration'])
+            duration = probe_asset(asset)
 
             return f"Video duration updated to {duration} seconds."
         else:
@@ -29,48 +54,313 @@ def update_video_duration(display_id):
         return f"An error occurred: {str(e)}"
 
 
+def probe_asset(asset):
+    """
+    Probes an asset (cached by content hash) and syncs its duration to every display using it.
+
+    :return: The duration in seconds.
+    """
+    _, metadata = probe_media(asset.file.path, sha256=asset.sha256)
+    asset.metadata = metadata
+    asset.duration = metadata['duration']
+    asset.save(update_fields=['metadata', 'duration'])
+
+    for display in asset.displays.exclude(video_duration=asset.duration):
+        display.video_duration = asset.duration
+        display.save(update_fields=['video_duration'])
+
+    return asset.duration
+
+
+@shared_task
+def probe_media_asset(asset_id):
+    """
+    First step of ``MediaAsset.prepare``, see ``probe_asset``.
+    """
+    try:
+        from .models import MediaAsset
+        asset = MediaAsset.objects.get(id=asset_id)
+
+        return f"Video duration updated to {probe_asset(asset)} seconds."
+    except MediaAsset.DoesNotExist:
+        return f"Media asset with ID {asset_id} does not exist."
+    except Exception as e:
+        return f"An error occurred: {str(e)}"
+
+
+@shared_task
+def transcode_media_asset(asset_id):
+    """
+    Normalizes an asset once into the stream-copy playback rendition.
+    """
+    try:
+        from .models import MediaAsset
+        asset = MediaAsset.objects.get(id=asset_id)
+
+        if not asset.metadata:
+            return "Media asset is not probed yet, no transcode."
+
+        if is_playback_ready(asset.metadata):
+            asset.playback_file.name = asset.file.name
+            asset.save(update_fields=['playback_file'])
+            return "Video is already playback ready, no transcode needed."
+
+        playback_name = f"{os.path.splitext(asset.file.name)[0]}.playback.mp4"
+        playback_path = asset.file.storage.path(playback_name)
+        temp_path = f"{playback_path}.part"
+
+        subprocess.run(build_transcode_command(asset.file.path, temp_path), check=True, capture_output=True)
+        os.replace(temp_path, playback_path)
+
+        asset.playback_file.name = playback_name
+        asset.save(update_fields=['playback_file'])
+
+        return f"Playback rendition written to {playback_name}."
+    except MediaAsset.DoesNotExist:
+        return f"Media asset with ID {asset_id} does not exist."
+    except Exception as e:
+        return f"An error occurred: {str(e)}"
+
+
+@shared_task
+def build_asset_renditions(asset_id):
+    """
+    Schedules the HLS segments / ABR ladder that the displays using an asset need.
+    """
+    try:
+        from .models import Display, MediaAsset
+        asset = MediaAsset.objects.get(id=asset_id)
+        displays = asset.displays.all()
+
+        if not asset.hls_segments and displays.filter(playback_mode=Display.PlaybackModeChoices.HLS).exists():
+            segment_media_asset.apply_async(args=[asset.id])
+
+        wants_abr = displays.filter(
+            Q(abr_enabled=True) | Q(abr_enabled__isnull=True, place__abr_enabled=True)
+        ).exists()
+        if not asset.abr_renditions and wants_abr:
+            build_rendition_ladder.apply_async(args=[asset.id])
+
+        return "Renditions scheduled."
+    except MediaAsset.DoesNotExist:
+        return f"Media asset with ID {asset_id} does not exist."
+    except Exception as e:
+        return f"An error occurred: {str(e)}"
+
+
 @shared_task
-def start_streaming(video_path, stream_key, loop_flag=None, inactivity_timeout=300):
-    from main.models import Display
-    loop_flag = ["-stream_loop", "-1"] if loop_flag else []
+def segment_media_asset(asset_id):
+    """
+    Cuts an asset's playback rendition into static HLS segments under ``settings.HLS_ROOT``.
+    """
+    try:
+        from .models import MediaAsset
+        asset = MediaAsset.objects.get(id=asset_id)
+
+        if not asset.playback_file:
+            return "No playback rendition available to segment."
+
+        output_dir = os.path.join(settings.HLS_ROOT, 'vod', asset.sha256)
+        temp_dir = f"{output_dir}.part"
+        shutil.rmtree(temp_dir, ignore_errors=True)
+        os.makedirs(temp_dir)
 
-    # Flags for threading and preset
-    threads_flag = ["-threads", "2"]
-    preset_flag = ["-preset", "veryfast"]
+        subprocess.run(
+            build_segment_command(asset.playback_file.path, temp_dir),
+            check=True,
+            capture_output=True,
+        )
+        with open(os.path.join(temp_dir, 'index.m3u8')) as f:
+            segments = parse_media_playlist(f.read())
 
-    # Optional CRF value and buffer size for optimization
-    crf_flag = ["-crf", "23"]
-    buffer_flag = ["-bufsize", "2000k"]
+        shutil.rmtree(output_dir, ignore_errors=True)
+        os.replace(temp_dir, output_dir)
 
-    ffmpeg_command = [
-        'ffmpeg', *loop_flag, '-re',
-        '-i', video_path,
-        '-c:v', 'libx264',
-        '-c:a', 'aac',
-        *threads_flag, *preset_flag, *crf_flag, *buffer_flag,
-        '-f', 'flv',
-        f'rtmp://nginx_rtmp:1935/stream/{stream_key}'
-    ]
+        asset.hls_segments = segments
+        asset.save(update_fields=['hls_segments'])
 
+        return f"Video cut into {len(segments)} HLS segments."
+    except MediaAsset.DoesNotExist:
+        return f"Media asset with ID {asset_id} does not exist."
+    except Exception as e:
+        return f"An error occurred: {str(e)}"
+
+
+@shared_task
+def build_rendition_ladder(asset_id):
+    """
+    Encodes an asset into the multi-bitrate HLS ladder of ``settings.VIDEO_RENDITION_LADDER``.
+    """
     try:
-        process = subprocess.Popen(ffmpeg_command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        display = Display.objects.get(stream_key=stream_key)
-        display.task_id = start_streaming.request.id
-        display.save(update_fields=['task_id'])
-
-        while True:
-            display = Display.objects.get(stream_key=stream_key)
-
-            if display.paused:
-                process.terminate()
-                display.task_id = ""
-                display.paused = False
-                display.save(update_fields=['paused', 'task_id'])
-                print(f"Stream {stream_key} paused and stopped.")
-                break
-            time.sleep(3)
-        process.wait()
-    except subprocess.CalledProcessError as e:
-        print(f"FFmpeg Error: {e}")
+        from .models import MediaAsset
+        asset = MediaAsset.objects.get(id=asset_id)
+
+        metadata = asset.metadata or {}
+        rungs = select_rungs(settings.VIDEO_RENDITION_LADDER, (metadata.get('video') or {}).get('height'))
+        has_audio = metadata.get('audio') is not None
+
+        output_dir = os.path.join(settings.HLS_ROOT, 'abr', asset.sha256)
+        temp_dir = f"{output_dir}.part"
+        shutil.rmtree(temp_dir, ignore_errors=True)
+        for rung in rungs:
+            os.makedirs(os.path.join(temp_dir, rung['name']))
+
+        subprocess.run(
+            build_ladder_command(asset.file.path, temp_dir, rungs, has_audio),
+            check=True,
+            capture_output=True,
+        )
+        with open(os.path.join(temp_dir, 'master.m3u8')) as f:
+            variants = parse_master_playlist(f.read())
+        for variant in variants:
+            variant['name'] = os.path.dirname(variant['uri'])
+            with open(os.path.join(temp_dir, variant['uri'])) as f:
+                variant['segments'] = parse_media_playlist(f.read())
+
+        shutil.rmtree(output_dir, ignore_errors=True)
+        os.replace(temp_dir, output_dir)
+
+        asset.abr_renditions = variants
+        asset.save(update_fields=['abr_renditions'])
+
+        return f"Built {len(variants)} renditions: {', '.join(v['name'] for v in variants)}."
+    except MediaAsset.DoesNotExist:
+        return f"Media asset with ID {asset_id} does not exist."
     except Exception as e:
-        print(f"Error: {e}")
+        return f"An error occurred: {str(e)}"
+
+
+@shared_task
+def flush_display_logs():
+    """
+    Drains the display log buffer into the database (scheduled by celery beat).
+    """
+    return f"{flush_logs()} display logs written."
+
+
+@shared_task
+def expire_video_uploads():
+    """
+    Discards incomplete video uploads that stopped receiving chunks (scheduled by celery beat).
+    """
+    return f"{expire_uploads()} expired video uploads discarded."
+
+
+@shared_task
+def rollup_display_logs():
+    """
+    Refreshes the hourly display log counts of the last ``DISPLAY_LOG_ROLLUP_HOURS`` hours.
+    """
+    return f"{rollup_logs()} hourly counts updated."
+
+
+@shared_task
+def maintain_display_log_partitions():
+    """
+    Pre-creates upcoming log partitions and drops the ones past retention.
+    """
+    if is_partitioned():
+        ensure_partitions()
+    removed = apply_retention()
+    if isinstance(removed, list):
+        return f"Dropped partitions: {', '.join(removed) or 'none'}."
+    return f"{removed} expired display logs deleted."
+
+
+@shared_task
+def broadcast_display_update(display_id):
+    """
+    Sends the current payload of a display to its websocket group (see ``main.broadcast``).
+    """
+    if send_display_update(display_id):
+        return f"Display {display_id} update broadcast."
+    return f"Display {display_id} is gone or unchanged."
+
+
+@shared_task
+def broadcast_display_updates(display_ids):
+    """
+    Sends the current payload of each display in ``display_ids`` to its websocket groups.
+    """
+    sent = sum(1 for display_id in display_ids if send_display_update(display_id))
+    return f"{sent}/{len(display_ids)} display updates broadcast."
+
+
+@shared_task
+def start_display_stream(display_id):
+    """
+    Places an RTMP display on a stream supervisor and marks it unpaused once it is started or queued.
+    """
+    from .models import Display
+
+    display = Display.objects.select_related('media_asset').get(id=display_id)
+    if not display.current_video and not display.has_playlist:
+        raise ValueError(f"No video file assigned to {display.name}.")
+
+    video_path, copy = display.get_playback_source()
+    node = schedule_stream(display.stream_key, video_path, loop=display.loop, copy=copy)
+
+    fields = {"paused": False}
+    if node == QUEUED:
+        fields["task_id"] = QUEUED
+    Display.objects.filter(id=display_id).update(**fields)
+    queue_display_updates([display_id])
+
+    if node == QUEUED:
+        return f"Queued stream for {display.name}, no encode capacity free."
+    return f"Started stream for {display.name} on {node}."
+
+
+@shared_task
+def stop_display_stream(stream_key):
+    unqueue_stream(stream_key)
+    if not publish_stream_command("stop", stream_key):
+        raise ValueError("No stream supervisor is running.")
+    return f"Stopped stream {stream_key}."
+
+
+@shared_task
+def refresh_playout(display_id):
+    """
+    Rewrites the playout list of a streaming display after a playlist change.
+
+    When the change gave the display its first playlist item, or took away its last,
+    the stream is restarted on the new source instead, or stopped when the display
+    has no video to fall back to.
+    """
+    from .models import Display
+
+    display = Display.objects.select_related('media_asset').get(id=display_id)
+    if display.has_playlist != os.path.exists(get_playout_path(display)):
+        if not display.has_playlist and not display.current_video:
+            display.pause_streaming()
+            remove_playout(display)
+            return f"Stopped stream of {display.name}, its playlist is empty."
+        return start_display_stream(display_id)
+    if not display.has_playlist:
+        return f"Display {display.name} has no playlist."
+    return write_playout(display)
+
+
+@shared_task
+def refresh_playouts():
+    """
+    Rewrites the playout lists of every streaming playlist display, so dayparts switch on time.
+    """
+    from .models import Display
+
+    displays = (
+        Display.objects
+        .filter(playlist_items__is_active=True, paused=False)
+        .exclude(task_id__isnull=True).exclude(task_id='')
+        .select_related('media_asset')
+        .distinct()
+    )
+    count = 0
+    for display in displays:
+        try:
+            write_playout(display)
+            count += 1
+        except (OSError, ValueError) as e:
+            logger.error(f"Could not refresh the playout of display {display.id}: {e}")
+    return f"{count} playouts refreshed."
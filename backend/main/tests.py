@@ -1,3 +1,570 @@
-from django.test import TestCase
+import datetime
+import hashlib
+import io
+import json
+import os
+import tempfile
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.admin.sites import site
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import IntegrityError, connection
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from core.redis_client import get_redis
+
+from .async_views import validate_log_entry
+from .hls import build_live_playlist, parse_master_playlist, parse_media_playlist
+from . import log_partitions
+from .log_buffer import BUFFER_KEY, DEAD_LETTER_KEY, FLUSH_LOCK_KEY, flush_logs
+from .models import Display, DisplayLog, DisplayToken, MediaAsset, Place, PlaylistItem, VideoUpload
+from .playout import build_ffconcat, get_playout_path, quote
+from .stream_telemetry import ProgressParser, StreamTelemetry, parse_number, render_metrics
+from .supervisor import StreamSupervisor, get_restart_delay
+from .tasks import refresh_playout
+from .token_cache import get_display_for_token, local_cache
+from .uploads import UploadOffsetMismatch, _hashers, append_chunk, get_lock_key, get_part_path
+
+PROGRESS_BLOCK = (
+    b"frame=120\nfps=29.97\nbitrate=1543.2kbits/s\nout_time_us=4000000\n"
+    b"dup_frames=1\ndrop_frames=0\nspeed=1.01x\nprogress=continue\n"
+)
+
+
+class BuildFfconcatTests(SimpleTestCase):
+    def test_looping_list_references_itself_with_safe_disabled(self):
+        content = build_ffconcat(['/media/a.mp4', "/media/it's.mp4"], loop=True, self_name='key.ffconcat')
+        self.assertEqual(content.splitlines(), [
+            'ffconcat version 1.0',
+            "file '/media/a.mp4'",
+            "file '/media/it'\\''s.mp4'",
+            "file 'key.ffconcat'",
+            'option safe 0',
+        ])
+
+    def test_list_without_loop_ends_after_last_item(self):
+        content = build_ffconcat(['/media/a.mp4'], loop=False, self_name='key.ffconcat')
+        self.assertEqual(content, "ffconcat version 1.0\nfile '/media/a.mp4'\n")
+
+    def test_quote(self):
+        self.assertEqual(quote("/a b/c'd"), "'/a b/c'\\''d'")
+
+
+class ProgressParserTests(SimpleTestCase):
+    def test_parse_number(self):
+        self.assertEqual(parse_number("29.97"), 29.97)
+        self.assertEqual(parse_number("1543.2kbits/s"), 1543.2)
+        self.assertEqual(parse_number(" 1.01x"), 1.01)
+        self.assertIsNone(parse_number("N/A"))
+
+    def test_block_becomes_one_sample(self):
+        samples = ProgressParser().feed(PROGRESS_BLOCK)
+        self.assertEqual(samples, [{
+            "fps": 29.97,
+            "bitrate": 1543.2,
+            "speed": 1.01,
+            "frame": 120,
+            "drop_frames": 0,
+            "dup_frames": 1,
+            "out_time": 4.0,
+        }])
+
+    def test_partial_lines_wait_for_the_next_read(self):
+        parser = ProgressParser()
+        self.assertEqual(parser.feed(PROGRESS_BLOCK[:30]), [])
+        samples = parser.feed(PROGRESS_BLOCK[30:])
+        self.assertEqual(len(samples), 1)
+        self.assertEqual(samples[0]["fps"], 29.97)
+
+    def test_unavailable_values_keep_the_last_known_one(self):
+        parser = ProgressParser()
+        parser.feed(PROGRESS_BLOCK)
+        samples = parser.feed(b"fps=N/A\nspeed=N/A\nout_time_us=N/A\nprogress=continue\n")
+        self.assertEqual(samples[0]["fps"], 29.97)
+        self.assertEqual(samples[0]["speed"], 1.01)
+        self.assertEqual(samples[0]["out_time"], 4.0)
+
+
+class StreamTelemetryTests(SimpleTestCase):
+    def test_ring_buffer_and_summary(self):
+        telemetry = StreamTelemetry(size=2)
+        for fps in (10, 20, 30):
+            telemetry.feed(f"fps={fps}\nspeed=1\nout_time_us={fps}000000\nprogress=continue\n".encode())
+
+        self.assertEqual(len(telemetry.samples), 2)
+        summary = telemetry.summary()
+        self.assertEqual(summary["fps"], 30)
+        self.assertEqual(summary["avg_fps"], 25)
+        self.assertEqual(summary["restarts"], 0)
+        self.assertNotIn("bitrate", summary)
+
+    def test_progress_is_only_output_time_moving_forward(self):
+        telemetry = StreamTelemetry(size=10)
+        with mock.patch("main.stream_telemetry.time.monotonic", return_value=100):
+            telemetry.feed(PROGRESS_BLOCK)
+        self.assertEqual(telemetry.progressed_at, 100)
+
+        with mock.patch("main.stream_telemetry.time.monotonic", return_value=200):
+            telemetry.feed(PROGRESS_BLOCK)
+        self.assertEqual(telemetry.progressed_at, 100)
+
+    def test_reset_counts_restarts(self):
+        telemetry = StreamTelemetry(size=10)
+        telemetry.feed(PROGRESS_BLOCK[:20])
+        telemetry.reset()
+        self.assertEqual(telemetry.parser.buffer, b"")
+        self.assertEqual(telemetry.summary()["restarts"], 1)
+
+    def test_reset_for_a_new_command_is_not_a_restart(self):
+        telemetry = StreamTelemetry(size=10)
+        telemetry.reset(restarted=False)
+        self.assertEqual(telemetry.summary()["restarts"], 0)
+
+
+class RenderMetricsTests(SimpleTestCase):
+    def test_exposition_format(self):
+        text = render_metrics({"abc": {"fps": 25.0, "restarts": 2.0, "node": "node-1"}})
+        lines = text.splitlines()
+        self.assertIn("# TYPE stream_fps gauge", lines)
+        self.assertIn('stream_fps{stream_key="abc",node="node-1"} 25.0', lines)
+        self.assertIn('stream_restarts{stream_key="abc",node="node-1"} 2.0', lines)
+        self.assertFalse(any(line.startswith("stream_bitrate_kbps{") for line in lines))
+        self.assertTrue(text.endswith("\n"))
+
+    def test_no_streams(self):
+        self.assertFalse(any(not line.startswith("#") for line in render_metrics({}).splitlines()))
+
+
+@override_settings(STREAM_RESTART_BACKOFF_MIN=2, STREAM_RESTART_BACKOFF_MAX=120)
+class RestartDelayTests(SimpleTestCase):
+    def test_exponential_within_the_upper_half(self):
+        for attempt, delay in ((1, 2), (2, 4), (3, 8), (6, 64)):
+            with mock.patch("main.supervisor.random.uniform", side_effect=lambda low, high: (low, high)):
+                self.assertEqual(get_restart_delay(attempt), (delay / 2, delay))
+
+    def test_capped(self):
+        for _ in range(20):
+            self.assertLessEqual(get_restart_delay(50), 120)
+            self.assertGreaterEqual(get_restart_delay(50), 60)
+
+
+class PlaylistItemScheduleTests(SimpleTestCase):
+    # 2024-01-01 is a Monday.
+    monday = datetime.datetime(2024, 1, 1, 12, 0, tzinfo=datetime.timezone.utc)
+
+    def test_without_daypart_always_plays(self):
+        self.assertTrue(PlaylistItem(days=[]).is_scheduled(self.monday))
+
+    def test_days(self):
+        item = PlaylistItem(days=[0, 2])
+        self.assertTrue(item.is_scheduled(self.monday))
+        self.assertFalse(item.is_scheduled(self.monday + datetime.timedelta(days=1)))
+
+    def test_window(self):
+        item = PlaylistItem(days=[], start_time=datetime.time(9), end_time=datetime.time(17))
+        self.assertTrue(item.is_scheduled(self.monday))
+        self.assertTrue(item.is_scheduled(self.monday.replace(hour=9)))
+        self.assertFalse(item.is_scheduled(self.monday.replace(hour=17)))
+        self.assertFalse(item.is_scheduled(self.monday.replace(hour=8, minute=59)))
+
+    def test_window_over_midnight(self):
+        item = PlaylistItem(days=[], start_time=datetime.time(22), end_time=datetime.time(6))
+        self.assertTrue(item.is_scheduled(self.monday.replace(hour=23)))
+        self.assertTrue(item.is_scheduled(self.monday.replace(hour=5)))
+        self.assertFalse(item.is_scheduled(self.monday))
+
+    def test_open_ended(self):
+        self.assertFalse(PlaylistItem(days=[], start_time=datetime.time(13)).is_scheduled(self.monday))
+        self.assertTrue(PlaylistItem(days=[], end_time=datetime.time(13)).is_scheduled(self.monday))
+
+
+class HlsPlaylistTests(SimpleTestCase):
+    SEGMENTS = [[6.0, "seg_00000.ts"], [6.0, "seg_00001.ts"], [4.0, "seg_00002.ts"]]
+
+    def test_parse_media_playlist(self):
+        text = (
+            "#EXTM3U\n#EXT-X-VERSION:3\n#EXT-X-TARGETDURATION:6\n"
+            "#EXTINF:6.000000,\nseg_00000.ts\n#EXTINF:4.5,\nseg_00001.ts\n#EXT-X-ENDLIST\n"
+        )
+        self.assertEqual(parse_media_playlist(text), [[6.0, "seg_00000.ts"], [4.5, "seg_00001.ts"]])
+
+    def test_parse_master_playlist(self):
+        text = (
+            "#EXTM3U\n#EXT-X-VERSION:3\n"
+            '#EXT-X-STREAM-INF:BANDWIDTH=2500000,RESOLUTION=1280x720,CODECS="avc1.4d401f,mp4a.40.2"\n'
+            "720p/index.m3u8\n"
+            "#EXT-X-STREAM-INF:BANDWIDTH=800000\n"
+            "360p/index.m3u8\n"
+        )
+        self.assertEqual(parse_master_playlist(text), [
+            {"bandwidth": 2500000, "resolution": "1280x720", "uri": "720p/index.m3u8"},
+            {"bandwidth": 800000, "resolution": "", "uri": "360p/index.m3u8"},
+        ])
+
+    def test_live_window_follows_elapsed_time(self):
+        lines = build_live_playlist(self.SEGMENTS, "/hls/", elapsed=13).splitlines()
+        self.assertIn("#EXT-X-MEDIA-SEQUENCE:0", lines)
+        self.assertEqual([line for line in lines if not line.startswith("#")],
+                         ["/hls/seg_00000.ts", "/hls/seg_00001.ts", "/hls/seg_00002.ts"])
+        self.assertNotIn("#EXT-X-ENDLIST", lines)
+
+    def test_live_window_wraps_with_a_discontinuity(self):
+        lines = build_live_playlist(self.SEGMENTS, "/hls/", elapsed=17).splitlines()
+        self.assertIn("#EXT-X-MEDIA-SEQUENCE:1", lines)
+        self.assertEqual(lines[lines.index("#EXT-X-DISCONTINUITY") + 2], "/hls/seg_00000.ts")
+
+    def test_ends_after_the_last_pass(self):
+        lines = build_live_playlist(self.SEGMENTS, "/hls/", elapsed=100, loops=0).splitlines()
+        self.assertEqual(lines[-2:], ["/hls/seg_00002.ts", "#EXT-X-ENDLIST"])
+
+    def test_needs_segments(self):
+        with self.assertRaises(ValueError):
+            build_live_playlist([], "/hls/", elapsed=0)
+
+
+class RefreshPlayoutTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.enterContext(override_settings(PLAYOUT_ROOT=directory.name))
+        self.display = Display.objects.create(place=Place.objects.create(name="Lobby"), name="Screen")
+
+    @mock.patch("main.models.publish_stream_command")
+    @mock.patch("main.models.unqueue_stream")
+    def test_last_item_removed_without_video_stops_the_stream(self, unqueue_stream, publish_stream_command):
+        path = get_playout_path(self.display)
+        with open(path, "w") as f:
+            f.write("ffconcat version 1.0\n")
+
+        refresh_playout(self.display.id)
+
+        self.display.refresh_from_db()
+        self.assertTrue(self.display.paused)
+        self.assertFalse(os.path.exists(path))
+        publish_stream_command.assert_called_once_with("stop", self.display.stream_key)
+
+
+class ValidateLogEntryTests(SimpleTestCase):
+    def test_message_is_trimmed_and_type_defaults_to_unknown(self):
+        entry, errors = validate_log_entry({"message": "  disk full \n"})
+        self.assertEqual(errors, {})
+        self.assertEqual(entry, {"type": DisplayLog.TypeChoices.UNKNOWN, "message": "disk full"})
+
+    def test_blank_message_and_nul_characters_are_rejected(self):
+        for message in ("", "   ", "bad\x00byte", None):
+            _, errors = validate_log_entry({"type": "INFO", "message": message})
+            self.assertIn("message", errors)
+
+    def test_unknown_type_is_rejected(self):
+        _, errors = validate_log_entry({"type": "FATAL", "message": "x"})
+        self.assertIn("type", errors)
+
+
+class FlushLogsTests(TransactionTestCase):
+    def setUp(self):
+        # Commits run on_commit hooks here, keep display updates off the broker.
+        self.enterContext(mock.patch("main.signals.schedule_display_update"))
+        self.redis = get_redis()
+        self.addCleanup(self.redis.delete, BUFFER_KEY, DEAD_LETTER_KEY, FLUSH_LOCK_KEY)
+        self.redis.delete(BUFFER_KEY, DEAD_LETTER_KEY, FLUSH_LOCK_KEY)
+        self.display = Display.objects.create(place=Place.objects.create(name="Lobby"), name="Screen")
+
+    def buffer(self, *entries):
+        raw = [json.dumps({"display": display_id, "type": "INFO", "message": message}) for display_id, message in entries]
+        self.redis.rpush(BUFFER_KEY, *raw)
+        return raw
+
+    def test_buffer_is_written_and_trimmed(self):
+        self.buffer(*[(self.display.id, f"line {i}") for i in range(5)])
+        self.redis.rpush(BUFFER_KEY, "not json")
+
+        self.assertEqual(flush_logs(batch_size=4), 5)
+        self.assertEqual(DisplayLog.objects.filter(display=self.display).count(), 5)
+        self.assertEqual(self.redis.llen(BUFFER_KEY), 0)
+
+    def test_entries_of_deleted_displays_are_dropped(self):
+        self.buffer((self.display.id, "kept"), (self.display.id + 1000, "orphan"), (self.display.id, "kept too"))
+
+        self.assertEqual(flush_logs(), 2)
+        self.assertEqual(DisplayLog.objects.count(), 2)
+        self.assertEqual(self.redis.llen(DEAD_LETTER_KEY), 0)
+
+    def test_rejected_entry_is_isolated_into_the_dead_letter_list(self):
+        raw = self.buffer(*[(self.display.id, "poison" if i == 5 else f"line {i}") for i in range(8)])
+        bulk_create = DisplayLog.objects.bulk_create
+
+        def reject_poison(logs, *args, **kwargs):
+            if any(log.message == "poison" for log in logs):
+                raise IntegrityError("rejected")
+            return bulk_create(logs, *args, **kwargs)
+
+        with mock.patch.object(DisplayLog.objects, "bulk_create", side_effect=reject_poison):
+            self.assertEqual(flush_logs(), 7)
+
+        self.assertEqual(DisplayLog.objects.count(), 7)
+        self.assertEqual(self.redis.lrange(DEAD_LETTER_KEY, 0, -1), [raw[5].encode()])
+        self.assertEqual(self.redis.llen(BUFFER_KEY), 0)
+
+
+class DisplayLogViewTests(TestCase):
+    def setUp(self):
+        self.display = Display.objects.create(place=Place.objects.create(name="Lobby"), name="Screen")
+        self.token = DisplayToken.objects.create(display=self.display)
+
+    async def post(self, body):
+        return await self.async_client.post(
+            "/api/display/logs/", body, content_type="application/json", headers={"Authorization": f"Token {self.token.key}"}
+        )
+
+    async def test_entry_is_created(self):
+        response = await self.post({"type": "ERROR", "message": " no signal "})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(await DisplayLog.objects.filter(display=self.display, message="no signal").acount(), 1)
+
+    async def test_body_that_is_not_an_object_is_rejected(self):
+        for body in ([{"message": "x"}], "x", 1):
+            response = await self.post(json.dumps(body))
+            self.assertEqual(response.status_code, 400)
+
+
+class StopStreamingActionTests(TestCase):
+    def setUp(self):
+        place = Place.objects.create(name="Lobby")
+        self.hls = Display.objects.create(place=place, name="HLS", playback_mode=Display.PlaybackModeChoices.HLS)
+        self.idle = Display.objects.create(place=place, name="Idle")
+        self.streaming = Display.objects.create(place=place, name="Streaming", task_id="node-1:42")
+        self.model_admin = site._registry[Display]
+
+    @mock.patch.object(type(site._registry[Display]), "message_user")
+    @mock.patch.object(type(site._registry[Display]), "dispatch_bulk_action")
+    def test_only_supervised_rtmp_streams_are_stopped_through_a_supervisor(self, dispatch_bulk_action, message_user):
+        self.model_admin.stop_streaming_action(None, Display.objects.all())
+
+        signatures = dispatch_bulk_action.call_args.args[2]
+        self.assertEqual([signature.args for signature in signatures], [(str(self.streaming.stream_key),)])
+        self.assertEqual(Display.objects.filter(paused=True).count(), 3)
+
+    @mock.patch.object(type(site._registry[Display]), "message_user")
+    @mock.patch.object(type(site._registry[Display]), "dispatch_bulk_action")
+    def test_hls_only_selection_dispatches_nothing(self, dispatch_bulk_action, message_user):
+        self.model_admin.stop_streaming_action(None, Display.objects.filter(id=self.hls.id))
+
+        dispatch_bulk_action.assert_not_called()
+        message_user.assert_called_once()
+
+
+class LogRetentionTests(TestCase):
+    def setUp(self):
+        self.display = Display.objects.create(place=Place.objects.create(name="Lobby"), name="Screen")
+
+    def create_log(self, age):
+        log = DisplayLog.objects.create(display=self.display, type="INFO", message="x")
+        DisplayLog.objects.filter(id=log.id).update(created_at=timezone.now() - age)
+        return log
+
+    @override_settings(DISPLAY_LOG_RETENTION_DAYS=7)
+    @mock.patch.object(log_partitions, "DELETE_BATCH_SIZE", 2)
+    def test_fallback_deletes_expired_logs_in_batches(self):
+        for _ in range(5):
+            self.create_log(datetime.timedelta(days=8))
+        kept = self.create_log(datetime.timedelta(days=6))
+
+        self.assertEqual(log_partitions.apply_retention(), 5)
+        self.assertEqual(list(DisplayLog.objects.values_list("id", flat=True)), [kept.id])
+
+
+@skipUnless(connection.vendor == "postgresql", "Partitioning needs PostgreSQL.")
+class LogPartitionTests(TestCase):
+    def setUp(self):
+        self.display = Display.objects.create(place=Place.objects.create(name="Lobby"), name="Screen")
+        self.today = timezone.now().date()
+
+    def create_log(self, created_at):
+        log = DisplayLog.objects.create(display=self.display, type="INFO", message="x")
+        DisplayLog.objects.filter(id=log.id).update(created_at=created_at)
+        return log
+
+    def partitions(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+                "JOIN pg_class p ON p.oid = i.inhparent WHERE p.relname = %s",
+                [log_partitions.get_table()],
+            )
+            return {name for (name,) in cursor.fetchall()}
+
+    def test_conversion_keeps_rows_and_premakes_partitions(self):
+        log = self.create_log(timezone.now() - datetime.timedelta(days=3))
+
+        log_partitions.convert_to_partitioned()
+        log_partitions.ensure_partitions()
+
+        self.assertTrue(log_partitions.is_partitioned())
+        self.assertTrue(DisplayLog.objects.filter(id=log.id).exists())
+        expected = {
+            log_partitions.partition_name(self.today + datetime.timedelta(days=offset))
+            for offset in range(-3, settings.DISPLAY_LOG_PARTITION_PREMAKE_DAYS + 1)
+        }
+        self.assertLessEqual(expected, self.partitions())
+
+    def test_partition_takes_over_rows_stranded_in_the_default_partition(self):
+        log_partitions.convert_to_partitioned()
+        day = self.today + datetime.timedelta(days=settings.DISPLAY_LOG_PARTITION_PREMAKE_DAYS + 2)
+        log = self.create_log(datetime.datetime.combine(day, datetime.time(12), datetime.timezone.utc))
+
+        with connection.cursor() as cursor:
+            log_partitions.create_partition(cursor, day)
+            cursor.execute(f'SELECT id FROM "{log_partitions.partition_name(day)}"')
+            self.assertEqual(cursor.fetchall(), [(log.id,)])
+
+    def test_retention_drops_expired_partitions(self):
+        expired = self.create_log(timezone.now() - datetime.timedelta(days=5))
+        log_partitions.convert_to_partitioned()
+
+        with override_settings(DISPLAY_LOG_RETENTION_DAYS=2):
+            dropped = log_partitions.apply_retention()
+
+        self.assertEqual(set(dropped), {
+            log_partitions.partition_name(self.today - datetime.timedelta(days=days)) for days in (3, 4, 5)
+        })
+        self.assertFalse(DisplayLog.objects.filter(id=expired.id).exists())
+
+
+@mock.patch.object(StreamSupervisor, "spawn")
+@mock.patch.object(StreamSupervisor, "terminate")
+class SupervisorRestartTests(SimpleTestCase):
+    def setUp(self):
+        self.supervisor = StreamSupervisor(node="node-1", capacity=4)
+        self.supervisor.processes["key"] = mock.Mock()
+        self.supervisor.commands["key"] = ("/media/a.mp4", None, False)
+        self.supervisor.telemetry["key"] = StreamTelemetry(size=10)
+
+    def test_new_command_restarts_without_counting(self, terminate, spawn):
+        self.supervisor.start("key", "/media/b.mp4")
+        self.supervisor.restart_due()
+
+        spawn.assert_called_once_with("key", "/media/b.mp4", None, False)
+        self.assertEqual(self.supervisor.telemetry["key"].restarts, 0)
+
+    @mock.patch.object(StreamSupervisor, "log_event")
+    @mock.patch("main.models.Display.objects")
+    def test_backoff_restart_is_counted(self, objects, log_event, terminate, spawn):
+        self.supervisor.started_at["key"] = 0
+        self.supervisor.fail("key", "ffmpeg exited")
+        self.supervisor.restarts_due["key"] = 0
+        self.supervisor.restart_due()
+
+        spawn.assert_called_once_with("key", "/media/a.mp4", None, False)
+        self.assertEqual(self.supervisor.telemetry["key"].restarts, 1)
+
+
+@mock.patch.object(MediaAsset, "prepare")
+class ContentAddressedVideoTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=directory.name))
+        self.place = Place.objects.create(name="Lobby")
+
+    def upload(self, name, content):
+        display = Display(place=self.place, name=name, current_video=SimpleUploadedFile(name, content))
+        display.save()
+        return display
+
+    def test_identical_uploads_share_one_asset_and_file(self, prepare):
+        first = self.upload("a.mp4", b"same bytes")
+        second = self.upload("b.mp4", b"same bytes")
+
+        self.assertEqual(first.media_asset, second.media_asset)
+        self.assertEqual(first.current_video.name, second.current_video.name)
+        self.assertEqual(MediaAsset.objects.count(), 1)
+        self.assertEqual(len(os.listdir(os.path.dirname(first.current_video.path))), 1)
+        prepare.assert_called_once_with()
+
+    def test_different_uploads_get_their_own_asset(self, prepare):
+        first = self.upload("a.mp4", b"first")
+        second = self.upload("a.mp4", b"second")
+
+        self.assertNotEqual(first.media_asset, second.media_asset)
+        self.assertEqual(prepare.call_count, 2)
+
+
+@mock.patch.object(MediaAsset, "prepare")
+class ChunkedUploadTests(TestCase):
+    content = b"0123456789" * 10
+
+    def setUp(self):
+        for setting in ("MEDIA_ROOT", "VIDEO_UPLOAD_TEMP_DIR"):
+            directory = tempfile.TemporaryDirectory()
+            self.addCleanup(directory.cleanup)
+            self.enterContext(override_settings(**{setting: directory.name}))
+        self.display = Display.objects.create(place=Place.objects.create(name="Lobby"), name="Screen")
+        self.upload = VideoUpload.objects.create(display=self.display, filename="clip.mp4", size=len(self.content))
+
+    def send(self, start, end, offset=None):
+        chunk = self.content[start:end]
+        return append_chunk(self.upload, io.BytesIO(chunk), start if offset is None else offset, len(chunk))
+
+    @mock.patch("main.signals.schedule_display_update")
+    def test_chunks_complete_with_the_checksum_of_the_whole_file(self, schedule_display_update, prepare):
+        self.send(0, 30)
+        # The next chunk lands on another worker, which catches the hash up from the partial file.
+        _hashers.clear()
+        self.send(30, 70)
+        with self.captureOnCommitCallbacks(execute=True):
+            upload = self.send(70, 100)
+
+        sha256 = hashlib.sha256(self.content).hexdigest()
+        self.assertTrue(upload.is_complete)
+        self.assertEqual(upload.sha256, sha256)
+        self.assertFalse(os.path.exists(get_part_path(upload)))
+        self.display.refresh_from_db()
+        self.assertEqual(self.display.media_asset.sha256, sha256)
+        with self.display.current_video.open("rb") as f:
+            self.assertEqual(f.read(), self.content)
+
+    def test_stale_offset_is_rejected(self, prepare):
+        self.send(0, 30)
+        with self.assertRaises(UploadOffsetMismatch) as raised:
+            self.send(0, 30)
+        self.assertEqual(raised.exception.args, (30,))
+        self.upload.refresh_from_db()
+        self.assertEqual(self.upload.offset, 30)
+
+    def test_chunk_while_another_is_written_is_rejected(self, prepare):
+        lock = get_redis().lock(get_lock_key(self.upload), timeout=5)
+        lock.acquire()
+        self.addCleanup(lock.release)
+        with self.assertRaises(UploadOffsetMismatch):
+            self.send(0, 30)
+
+    def test_chunk_after_completion_is_rejected(self, prepare):
+        self.send(0, 100)
+        with self.assertRaises(UploadOffsetMismatch):
+            self.send(100, 100)
+
+
+class TokenCacheTests(TestCase):
+    def setUp(self):
+        self.display = Display.objects.create(place=Place.objects.create(name="Lobby"), name="Screen")
+        self.token = DisplayToken.objects.create(display=self.display)
+        self.addCleanup(local_cache.clear)
+
+    def test_cached_token_is_resolved_without_queries(self):
+        self.assertEqual(get_display_for_token(self.token.key), self.display)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_display_for_token(self.token.key), self.display)
+
+    def test_revoked_token_is_evicted(self):
+        key = self.token.key
+        get_display_for_token(key)
+        self.token.delete()
+        self.assertIsNone(get_display_for_token(key))
+
+    def test_saved_display_is_evicted(self):
+        get_display_for_token(self.token.key)
+        self.display.name = "Renamed"
+        self.display.save()
+        self.assertEqual(get_display_for_token(self.token.key).name, "Renamed")
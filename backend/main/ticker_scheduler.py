@@ -0,0 +1,137 @@
+import datetime
+import heapq
+import json
+import logging
+import time
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from redis.exceptions import RedisError
+
+from core.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+
+def publish_ticker_change(ticker_id):
+    """
+    Tells the ticker scheduler to re-read the boundaries of a ticker.
+
+    Runs as an ``on_commit`` hook of admin saves, so a Redis outage is logged rather than
+    failing the request; the scheduler's periodic reload picks the change up later.
+    """
+    try:
+        get_redis().publish(settings.TICKER_SCHEDULER_CHANNEL, json.dumps({"ticker": ticker_id}))
+    except RedisError as e:
+        logger.error(f"Could not notify the ticker scheduler of ticker {ticker_id}: {e}")
+
+
+class TickerScheduler:
+    """
+    Pushes display updates exactly when a ticker window opens or closes.
+
+    Upcoming ``start_time``/``end_time`` boundaries within ``TICKER_SCHEDULER_HORIZON``
+    are kept in a min-heap. Ticker edits arrive over Redis pub/sub (see
+    ``publish_ticker_change``) and bump the ticker's generation, so outdated heap
+    entries are skipped when popped instead of being searched for and removed.
+    """
+
+    def __init__(self, channel=None, horizon=None, max_sleep=30.0):
+        self.channel = channel or settings.TICKER_SCHEDULER_CHANNEL
+        self.horizon = horizon or settings.TICKER_SCHEDULER_HORIZON
+        self.max_sleep = max_sleep
+        self.heap = []
+        self.generations = {}
+        self.loaded_until = 0
+        self._running = False
+
+    def run(self):
+        pubsub = get_redis().pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(self.channel)
+        self._running = True
+        logger.info(f"Ticker scheduler listening on '{self.channel}'.")
+
+        try:
+            self.reload()
+            while self._running:
+                message = pubsub.get_message(timeout=self.get_sleep())
+                if message is not None:
+                    self.handle_message(message["data"])
+                # Before reloading, which only keeps boundaries still in the future.
+                self.fire_due()
+                if time.time() >= self.loaded_until - self.horizon / 2:
+                    self.reload()
+        finally:
+            pubsub.close()
+
+    def shutdown(self, *args):
+        self._running = False
+
+    def get_sleep(self):
+        if not self.heap:
+            return self.max_sleep
+        return min(max(self.heap[0][0] - time.time(), 0), self.max_sleep)
+
+    def handle_message(self, raw):
+        try:
+            ticker_id = json.loads(raw)["ticker"]
+        except (ValueError, KeyError, TypeError):
+            logger.warning(f"Ignoring malformed ticker message: {raw!r}")
+            return
+        self.schedule_ticker(ticker_id)
+
+    def reload(self):
+        """
+        Rebuilds the heap from every active ticker with a boundary inside the horizon.
+        """
+        from .models import Ticker
+
+        now = timezone.now()
+        until = now + datetime.timedelta(seconds=self.horizon)
+        boundary = Q(start_time__gt=now, start_time__lte=until) | Q(end_time__gt=now, end_time__lte=until)
+
+        self.heap = []
+        self.generations = {}
+        for ticker_id, display_id, start_time, end_time in Ticker.objects.filter(boundary, is_active=True) \
+                .values_list('id', 'display_id', 'start_time', 'end_time'):
+            self.push(ticker_id, display_id, start_time, end_time, now, until)
+        self.loaded_until = until.timestamp()
+        logger.info(f"Ticker scheduler loaded {len(self.heap)} boundaries.")
+
+    def schedule_ticker(self, ticker_id):
+        from .models import Ticker
+
+        generation = self.generations.get(ticker_id, 0) + 1
+        self.generations[ticker_id] = generation
+
+        ticker = Ticker.objects.filter(id=ticker_id, is_active=True) \
+            .values_list('display_id', 'start_time', 'end_time').first()
+        if ticker is not None:
+            now = timezone.now()
+            self.push(ticker_id, *ticker, now, datetime.datetime.fromtimestamp(self.loaded_until, datetime.timezone.utc))
+
+    def push(self, ticker_id, display_id, start_time, end_time, now, until):
+        generation = self.generations.setdefault(ticker_id, 0)
+        for moment in (start_time, end_time):
+            if moment is not None and now < moment <= until:
+                heapq.heappush(self.heap, (moment.timestamp(), ticker_id, generation, display_id))
+
+    def fire_due(self):
+        """
+        Broadcasts every display whose ticker boundary has passed, once per display.
+        """
+        from websocket.payloads import bump_payload_version
+        from .broadcast import send_display_update
+
+        now = time.time()
+        display_ids = set()
+        while self.heap and self.heap[0][0] <= now:
+            _, ticker_id, generation, display_id = heapq.heappop(self.heap)
+            if self.generations.get(ticker_id) == generation:
+                display_ids.add(display_id)
+
+        for display_id in display_ids:
+            bump_payload_version(display_id)
+            send_display_update(display_id)
+            logger.info(f"Ticker boundary reached for display {display_id}.")
@@ -0,0 +1,135 @@
+"""
+Two-tier cache mapping display token keys to their ``Display``.
+
+The first tier is a per-process LRU with a short TTL, the second the shared Django
+cache (Redis). Saving or deleting a ``DisplayToken`` or ``Display`` evicts both tiers
+in the writing process (see ``main.signals``); other processes pick the change up
+when their local entry expires after ``DISPLAY_TOKEN_LOCAL_TTL`` seconds.
+"""
+import copy
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+
+
+class LocalTokenCache:
+    """
+    Thread-safe LRU with a per-entry TTL.
+    """
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+local_cache = LocalTokenCache(settings.DISPLAY_TOKEN_CACHE_SIZE, settings.DISPLAY_TOKEN_LOCAL_TTL)
+
+
+def get_cache_key(token):
+    return f"display_token:{hashlib.sha256(token.encode()).hexdigest()}"
+
+
+def _fetch_display(token):
+    from .models import DisplayToken
+
+    try:
+        return DisplayToken.objects.select_related('display').get(key=token).display
+    except DisplayToken.DoesNotExist:
+        return None
+
+
+async def _afetch_display(token):
+    from .models import DisplayToken
+
+    try:
+        return (await DisplayToken.objects.select_related('display').aget(key=token)).display
+    except DisplayToken.DoesNotExist:
+        return None
+
+
+def get_display_for_token(token):
+    """
+    Returns the display owning ``token``, or None when the token does not exist.
+
+    Callers get their own copy, so mutating it never leaks into the cache.
+    """
+    key = get_cache_key(token)
+
+    display = local_cache.get(key)
+    if display is None:
+        display = cache.get(key)
+        if display is None:
+            display = _fetch_display(token)
+            if display is None:
+                return None
+            cache.set(key, display, timeout=settings.DISPLAY_TOKEN_CACHE_TIMEOUT)
+        local_cache.set(key, display)
+
+    return copy.copy(display)
+
+
+async def aget_display_for_token(token):
+    """
+    Async counterpart of ``get_display_for_token``.
+    """
+    key = get_cache_key(token)
+
+    display = local_cache.get(key)
+    if display is None:
+        display = await cache.aget(key)
+        if display is None:
+            display = await _afetch_display(token)
+            if display is None:
+                return None
+            await cache.aset(key, display, timeout=settings.DISPLAY_TOKEN_CACHE_TIMEOUT)
+        local_cache.set(key, display)
+
+    return copy.copy(display)
+
+
+def invalidate_tokens(*tokens):
+    keys = [get_cache_key(token) for token in tokens]
+    for key in keys:
+        local_cache.delete(key)
+    if keys:
+        cache.delete_many(keys)
+
+
+def invalidate_display(display):
+    """
+    Evicts every token of ``display``.
+    """
+    invalidate_tokens(*display.tokens.values_list('key', flat=True))
@@ -0,0 +1,188 @@
+import hashlib
+import logging
+import os
+import shutil
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from redis.exceptions import LockError
+
+from core.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+CHUNK_READ_SIZE = 1024 * 1024
+
+# upload id -> (offset, sha256 object, last use); lets consecutive chunks on the same worker hash
+# incrementally. Entries go away on completion, discard, or after VIDEO_UPLOAD_EXPIRY idle seconds.
+_hashers = {}
+
+
+class UploadOffsetMismatch(Exception):
+    pass
+
+
+def get_part_path(upload):
+    return os.path.join(settings.VIDEO_UPLOAD_TEMP_DIR, f"{upload.id}.part")
+
+
+def get_lock_key(upload):
+    return f"video_upload:{upload.id}:lock"
+
+
+def _evict_hashers():
+    idle_before = time.monotonic() - settings.VIDEO_UPLOAD_EXPIRY
+    for upload_id in [upload_id for upload_id, (_, _, used_at) in _hashers.items() if used_at < idle_before]:
+        _hashers.pop(upload_id, None)
+
+
+def _get_hasher(upload):
+    """
+    Returns the running SHA-256 of the bytes received so far.
+
+    When the previous chunk landed on another worker, the hash is caught up from the partial file.
+    """
+    offset, hasher, _ = _hashers.pop(upload.id, (None, None, None))
+    if offset == upload.offset:
+        return hasher
+
+    hasher = hashlib.sha256()
+    remaining = upload.offset
+    if remaining:
+        with open(get_part_path(upload), 'rb') as f:
+            while remaining:
+                chunk = f.read(min(CHUNK_READ_SIZE, remaining))
+                if not chunk:
+                    break
+                hasher.update(chunk)
+                remaining -= len(chunk)
+    return hasher
+
+
+def append_chunk(upload, stream, offset, length):
+    """
+    Streams one chunk from the request straight into the partial file, hashing it on the way.
+
+    A short Redis lock reserves the upload for one writer while the body is streamed, so no
+    database row lock or transaction is held during the transfer; the offset is then
+    advanced with a conditional update.
+
+    :param upload: The ``VideoUpload`` receiving the chunk.
+    :param stream: File-like request body.
+    :param offset: The ``Upload-Offset`` the client claims to resume from.
+    :param length: Number of bytes in the chunk.
+    :return: The upload, completed and linked to its display if this was the last chunk.
+    :raises UploadOffsetMismatch: When ``offset`` is stale or another chunk is being written.
+    """
+    from .models import VideoUpload
+
+    lock = get_redis().lock(get_lock_key(upload), timeout=settings.VIDEO_UPLOAD_LOCK_TIMEOUT, blocking=False)
+    if not lock.acquire():
+        raise UploadOffsetMismatch(upload.offset)
+
+    try:
+        upload = VideoUpload.objects.get(pk=upload.pk)
+        if upload.is_complete or offset != upload.offset:
+            raise UploadOffsetMismatch(upload.offset)
+
+        _evict_hashers()
+        length = min(length, upload.size - upload.offset)
+        hasher = _get_hasher(upload)
+        part_path = get_part_path(upload)
+        os.makedirs(os.path.dirname(part_path), exist_ok=True)
+
+        with open(part_path, 'r+b' if os.path.exists(part_path) else 'wb') as f:
+            f.seek(upload.offset)
+            f.truncate()
+            remaining = length
+            while remaining:
+                chunk = stream.read(min(CHUNK_READ_SIZE, remaining))
+                if not chunk:
+                    break
+                f.write(chunk)
+                hasher.update(chunk)
+                remaining -= len(chunk)
+
+        # A lock that expired mid-transfer may have let another writer in; its offset wins.
+        lock.reacquire()
+        received = upload.offset + length - remaining
+        with transaction.atomic():
+            updated = VideoUpload.objects.filter(pk=upload.pk, offset=upload.offset, completed_at__isnull=True) \
+                .update(offset=received, updated_at=timezone.now())
+            if not updated:
+                raise UploadOffsetMismatch(upload.offset)
+            upload.offset = received
+
+            if upload.offset >= upload.size:
+                complete_upload(upload, hasher.hexdigest())
+            else:
+                _hashers[upload.id] = (upload.offset, hasher, time.monotonic())
+    except LockError:
+        raise UploadOffsetMismatch(upload.offset)
+    finally:
+        try:
+            lock.release()
+        except LockError:
+            pass
+
+    return upload
+
+
+def complete_upload(upload, sha256):
+    """
+    Moves a finished upload to its content-addressed path and hands it to the display.
+    """
+    from .models import Display, MediaAsset
+
+    _hashers.pop(upload.id, None)
+    part_path = get_part_path(upload)
+    _, extension = os.path.splitext(upload.filename)
+    name = f"streams/videos/{sha256[:2]}/{sha256}{extension.lower()}"
+
+    storage = Display._meta.get_field('current_video').storage
+    if storage.exists(name):
+        os.remove(part_path)
+    else:
+        path = storage.path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # The partial directory may be on another file system than the media volume.
+        shutil.move(part_path, path)
+
+    upload.sha256 = sha256
+    upload.completed_at = timezone.now()
+    upload.save(update_fields=['sha256', 'completed_at', 'updated_at'])
+
+    asset, created = MediaAsset.objects.get_or_create(sha256=sha256, defaults={'file': name})
+    transaction.on_commit(lambda: upload.display.set_media_asset(asset, created))
+
+
+def discard_upload(upload):
+    _hashers.pop(upload.id, None)
+    try:
+        os.remove(get_part_path(upload))
+    except FileNotFoundError:
+        pass
+    upload.delete()
+
+
+def expire_uploads():
+    """
+    Discards incomplete uploads without a chunk for ``VIDEO_UPLOAD_EXPIRY`` seconds.
+
+    :return: The number of discarded uploads.
+    """
+    from .models import VideoUpload
+
+    _evict_hashers()
+    cutoff = timezone.now() - timedelta(seconds=settings.VIDEO_UPLOAD_EXPIRY)
+    uploads = VideoUpload.objects.filter(completed_at__isnull=True, updated_at__lt=cutoff)
+    count = 0
+    for upload in uploads:
+        discard_upload(upload)
+        count += 1
+    if count:
+        logger.info(f"Discarded {count} expired video uploads.")
+    return count
@@ -1,9 +1,46 @@
 from django.urls import path
 
-from .views import DisplayLogView
+from .async_views import (
+    display_log_view,
+    display_log_bulk_view,
+    display_config_view,
+    display_heartbeat_view,
+)
+from .views import (
+    DisplayLogView,
+    DisplayLivePlaylistView,
+    DisplayLiveVariantPlaylistView,
+    DisplayPresenceView,
+    PlacePresenceView,
+    StreamCapacityView,
+    StreamMetricsView,
+    VideoUploadCreateView,
+    VideoUploadView,
+)
 
 app_name = 'main'
 
 urlpatterns = [
     path('api/displaylog/', DisplayLogView.as_view(), name='display_log_view'),
+    # Async display API, routed to daphne (core.asgi) by nginx
+    path('api/display/logs/', display_log_view, name='display_async_log_view'),
+    path('api/display/logs/bulk/', display_log_bulk_view, name='display_log_bulk_view'),
+    path('api/display/config/', display_config_view, name='display_config_view'),
+    path('api/display/heartbeat/', display_heartbeat_view, name='display_heartbeat_view'),
+    path(
+        'api/displays/<uuid:stream_key>/live.m3u8',
+        DisplayLivePlaylistView.as_view(),
+        name='display_live_playlist_view'
+    ),
+    path(
+        'api/displays/<uuid:stream_key>/live/<str:variant>.m3u8',
+        DisplayLiveVariantPlaylistView.as_view(),
+        name='display_live_variant_playlist_view'
+    ),
+    path('api/uploads/', VideoUploadCreateView.as_view(), name='video_upload_create_view'),
+    path('api/uploads/<uuid:upload_id>/', VideoUploadView.as_view(), name='video_upload_view'),
+    path('api/places/<int:place_id>/presence/', PlacePresenceView.as_view(), name='place_presence_view'),
+    path('api/displays/<int:display_id>/presence/', DisplayPresenceView.as_view(), name='display_presence_view'),
+    path('api/streams/capacity/', StreamCapacityView.as_view(), name='stream_capacity_view'),
+    path('api/streams/metrics/', StreamMetricsView.as_view(), name='stream_metrics_view'),
 ]
@@ -1,12 +1,22 @@
+from django.conf import settings
+from django.http import HttpResponse
+from django.urls import reverse
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework.request import Request
+from rest_framework.permissions import AllowAny, IsAdminUser
+from rest_framework.authentication import SessionAuthentication
 from rest_framework import status
 
-from .models import Display
-from .serializers import DisplayLogSerializer
+from .hls import build_master_playlist
+from .models import Display, VideoUpload
+from .presence import get_display_presence, get_place_presence
+from .stream_scheduler import get_capacity_report
+from .stream_telemetry import get_all_telemetry, render_metrics
+from .serializers import DisplayLogSerializer, VideoUploadSerializer
+from .uploads import append_chunk, discard_upload, UploadOffsetMismatch
 from .authentication import DisplayTokenAuthentication
-from .permissions import IsDisplayAuthenticated
+from .permissions import HasMetricsToken, IsDisplayAuthenticated
 
 
 class DisplayLogView(APIView):
@@ -36,3 +46,198 @@ class DisplayLogView(APIView):
                 {"detail": f"An unexpected error occurred: {str(e)}"},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
+
+
+class DisplayLivePlaylistView(APIView):
+    """
+    Serves the generated live-window playlist of an HLS display.
+
+    Segments themselves are static files served by nginx; this view only renders
+    a few lines of text, so a looping display costs no running encoder.
+    Displays with an ABR ladder get a master playlist pointing at one live playlist per variant.
+    """
+    authentication_classes = []
+    permission_classes = [AllowAny]
+
+    def get_display(self, stream_key):
+        display = Display.objects.filter(
+            stream_key=stream_key,
+            is_active=True,
+            playback_mode=Display.PlaybackModeChoices.HLS,
+        ).select_related('media_asset').only(
+            'stream_key', 'loop', 'paused', 'stream_started_at',
+            'media_asset__sha256', 'media_asset__hls_segments', 'media_asset__abr_renditions',
+        ).first()
+
+        if display is None or display.paused or not display.has_hls_playlist:
+            return None
+        return display
+
+    def playlist_response(self, playlist):
+        response = HttpResponse(playlist, content_type='application/vnd.apple.mpegurl')
+        response['Cache-Control'] = f"max-age={max(settings.HLS_SEGMENT_SECONDS // 2, 1)}"
+        return response
+
+    def get(self, request: Request, stream_key, format=None) -> HttpResponse:
+        display = self.get_display(stream_key)
+        if display is None:
+            return HttpResponse(status=status.HTTP_404_NOT_FOUND)
+
+        if display.media_asset.abr_renditions:
+            playlist = build_master_playlist(
+                display.media_asset.abr_renditions,
+                lambda variant: reverse(
+                    'main:display_live_variant_playlist_view',
+                    args=[display.stream_key, variant['name']]
+                ),
+            )
+        else:
+            playlist = display.build_live_playlist()
+
+        return self.playlist_response(playlist)
+
+
+class DisplayLiveVariantPlaylistView(DisplayLivePlaylistView):
+    def get(self, request: Request, stream_key, variant, format=None) -> HttpResponse:
+        display = self.get_display(stream_key)
+        rendition = display.media_asset.get_abr_variant(variant) if display is not None else None
+        if rendition is None:
+            return HttpResponse(status=status.HTTP_404_NOT_FOUND)
+
+        return self.playlist_response(display.build_live_playlist(variant=rendition))
+
+
+class VideoUploadCreateView(APIView):
+    """
+    Starts a resumable upload (tus-style): ``Upload-Length`` header plus ``display`` and ``filename``.
+    """
+    authentication_classes = [SessionAuthentication]
+    permission_classes = [IsAdminUser]
+
+    def post(self, request: Request, format=None) -> Response:
+        data = request.data.copy()
+        data['size'] = request.headers.get('Upload-Length', data.get('size'))
+
+        serializer = VideoUploadSerializer(data=data, context={'request': request})
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        upload = serializer.save(created_by=request.user)
+        response = Response(serializer.data, status=status.HTTP_201_CREATED)
+        response['Location'] = reverse('main:video_upload_view', args=[upload.id])
+        response['Upload-Offset'] = upload.offset
+        return response
+
+
+class VideoUploadView(APIView):
+    """
+    ``HEAD`` reports the resume offset, ``PATCH`` appends a chunk at ``Upload-Offset``
+    (body sent as ``application/offset+octet-stream``), ``DELETE`` abandons the upload.
+    """
+    authentication_classes = [SessionAuthentication]
+    permission_classes = [IsAdminUser]
+
+    def get_upload(self, upload_id):
+        return VideoUpload.objects.filter(pk=upload_id).first()
+
+    def offset_response(self, upload, status_code=status.HTTP_204_NO_CONTENT):
+        response = HttpResponse(status=status_code)
+        response['Upload-Offset'] = upload.offset
+        response['Upload-Length'] = upload.size
+        response['Cache-Control'] = 'no-store'
+        return response
+
+    def head(self, request: Request, upload_id, format=None) -> HttpResponse:
+        upload = self.get_upload(upload_id)
+        if upload is None:
+            return HttpResponse(status=status.HTTP_404_NOT_FOUND)
+        return self.offset_response(upload, status.HTTP_200_OK)
+
+    def patch(self, request: Request, upload_id, format=None) -> Response:
+        upload = self.get_upload(upload_id)
+        if upload is None:
+            return Response({"detail": "Upload not found."}, status=status.HTTP_404_NOT_FOUND)
+
+        if request.content_type != 'application/offset+octet-stream':
+            return Response(
+                {"detail": "Chunks must be sent as application/offset+octet-stream."},
+                status=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE
+            )
+
+        try:
+            offset = int(request.headers['Upload-Offset'])
+            length = int(request.headers['Content-Length'])
+        except (KeyError, ValueError):
+            return Response(
+                {"detail": "Upload-Offset and Content-Length headers are required."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        if length > settings.VIDEO_UPLOAD_CHUNK_MAX_SIZE:
+            return Response(
+                {"detail": f"Chunks are limited to {settings.VIDEO_UPLOAD_CHUNK_MAX_SIZE} bytes."},
+                status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+            )
+
+        try:
+            upload = append_chunk(upload, request.stream, offset, length)
+        except UploadOffsetMismatch:
+            upload.refresh_from_db()
+            return self.offset_response(upload, status.HTTP_409_CONFLICT)
+
+        return self.offset_response(upload)
+
+    def delete(self, request: Request, upload_id, format=None) -> HttpResponse:
+        upload = self.get_upload(upload_id)
+        if upload is None:
+            return HttpResponse(status=status.HTTP_404_NOT_FOUND)
+
+        discard_upload(upload)
+        return HttpResponse(status=status.HTTP_204_NO_CONTENT)
+
+
+class PlacePresenceView(APIView):
+    """
+    Online/offline display counts of a place, read from Redis only (see ``main.presence``).
+    """
+    authentication_classes = [SessionAuthentication]
+    permission_classes = [IsAdminUser]
+
+    def get(self, request: Request, place_id, format=None) -> Response:
+        return Response({"place": place_id, **get_place_presence(place_id)})
+
+
+class DisplayPresenceView(APIView):
+    """
+    Last seen time, serving node, client version and open sockets of a display (see ``main.presence``).
+    """
+    authentication_classes = [SessionAuthentication]
+    permission_classes = [IsAdminUser]
+
+    def get(self, request: Request, display_id, format=None) -> Response:
+        presence = get_display_presence(display_id)
+        if presence is None:
+            return Response({"display": display_id, "online": False})
+        return Response({"display": display_id, **presence})
+
+
+class StreamCapacityView(APIView):
+    """
+    Encode slot usage of every live stream supervisor node and the length of the stream queue.
+    """
+    authentication_classes = [SessionAuthentication]
+    permission_classes = [IsAdminUser]
+
+    def get(self, request: Request, format=None) -> Response:
+        return Response(get_capacity_report())
+
+
+class StreamMetricsView(APIView):
+    """
+    ffmpeg telemetry of every running stream in the Prometheus text format.
+    """
+    authentication_classes = [SessionAuthentication]
+    permission_classes = [IsAdminUser | HasMetricsToken]
+
+    def get(self, request: Request, format=None) -> HttpResponse:
+        return HttpResponse(render_metrics(get_all_telemetry()), content_type='text/plain; version=0.0.4')
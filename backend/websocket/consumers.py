@@ -1,70 +1,134 @@
 import json
 import logging
+import time
 
 from channels.generic.websocket import AsyncWebsocketConsumer
-from asgiref.sync import sync_to_async
 
-from main.models import Display
+from main.broadcast import get_group_name
+from main.presence import amark_disconnected, amark_seen
+from .encoding import JSON, FrameTooLarge, decode, encode, encode_cached, negotiate
+from .gateway import admission, aget_display_ref, get_reconnect_delay, get_stream_key
+from .payloads import aget_patch, aget_snapshot, build_message, build_patch_message
 
 logger = logging.getLogger(__name__)
 
 
+# "Message Too Big" and "Try Again Later", see RFC 6455 section 7.4.1.
+CLOSE_MESSAGE_TOO_BIG = 1009
+CLOSE_TRY_AGAIN_LATER = 1013
+
+
 class DisplayConsumer(AsyncWebsocketConsumer):
+    group_name = None
+
     async def connect(self):
-        self.key = self.scope['query_string'].decode('utf-8').split('=')[1]
+        self.revision = None
+        # Only clients that ask for patches get ``display_patch`` frames; the rest keep
+        # receiving full ``display_update`` messages.
+        self.patches = False
+        subprotocol = negotiate(self.scope.get('subprotocols', []))
+        self.format = subprotocol or JSON
 
-        try:
-            self.display = await self.get_display(self.key)
-        except Display.DoesNotExist:
+        if not admission.consume():
+            await self.refuse(subprotocol)
+            return
+
+        self.key = get_stream_key(self.scope['query_string'])
+        self.display = await aget_display_ref(self.key) if self.key else None
+        if self.display is None:
             await self.close(code=400)
             return
 
-        await self.channel_layer.group_add(f"display_{self.display.stream_key}", self.channel_name)
-        await self.accept()
+        self.group_name = get_group_name(self.display["stream_key"], self.format)
+        await self.channel_layer.group_add(self.group_name, self.channel_name)
+        await self.accept(subprotocol=subprotocol)
+        await amark_seen(self.display["id"], self.display["place_id"], connections=1)
+
+    async def refuse(self, subprotocol):
+        """
+        Turns the socket away with a jittered reconnect hint when this process is accepting too fast.
+        """
+        await self.accept(subprotocol=subprotocol)
+        await self.send_frame(encode(
+            json.dumps({"action": "reconnect", "retry_after": get_reconnect_delay()}),
+            self.format,
+        ))
+        await self.close(code=CLOSE_TRY_AGAIN_LATER)
+
+    async def receive(self, text_data=None, bytes_data=None):
+        try:
+            data = decode(text_data, bytes_data, self.format)
+        except FrameTooLarge as e:
+            logger.warning(f"Closing display socket {self.key}: {e}")
+            await self.close(code=CLOSE_MESSAGE_TOO_BIG)
+            return
 
-    async def receive(self, text_data):
         try:
-            data = json.loads(text_data)
             action = data.get("action")
+            if action != "ping":
+                # Any frame shows the display is alive; ``pong`` records pings with their version.
+                await amark_seen(self.display["id"], self.display["place_id"])
 
             if action == "get_display_data":
+                since = data.get("since")
+                self.patches = self.patches or bool(data.get("patch")) or isinstance(since, int)
+                await self.send_display_data(since)
+            elif action == "resync":
                 await self.send_display_data()
+            elif action == "ping":
+                await self.pong(data.get("version"))
             else:
-                await self.send(text_data=json.dumps({"error": "Unknown action"}))
+                await self.send_frame(encode(json.dumps({"error": "Unknown action"}), self.format))
         except Exception as e:
             logger.error(e)
-            await self.send(text_data=json.dumps({"error": "Server error : {}".format(e)}))
+            await self.send_frame(encode(json.dumps({"error": "Server error : {}".format(e)}), self.format))
 
     async def disconnect(self, close_code, **kwargs):
-        await self.channel_layer.group_discard(
-            f"display_{self.display.stream_key}",
-            self.channel_name
-        )
+        if self.group_name is not None:
+            await self.channel_layer.group_discard(self.group_name, self.channel_name)
+            await amark_disconnected(self.display["id"])
         await self.close()
 
-    async def send_display_data(self):
-        self.display = await self.get_display(self.key)
-        serializer_data = await sync_to_async(self.get_display_serializer_data)(self.display)
-        data = {
-            "action": "get_display_data",
-            "message": serializer_data
-        }
-        await self.send(text_data=json.dumps(data))
+    async def pong(self, client_version=None):
+        await amark_seen(self.display["id"], self.display["place_id"], client_version=client_version)
+        await self.send_frame(encode(json.dumps({"action": "pong", "server_time": time.time()}), self.format))
+
+    async def send_display_data(self, since=None):
+        """
+        Sends the latest revision, as a patch when the client already holds revision ``since``.
+        """
+        revision, payload = await aget_snapshot(self.display["id"])
+
+        patch = None
+        if self.patches and isinstance(since, int):
+            patch = "[]" if since == revision else await aget_patch(self.display["id"], since, revision)
 
-    def get_display_serializer_data(self, display):
-        from .serializers import DisplaySerializer
-        serializer = DisplaySerializer(display)
-        return serializer.data
+        if patch is not None:
+            await self.send_frame(encode(build_patch_message(revision, since, patch), self.format))
+        else:
+            await self.send_frame(encode_cached(
+                (self.display["id"], revision, "get_display_data"),
+                build_message("get_display_data", payload, revision),
+                self.format,
+            ))
+        self.revision = revision
 
     async def display_update(self, event):
-        data = event["data"]
-        prep_data = {
-            "action": "display_update",
-            "message": data
-        }
-        await self.send(text_data=json.dumps(prep_data))
-
-    @sync_to_async
-    def get_display(self, key):
-        queryset = Display.objects.get(stream_key=key)
-        return queryset
+        """
+        Forwards the frames encoded once by ``main.broadcast.broadcast_revision``.
+        """
+        revision = event["revision"]
+        if self.revision is not None and revision <= self.revision:
+            return
+
+        if self.patches and event["patch"] is not None and event["base"] == self.revision:
+            await self.send_frame(event["patch"])
+        else:
+            await self.send_frame(event["frame"])
+        self.revision = revision
+
+    async def send_frame(self, frame):
+        if isinstance(frame, bytes):
+            await self.send(bytes_data=frame)
+        else:
+            await self.send(text_data=frame)
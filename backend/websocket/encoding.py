@@ -0,0 +1,106 @@
+"""
+Wire formats of the display websocket, negotiated through the subprotocol.
+
+Messages are built once as JSON text (see ``websocket.payloads``) and encoded
+once per format by the broadcaster (see ``main.broadcast``), so consumers
+forward frames as they are. Compression is done per message with zlib because
+daphne does not negotiate ``permessage-deflate``.
+"""
+import json
+import threading
+import zlib
+from collections import OrderedDict
+
+import msgpack
+
+JSON = "display.json"
+JSON_ZLIB = "display.json.zlib"
+MSGPACK = "display.msgpack"
+MSGPACK_ZLIB = "display.msgpack.zlib"
+
+FORMATS = [MSGPACK_ZLIB, MSGPACK, JSON_ZLIB, JSON]
+
+FRAME_CACHE_SIZE = 256
+
+# Largest incoming frame accepted once decompressed; clients only send small actions.
+MAX_FRAME_SIZE = 64 * 1024
+
+_frames = OrderedDict()
+_frames_lock = threading.Lock()
+
+
+class FrameTooLarge(ValueError):
+    pass
+
+
+def negotiate(subprotocols):
+    """
+    Returns the first format the client offers, or None for the plain JSON default.
+    """
+    for subprotocol in subprotocols:
+        if subprotocol in FORMATS:
+            return subprotocol
+    return None
+
+
+def encode(text, format=JSON):
+    """
+    Encodes a JSON message for ``format``.
+
+    :return: ``str`` for the JSON format, ``bytes`` otherwise.
+    """
+    if format == JSON:
+        return text
+    if format == JSON_ZLIB:
+        return zlib.compress(text.encode())
+
+    data = msgpack.packb(json.loads(text))
+    if format == MSGPACK_ZLIB:
+        return zlib.compress(data)
+    return data
+
+
+def encode_cached(key, text, format):
+    """
+    Encodes a message shared by many sockets (e.g. a snapshot) only once per process.
+
+    :param key: Hashable identity of ``text``, such as ``(display_id, revision, action)``.
+    """
+    if format == JSON:
+        return text
+
+    with _frames_lock:
+        frame = _frames.get((key, format))
+        if frame is not None:
+            _frames.move_to_end((key, format))
+            return frame
+
+    frame = encode(text, format)
+    with _frames_lock:
+        _frames[(key, format)] = frame
+        while len(_frames) > FRAME_CACHE_SIZE:
+            _frames.popitem(last=False)
+    return frame
+
+
+def decode(text_data=None, bytes_data=None, format=JSON):
+    """
+    Decodes an incoming frame into a dict.
+
+    :raises FrameTooLarge: When the frame is over ``MAX_FRAME_SIZE``, before or after decompression.
+    """
+    data = text_data if text_data is not None else bytes_data
+    if len(data) > MAX_FRAME_SIZE:
+        raise FrameTooLarge(f"Frame exceeds {MAX_FRAME_SIZE} bytes.")
+    if text_data is not None:
+        return json.loads(text_data)
+
+    if format in (JSON_ZLIB, MSGPACK_ZLIB):
+        # Bounded output, so a small compressed frame cannot expand into gigabytes.
+        decompressor = zlib.decompressobj()
+        bytes_data = decompressor.decompress(bytes_data, MAX_FRAME_SIZE)
+        if decompressor.unconsumed_tail:
+            raise FrameTooLarge(f"Frame exceeds {MAX_FRAME_SIZE} bytes once decompressed.")
+    if format in (MSGPACK, MSGPACK_ZLIB):
+        return msgpack.unpackb(bytes_data)
+    return json.loads(bytes_data)
@@ -0,0 +1,140 @@
+"""
+Connection-time helpers of the display websocket.
+
+Connects resolve the stream key through a per-process LRU and the shared cache,
+with concurrent misses for the same key collapsed into one query, and a token
+bucket limits how fast each daphne process accepts new sockets. Refused clients
+get a jittered reconnect hint so a restart does not turn into a reconnect storm.
+"""
+import asyncio
+import random
+import time
+import uuid
+from functools import partial
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+
+from main.token_cache import LocalTokenCache
+
+MISSING = "missing"
+
+local_refs = LocalTokenCache(settings.DISPLAY_TOKEN_CACHE_SIZE, settings.DISPLAY_TOKEN_LOCAL_TTL)
+
+
+class TokenBucket:
+    """
+    Allows ``rate`` events per second with bursts of up to ``burst`` events.
+    """
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated_at = time.monotonic()
+
+    def consume(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+class SingleFlight:
+    """
+    Collapses concurrent calls with the same key into one awaited call.
+
+    The call runs in its own task that every caller awaits through ``asyncio.shield``,
+    so a caller that is cancelled (e.g. its socket closed) stops waiting without
+    cancelling the call for the others.
+    """
+
+    def __init__(self):
+        self._calls = {}
+
+    async def do(self, key, function, *args):
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(function(*args))
+            self._calls[key] = task
+            task.add_done_callback(partial(self._done, key))
+        return await asyncio.shield(task)
+
+    def _done(self, key, task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        # Mark the exception as retrieved when every caller was cancelled.
+        if not task.cancelled():
+            task.exception()
+
+
+admission = TokenBucket(settings.WS_ACCEPT_RATE, settings.WS_ACCEPT_BURST)
+single_flight = SingleFlight()
+
+
+def get_stream_key(query_string):
+    """
+    Extracts the stream key from ``?key=<uuid>`` (or the first parameter, for older clients).
+
+    :return: The key as a string, or None when it is missing or not a UUID.
+    """
+    params = parse_qs(query_string.decode('utf-8'))
+    values = params.get('key') or next(iter(params.values()), None)
+    if not values:
+        return None
+    try:
+        return str(uuid.UUID(values[0]))
+    except ValueError:
+        return None
+
+
+def get_ref_key(stream_key):
+    return f"display_ref:v2:{stream_key}"
+
+
+def _fetch_ref(stream_key):
+    from main.models import Display
+
+    display = Display.objects.filter(stream_key=stream_key).values('id', 'stream_key', 'place_id').first()
+    if display is None:
+        return None
+    return {"id": display['id'], "stream_key": str(display['stream_key']), "place_id": display['place_id']}
+
+
+async def _aload_ref(stream_key):
+    ref = await cache.aget(get_ref_key(stream_key))
+    if ref is None:
+        ref = await sync_to_async(_fetch_ref)(stream_key)
+        if ref is None:
+            await cache.aset(get_ref_key(stream_key), MISSING, timeout=settings.DISPLAY_REF_MISS_TIMEOUT)
+        else:
+            await cache.aset(get_ref_key(stream_key), ref, timeout=settings.DISPLAY_REF_CACHE_TIMEOUT)
+    return ref
+
+
+async def aget_display_ref(stream_key):
+    """
+    Returns ``{"id", "stream_key", "place_id"}`` of the display, or None when it does not exist.
+    """
+    ref = local_refs.get(stream_key)
+    if ref is None:
+        ref = await single_flight.do(("ref", stream_key), _aload_ref, stream_key)
+        local_refs.set(stream_key, ref or MISSING)
+    return None if ref == MISSING else ref
+
+
+def invalidate_display_ref(stream_key):
+    local_refs.delete(str(stream_key))
+    cache.delete(get_ref_key(stream_key))
+
+
+def get_reconnect_delay():
+    """
+    Seconds a refused client should wait, spread out so clients do not retry in lockstep.
+    """
+    return round(random.uniform(settings.WS_RECONNECT_MIN, settings.WS_RECONNECT_MAX), 1)
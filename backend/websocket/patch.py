@@ -0,0 +1,86 @@
+"""
+Minimal JSON Patch (RFC 6902) generator for display payloads.
+
+Only ``add``, ``remove`` and ``replace`` operations are produced. Lists of
+objects with unique ``id``s (tickers, ticker items) are matched by id, so a
+ticker prepended by the ``-created_at`` ordering is a single ``add``; other
+lists are compared index by index.
+"""
+
+
+def escape_token(token):
+    return str(token).replace('~', '~0').replace('/', '~1')
+
+
+def get_ids(items):
+    """
+    Returns the ``id`` of every item, or None unless all items are objects with distinct ids.
+    """
+    ids = [item.get("id") if isinstance(item, dict) else None for item in items]
+    if None in ids or len(set(ids)) != len(ids):
+        return None
+    return ids
+
+
+def make_list_patch_by_id(old, new, path):
+    """
+    Patches a list of objects by id: dropped ids are removed, new ids added at their
+    position and moved ones re-added, everything else is patched in place.
+    """
+    new_ids = set(get_ids(new))
+    operations = [
+        {"op": "remove", "path": f"{path}/{index}"}
+        for index in range(len(old) - 1, -1, -1)
+        if old[index]["id"] not in new_ids
+    ]
+    current = [item for item in old if item["id"] in new_ids]
+
+    for index, item in enumerate(new):
+        if index < len(current) and current[index]["id"] == item["id"]:
+            operations.extend(make_patch(current[index], item, f"{path}/{index}"))
+            continue
+        for position in range(index + 1, len(current)):
+            if current[position]["id"] == item["id"]:
+                operations.append({"op": "remove", "path": f"{path}/{position}"})
+                del current[position]
+                break
+        operations.append({"op": "add", "path": f"{path}/{index}", "value": item})
+        current.insert(index, item)
+    return operations
+
+
+def make_patch(old, new, path=''):
+    """
+    Returns the operations turning ``old`` into ``new``.
+    """
+    if isinstance(old, dict) and isinstance(new, dict):
+        operations = []
+        for key in old:
+            if key not in new:
+                operations.append({"op": "remove", "path": f"{path}/{escape_token(key)}"})
+        for key, value in new.items():
+            child = f"{path}/{escape_token(key)}"
+            if key not in old:
+                operations.append({"op": "add", "path": child, "value": value})
+            else:
+                operations.extend(make_patch(old[key], value, child))
+        return operations
+
+    if isinstance(old, list) and isinstance(new, list):
+        if get_ids(old) is not None and get_ids(new) is not None:
+            return make_list_patch_by_id(old, new, path)
+
+        operations = []
+        common = min(len(old), len(new))
+        for index in range(common):
+            operations.extend(make_patch(old[index], new[index], f"{path}/{index}"))
+        # Removing from the end keeps the remaining indexes valid.
+        for index in range(len(old) - 1, common - 1, -1):
+            operations.append({"op": "remove", "path": f"{path}/{index}"})
+        for index in range(common, len(new)):
+            operations.append({"op": "add", "path": f"{path}/{index}", "value": new[index]})
+        return operations
+
+    if old == new and type(old) is type(new):
+        return []
+    return [{"op": "replace", "path": path, "value": new}]
@@ -0,0 +1,201 @@
+"""
+Rendered display payloads, shared by the websocket consumer and the config endpoint.
+
+A payload is the JSON of ``DisplaySerializer`` for one display, loaded in a fixed
+number of queries and cached as text under a per-display version. Any change to
+the display, its asset or its tickers bumps the version (see ``main.signals``),
+so stale payloads are never read again and simply expire.
+
+Every broadcast payload also gets a revision: a per-display counter with a
+snapshot kept for ``DISPLAY_SNAPSHOT_TIMEOUT`` seconds, so clients that opt in
+(see ``websocket.consumers``) only receive a JSON patch against the revision
+they already have.
+"""
+import json
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Prefetch, Q
+from django.utils import timezone
+
+from main.models import Display, Ticker, TickerItem
+from .gateway import single_flight
+from .patch import make_patch
+
+
+def get_version_key(display_id):
+    return f"display_payload_version:{display_id}"
+
+
+def get_payload_key(display_id, version):
+    return f"display_payload:{display_id}:{version}"
+
+
+def get_revision_key(display_id):
+    return f"display_revision:{display_id}"
+
+
+def get_snapshot_key(display_id, revision):
+    return f"display_snapshot:{display_id}:{revision}"
+
+
+def bump_payload_version(*display_ids):
+    """
+    Invalidates the cached payloads of ``display_ids``.
+    """
+    version = time.time_ns()
+    cache.set_many({get_version_key(display_id): version for display_id in display_ids}, timeout=None)
+
+
+def get_display_queryset(now=None):
+    """
+    Displays with everything ``DisplaySerializer`` reads, in three queries.
+
+    Only active tickers whose time window contains ``now`` are prefetched.
+    """
+    now = now or timezone.now()
+    tickers = (
+        Ticker.objects
+        .filter(is_active=True)
+        .filter(Q(start_time__isnull=True) | Q(start_time__lte=now))
+        .filter(Q(end_time__isnull=True) | Q(end_time__gt=now))
+        .prefetch_related(Prefetch('items', queryset=TickerItem.objects.filter(is_active=True)))
+    )
+    return Display.objects.select_related('media_asset').prefetch_related(Prefetch('tickers', queryset=tickers))
+
+
+def get_next_boundary(display_id, now):
+    """
+    Returns the seconds until a ticker of the display enters or leaves its window.
+    """
+    boundaries = [
+        moment
+        for start_time, end_time in Ticker.objects.filter(
+            Q(start_time__gt=now) | Q(end_time__gt=now), display_id=display_id, is_active=True
+        ).values_list('start_time', 'end_time')
+        for moment in (start_time, end_time)
+        if moment is not None and moment > now
+    ]
+    if not boundaries:
+        return None
+    return max((min(boundaries) - now).total_seconds(), 1)
+
+
+def render_payload(display_id):
+    """
+    Serializes one display to JSON text.
+
+    :return: ``(payload, timeout)``, the timeout ending at the next ticker boundary.
+    """
+    from .serializers import DisplaySerializer
+
+    now = timezone.now()
+    display = get_display_queryset(now).get(id=display_id)
+    payload = json.dumps(DisplaySerializer(display).data)
+
+    timeout = settings.DISPLAY_PAYLOAD_CACHE_TIMEOUT
+    boundary = get_next_boundary(display_id, now)
+    if boundary is not None:
+        timeout = min(timeout, int(boundary))
+
+    return payload, timeout
+
+
+def get_display_payload(display_id):
+    """
+    Returns the cached JSON payload of a display, rendering it on a miss.
+
+    :raises Display.DoesNotExist:
+    """
+    version = cache.get(get_version_key(display_id))
+    if version is None:
+        version = time.time_ns()
+        cache.add(get_version_key(display_id), version, timeout=None)
+        version = cache.get(get_version_key(display_id), version)
+
+    key = get_payload_key(display_id, version)
+    payload = cache.get(key)
+    if payload is None:
+        payload, timeout = render_payload(display_id)
+        cache.set(key, payload, timeout=timeout)
+    return payload
+
+
+async def aget_display_payload(display_id):
+    """
+    Async counterpart of ``get_display_payload``; only a miss leaves the event loop,
+    and concurrent misses of one process render the payload once.
+    """
+    version = await cache.aget(get_version_key(display_id))
+    if version is not None:
+        payload = await cache.aget(get_payload_key(display_id, version))
+        if payload is not None:
+            return payload
+    return await single_flight.do(("payload", display_id), sync_to_async(get_display_payload), display_id)
+
+
+def publish_revision(display_id, payload):
+    """
+    Records ``payload`` as the next revision of a display.
+
+    :return: ``(revision, base, patch)`` where ``patch`` is the JSON text of the operations
+        from ``base`` to ``revision``, or None when the previous snapshot is gone.
+        ``revision`` is None when the payload did not change.
+    """
+    cache.add(get_revision_key(display_id), 0, timeout=None)
+    current = cache.get(get_revision_key(display_id), 0)
+    if cache.get(get_snapshot_key(display_id, current)) == payload:
+        return None, current, None
+
+    # One INCR hands out the revision, so concurrent publishers never share one;
+    # the base is whatever revision came right before it.
+    revision = cache.incr(get_revision_key(display_id))
+    base = revision - 1
+    cache.set(get_snapshot_key(display_id, revision), payload, timeout=settings.DISPLAY_SNAPSHOT_TIMEOUT)
+    previous = cache.get(get_snapshot_key(display_id, base))
+
+    patch = None
+    if previous is not None:
+        patch = json.dumps(make_patch(json.loads(previous), json.loads(payload)))
+    return revision, base, patch
+
+
+async def aget_snapshot(display_id):
+    """
+    Returns ``(revision, payload)`` for the latest revision of a display.
+
+    The stored snapshot is preferred over the current payload, so that patches
+    broadcast later (based on that revision) apply cleanly.
+    """
+    revision = await cache.aget(get_revision_key(display_id), 0)
+    payload = await cache.aget(get_snapshot_key(display_id, revision))
+    if payload is None:
+        payload = await aget_display_payload(display_id)
+    return revision, payload
+
+
+async def aget_patch(display_id, since, revision):
+    """
+    Returns the JSON text of the operations from revision ``since`` to ``revision``,
+    or None when either snapshot expired.
+    """
+    old_key, new_key = get_snapshot_key(display_id, since), get_snapshot_key(display_id, revision)
+    snapshots = await cache.aget_many([old_key, new_key])
+    if old_key not in snapshots or new_key not in snapshots:
+        return None
+    return json.dumps(make_patch(json.loads(snapshots[old_key]), json.loads(snapshots[new_key])))
+
+
+def build_message(action, payload, revision=None):
+    """
+    Wraps a rendered payload into a websocket message without decoding it again.
+    """
+    if revision is None:
+        return f'{{"action": {json.dumps(action)}, "message": {payload}}}'
+    return f'{{"action": {json.dumps(action)}, "revision": {revision}, "message": {payload}}}'
+
+
+def build_patch_message(revision, base, patch):
+    return f'{{"action": "display_patch", "revision": {revision}, "base": {base}, "patch": {patch}}}'
@@ -1,4 +1,5 @@
 from django.conf import settings
+from django.urls import reverse
 from rest_framework import serializers
 
 from main.models import Display, Ticker, TickerItem
@@ -26,7 +27,14 @@ class DisplaySerializer(serializers.ModelSerializer):
         model = Display
         fields = [
             "is_active", "updated_at", "name", "slug", "current_video", "video_duration",
-            "loop", "paused", "tickers"]
+            "loop", "paused", "playback_mode", "tickers"]
 
     def get_current_video(self, obj):
+        if obj.is_hls and obj.has_hls_playlist:
+            return f"{settings.SERVER_DOMAIN}{reverse('main:display_live_playlist_view', args=[obj.stream_key])}"
+        if obj.media_asset and obj.media_asset.abr_renditions:
+            return f"{obj.media_asset.get_abr_url()}master.m3u8"
+        if not obj.current_video:
+            # Playlist-only displays have no single video; they play the RTMP playout.
+            return None
         return f"{settings.SERVER_DOMAIN}{obj.current_video.url}"
@@ -1,3 +1,295 @@
-from django.test import TestCase
+import asyncio
+import copy
+import json
+import zlib
+from unittest import mock
 
-# Create your tests here.
+import msgpack
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase
+
+from main.models import Display, MediaAsset, Place, PlaylistItem, Ticker, TickerItem
+
+from .consumers import DisplayConsumer
+from .encoding import (
+    JSON,
+    JSON_ZLIB,
+    MAX_FRAME_SIZE,
+    MSGPACK,
+    MSGPACK_ZLIB,
+    FrameTooLarge,
+    decode,
+    encode,
+    negotiate,
+)
+from .gateway import SingleFlight, TokenBucket, get_stream_key
+from .patch import make_patch
+from .payloads import bump_payload_version, get_display_payload, get_version_key, render_payload
+
+
+def apply_patch(document, operations):
+    """
+    Applies ``add``/``remove``/``replace`` operations the way an RFC 6902 client does.
+    """
+    document = copy.deepcopy(document)
+    for operation in operations:
+        tokens = [token.replace('~1', '/').replace('~0', '~') for token in operation["path"].split('/')[1:]]
+        if not tokens:
+            document = copy.deepcopy(operation["value"])
+            continue
+
+        parent = document
+        for token in tokens[:-1]:
+            parent = parent[int(token)] if isinstance(parent, list) else parent[token]
+        last = tokens[-1]
+
+        if isinstance(parent, list):
+            index = int(last)
+            if operation["op"] == "add":
+                parent.insert(index, copy.deepcopy(operation["value"]))
+            elif operation["op"] == "remove":
+                del parent[index]
+            else:
+                parent[index] = copy.deepcopy(operation["value"])
+        elif operation["op"] == "remove":
+            del parent[last]
+        else:
+            parent[last] = copy.deepcopy(operation["value"])
+    return document
+
+
+class MakePatchTests(SimpleTestCase):
+    def assertPatches(self, old, new):
+        operations = make_patch(old, new)
+        self.assertEqual(apply_patch(old, operations), new)
+        return operations
+
+    def test_identical_documents(self):
+        self.assertEqual(make_patch({"a": [1, {"b": 2}]}, {"a": [1, {"b": 2}]}), [])
+
+    def test_dict_changes(self):
+        operations = self.assertPatches({"a": 1, "b": 2, "c/d": 3}, {"a": 1, "b": 5, "e": 6})
+        self.assertIn({"op": "replace", "path": "/b", "value": 5}, operations)
+        self.assertIn({"op": "remove", "path": "/c~1d"}, operations)
+        self.assertIn({"op": "add", "path": "/e", "value": 6}, operations)
+
+    def test_type_change_is_replaced(self):
+        self.assertEqual(make_patch({"a": 1}, {"a": True}), [{"op": "replace", "path": "/a", "value": True}])
+
+    def test_plain_lists_by_index(self):
+        self.assertPatches({"a": [1, 2, 3]}, {"a": [1, 4]})
+        self.assertPatches({"a": [1]}, {"a": [1, 2, 3]})
+
+    def test_prepended_ticker_is_one_add(self):
+        old = {"tickers": [{"id": 2, "text": "b"}, {"id": 1, "text": "a"}]}
+        new = {"tickers": [{"id": 3, "text": "c"}, {"id": 2, "text": "b"}, {"id": 1, "text": "a"}]}
+        operations = self.assertPatches(old, new)
+        self.assertEqual(operations, [{"op": "add", "path": "/tickers/0", "value": {"id": 3, "text": "c"}}])
+
+    def test_lists_by_id(self):
+        old = {"tickers": [{"id": i, "items": [{"id": i * 10, "text": "x"}]} for i in range(1, 6)]}
+        new = {"tickers": [
+            {"id": 4, "items": [{"id": 40, "text": "y"}]},
+            {"id": 7, "items": []},
+            {"id": 1, "items": [{"id": 10, "text": "x"}, {"id": 11, "text": "z"}]},
+            {"id": 3, "items": [{"id": 30, "text": "x"}]},
+        ]}
+        self.assertPatches(old, new)
+        self.assertPatches(new, old)
+
+    def test_duplicate_ids_fall_back_to_index(self):
+        self.assertPatches([{"id": 1, "a": 1}, {"id": 1, "a": 2}], [{"id": 1, "a": 3}])
+
+
+class SingleFlightTests(SimpleTestCase):
+    def test_concurrent_calls_share_one_call(self):
+        calls = []
+
+        async def fetch(value):
+            calls.append(value)
+            await asyncio.sleep(0.01)
+            return value * 2
+
+        async def run():
+            single_flight = SingleFlight()
+            results = await asyncio.gather(*(single_flight.do("key", fetch, 2) for _ in range(5)))
+            return results, single_flight
+
+        results, single_flight = asyncio.run(run())
+        self.assertEqual(results, [4] * 5)
+        self.assertEqual(calls, [2])
+        self.assertEqual(single_flight._calls, {})
+
+    def test_cancelled_leader_does_not_cancel_waiters(self):
+        async def fetch():
+            await asyncio.sleep(0.05)
+            return "display"
+
+        async def run():
+            single_flight = SingleFlight()
+            leader = asyncio.create_task(single_flight.do("key", fetch))
+            await asyncio.sleep(0)
+            waiter = asyncio.create_task(single_flight.do("key", fetch))
+            await asyncio.sleep(0.01)
+            leader.cancel()
+            return await waiter, leader.cancelled()
+
+        self.assertEqual(asyncio.run(run()), ("display", True))
+
+    def test_errors_reach_every_caller(self):
+        async def fetch():
+            await asyncio.sleep(0.01)
+            raise ValueError("lookup failed")
+
+        async def run():
+            single_flight = SingleFlight()
+            return await asyncio.gather(
+                single_flight.do("key", fetch), single_flight.do("key", fetch), return_exceptions=True
+            )
+
+        results = asyncio.run(run())
+        self.assertTrue(all(isinstance(result, ValueError) for result in results))
+
+
+class TokenBucketTests(SimpleTestCase):
+    def test_burst_then_rate(self):
+        with mock.patch("websocket.gateway.time.monotonic", return_value=0):
+            bucket = TokenBucket(rate=2, burst=3)
+            self.assertEqual([bucket.consume() for _ in range(4)], [True, True, True, False])
+
+        with mock.patch("websocket.gateway.time.monotonic", return_value=0.5):
+            self.assertEqual([bucket.consume() for _ in range(2)], [True, False])
+
+    def test_refill_is_capped_at_burst(self):
+        with mock.patch("websocket.gateway.time.monotonic", return_value=0):
+            bucket = TokenBucket(rate=100, burst=2)
+            bucket.consume()
+        with mock.patch("websocket.gateway.time.monotonic", return_value=60):
+            self.assertEqual([bucket.consume() for _ in range(3)], [True, True, False])
+
+
+class GetStreamKeyTests(SimpleTestCase):
+    KEY = "0b8e3c5e-1f0e-4c4b-9a43-3c8f5e3a2d11"
+
+    def test_key_parameter(self):
+        self.assertEqual(get_stream_key(f"key={self.KEY.upper()}&v=2".encode()), self.KEY)
+
+    def test_first_parameter_for_older_clients(self):
+        self.assertEqual(get_stream_key(f"stream={self.KEY}".encode()), self.KEY)
+
+    def test_invalid(self):
+        self.assertIsNone(get_stream_key(b""))
+        self.assertIsNone(get_stream_key(b"key=not-a-uuid"))
+
+
+class EncodingTests(SimpleTestCase):
+    MESSAGE = {"action": "ping", "version": "1.2.0"}
+
+    def test_negotiate(self):
+        self.assertEqual(negotiate(["graphql-ws", MSGPACK, JSON_ZLIB]), MSGPACK)
+        self.assertIsNone(negotiate(["graphql-ws"]))
+        self.assertIsNone(negotiate([]))
+
+    def test_round_trip(self):
+        text = json.dumps(self.MESSAGE)
+        self.assertEqual(decode(text_data=encode(text, JSON)), self.MESSAGE)
+        for format in (JSON_ZLIB, MSGPACK, MSGPACK_ZLIB):
+            self.assertEqual(decode(bytes_data=encode(text, format), format=format), self.MESSAGE)
+
+    def test_oversized_frame(self):
+        with self.assertRaises(FrameTooLarge):
+            decode(text_data=" " * (MAX_FRAME_SIZE + 1))
+        with self.assertRaises(FrameTooLarge):
+            decode(bytes_data=b"\0" * (MAX_FRAME_SIZE + 1), format=MSGPACK)
+
+    def test_decompression_bomb(self):
+        bomb = zlib.compress(msgpack.packb({"action": "ping", "padding": "x" * (MAX_FRAME_SIZE * 20)}))
+        self.assertLess(len(bomb), MAX_FRAME_SIZE)
+        with self.assertRaises(FrameTooLarge):
+            decode(bytes_data=bomb, format=MSGPACK_ZLIB)
+
+
+class DisplayUpdateForwardingTests(SimpleTestCase):
+    EVENT = {"type": "display.update", "revision": 5, "base": 4, "frame": b"full", "patch": b"patch"}
+
+    def forward(self, event, revision=4, patches=False):
+        consumer = DisplayConsumer()
+        consumer.revision = revision
+        consumer.patches = patches
+        sent = []
+
+        async def send_frame(frame):
+            sent.append(frame)
+
+        consumer.send_frame = send_frame
+        asyncio.run(consumer.display_update(event))
+        return sent, consumer.revision
+
+    def test_default_clients_get_the_full_frame(self):
+        self.assertEqual(self.forward(self.EVENT), ([b"full"], 5))
+
+    def test_patch_clients_get_the_patch_on_their_base(self):
+        self.assertEqual(self.forward(self.EVENT, patches=True), ([b"patch"], 5))
+        self.assertEqual(self.forward(self.EVENT, revision=3, patches=True), ([b"full"], 5))
+        self.assertEqual(self.forward({**self.EVENT, "patch": None}, patches=True), ([b"full"], 5))
+
+    def test_old_revisions_are_skipped(self):
+        self.assertEqual(self.forward(self.EVENT, revision=5), ([], 5))
+
+
+class RenderPayloadTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        place = Place.objects.create(name="Lobby")
+        cls.display = Display.objects.create(place=place, name="Screen", current_video="streams/videos/a.mp4")
+
+    def add_tickers(self, tickers, items):
+        for _ in range(tickers):
+            ticker = Ticker.objects.create(display=self.display)
+            TickerItem.objects.bulk_create(
+                [TickerItem(ticker=ticker, content=f"<p>{order}</p>", order=order) for order in range(items)]
+            )
+
+    def test_query_count_does_not_grow_with_tickers(self):
+        self.add_tickers(3, 4)
+        # Display with its asset, tickers, ticker items and the next ticker boundary.
+        with self.assertNumQueries(4):
+            payload, _ = render_payload(self.display.id)
+        self.assertEqual([len(ticker["items"]) for ticker in json.loads(payload)["tickers"]], [4, 4, 4])
+
+        self.add_tickers(5, 10)
+        with self.assertNumQueries(4):
+            render_payload(self.display.id)
+
+    def test_playlist_only_display(self):
+        display = Display.objects.create(place=self.display.place, name="Playlist screen")
+        asset = MediaAsset.objects.create(sha256="a" * 64, file="streams/videos/aa/a.mp4")
+        PlaylistItem.objects.create(display=display, media_asset=asset)
+
+        payload, _ = render_payload(display.id)
+        self.assertIsNone(json.loads(payload)["current_video"])
+
+
+class DisplayPayloadCacheTests(TestCase):
+    def setUp(self):
+        self.display = Display.objects.create(place=Place.objects.create(name="Lobby"), name="Screen")
+        # Ids repeat between test runs, so drop a version left in the shared cache.
+        cache.delete(get_version_key(self.display.id))
+        self.addCleanup(cache.delete, get_version_key(self.display.id))
+
+    def test_cached_payload_is_served_without_queries(self):
+        payload = get_display_payload(self.display.id)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_display_payload(self.display.id), payload)
+
+    def test_bumped_version_renders_a_fresh_payload(self):
+        get_display_payload(self.display.id)
+        version = cache.get(get_version_key(self.display.id))
+        # A bulk update fires no signals, so the cached payload is still served...
+        Display.objects.filter(id=self.display.id).update(name="Renamed")
+        self.assertEqual(json.loads(get_display_payload(self.display.id))["name"], "Screen")
+
+        # ...until the version is bumped.
+        bump_payload_version(self.display.id)
+        self.assertNotEqual(cache.get(get_version_key(self.display.id)), version)
+        self.assertEqual(json.loads(get_display_payload(self.display.id))["name"], "Renamed")